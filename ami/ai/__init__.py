@@ -1,5 +1,5 @@
 """ __init.py """
 
-from .attention import Attention
+from .attention import Attention, Priority
 from .brain import Brain
 from .ai import AI
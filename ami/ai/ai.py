@@ -12,6 +12,9 @@ from multiprocessing import Pipe, Event as MultiprocessEvent
 from pydantic import ValidationError
 
 from ami.base import Base
+from ami.ai.attention import Priority
+from ami.ai.resilience import LLMTimeout
+from ami.ai.router import fit_router_cache
 from ami.config import Config
 from ami.headspace.blueprint import Payload
 from ami.flask.manager import FlaskManager, create_flask_app
@@ -74,6 +77,8 @@ class AI(Base):
         stop_event: multiprocesses.Event to signal stopping of the AI system.
         _core_modules (MultiprocessEvent): List of core module names or loaded module objects.
         attn (Attention): Attention management component, basically an async event loop.
+        interaction_timeout (float | None): Seconds a query may run in the Attention before it is cancelled.
+        interactive_deadline (float | None): Seconds a voice turn may wait in the Attention queue.
         temp_comms (TemporalCommunications): Observer pattern Event Bus.
         ears (Ears): Audio input component.
         gui (GUI): Tkinter Graphical user interface component.
@@ -107,7 +112,15 @@ class AI(Base):
         from ami.ears import Ears
         from ami.gui import GUI
 
-        self.attn = Attention(ignore_coroname_logging=["process_whisperer"])
+        attention = Config().attention
+        self.attn = Attention(ignore_coroname_logging=["process_whisperer"],
+                              max_concurrency=attention["max_concurrency"],
+                              task_timeout=attention["task_timeout"],
+                              shutdown_timeout=attention["shutdown_timeout"],
+                              max_workers=attention["max_workers"],
+                              process_workers=attention["process_workers"])
+        self.interaction_timeout: Optional[float] = attention["interaction_timeout"]
+        self.interactive_deadline: Optional[float] = attention["interactive_deadline"]
 
         self.temp_comms = TemporalCommunications()
         self.ears = Ears(temp_comms=self.temp_comms)
@@ -115,6 +128,7 @@ class AI(Base):
         self.gui = GUI(temp_comms=self.temp_comms)
         self.flask_manager = FlaskManager(self.stop_event)
         self.brain = Brain(temp_comms=self.temp_comms, headspaces=self.get_modules_part("headspace"))
+        self.wakeword_headspace: Optional[str] = None
 
         self.establish_temporal_communications()
 
@@ -207,7 +221,8 @@ class AI(Base):
 
         self.ears.start_listening()
         self.attn.start()
-        self.attn.schedule(self.process_whisperer())
+        self.attn.schedule(self.process_whisperer(), priority=Priority.BACKGROUND)
+        self.attn.schedule(self.warm_up(), priority=Priority.BACKGROUND)
 
 #       self.gui.run(builtins=self.get_builtin_guis(), modules=self.get_modules_part("gui"))
         self.gui.run(self.get_modules_part("gui"))  # The GUI must run in the main thread
@@ -221,23 +236,31 @@ class AI(Base):
         self.ears.stop()
         self.gui.stop()
         self.attn.stop()
+        self.brain.close()
 
     def establish_temporal_communications(self):
         """ Core temporal communication pipelines """
+        self.temp_comms.subscribe("ears.wakeword_route", self.route_wakeword)
         self.temp_comms.subscribe("ears.hotword_detected", self.start_chat)
         self.temp_comms.subscribe("ears.recorder_callback", self.human_to_ai)
+        self.temp_comms.subscribe("ears.partial_transcript", self.gui.popup.set_partial_message)
         self.temp_comms.subscribe("ears.timeout", self.gui.popup.close)
         self.temp_comms.subscribe("gui.popup.loading_message", self.gui.popup.set_loading_message)
         self.temp_comms.subscribe("gui.interaction_finished", self.ears.start_listening)
         self.temp_comms.subscribe("attn.schedule", self.attn.schedule)
 
+    def route_wakeword(self, headspace: Optional[str]=None):
+        """ Remember the Headspace of the wake word that started the interaction, None to use the router """
+        self.wakeword_headspace = headspace
+
     def start_chat(self):
         """ Initiate the chat in the GUI """
         async def _start_chat():
 
             self.gui.create_popup()
 
-        self.attn.schedule(_start_chat())
+        self.attn.cancel("human_to_ai")         # A query still running would answer into the new popup
+        self.attn.schedule(_start_chat(), priority=Priority.INTERACTIVE)     # Never dropped, the query answers into it
 
     def human_to_ai(self, message):
         """ Handle the what the GUI should show, query the brain with the message """
@@ -248,15 +271,45 @@ class AI(Base):
         async def _human_to_ai(message):
             """ async function that does all the work """
             self.gui.popup.set_human_message(message)
-            dialog = self.brain.query(message, load_msg_callback=self.gui.popup.set_loading_message)
+            dialog = await self.attn.run_blocking(self.brain.query,
+                                                  message,
+                                                  load_msg_callback=self.gui.popup.set_loading_message,
+                                                  headspace=self.wakeword_headspace)
 #           self.q = dialog
             self.gui.popup.set_ai_response(dialog)
 
-        self.attn.schedule(_human_to_ai(message))
+        self.attn.schedule(_human_to_ai(message),
+                           name="human_to_ai",
+                           timeout=self.interaction_timeout,
+                           priority=Priority.INTERACTIVE,
+                           deadline=self.interactive_deadline,
+                           on_failure=lambda error: self.interaction_failed(message, error))
+
+    def interaction_failed(self, message: str, error: BaseException):
+        """ Answer a query that failed or timed out with the canned response, so the popup closes and the Ears listen again """
+        if isinstance(error, asyncio.TimeoutError):
+            error = LLMTimeout(f"The query took longer than {self.interaction_timeout}s")
+        self.gui.popup.set_ai_response(self.brain.fallback_dialog(message, "Brain", error))
+
+    async def warm_up(self):
+        """
+        Fit the embedding router off the event loop before the first query needs it, in a process when
+        configured. A query routed meanwhile waits for this fit instead of fitting the router again.
+        """
+        router = self.brain.router
+        if router is None or router.fitted:
+            return
+
+        fit_cache = None
+        if self.attn.process_workers > 0:
+            def fit_cache(cache_file, routes):
+                self.attn.executor(process=True).submit(fit_router_cache, cache_file, routes).result()
+        await self.attn.run_blocking(router.fit, self.brain.routes, fit_cache=fit_cache)
 
     def handle_payload(self, payload: Payload):
         """ Accept a Payload object, do it's bidding """
         if payload.module.lower() in [ cm.__name__.split('.')[-1] for cm in self.core_modules ]:
+            self.brain.invalidate_cache(payload.module)     # The Headspace data changed outside of a query
             if payload.reload:
                 self.gui.reload_child(payload.module)
 
@@ -290,4 +343,4 @@ class AI(Base):
         else:
             await asyncio.sleep(1)
 
-        self.attn.schedule(self.process_whisperer())
+        self.attn.schedule(self.process_whisperer(), priority=Priority.BACKGROUND)
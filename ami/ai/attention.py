@@ -1,21 +1,71 @@
 """ AI Attention mechinism. Threaded Async event loop with logging and safe shutdown features. """
 import asyncio
-from threading import Thread
-from typing import Coroutine, Any
+import contextvars
+import time
+from collections import Counter
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from enum import IntEnum
+from functools import partial
+from itertools import count
+from threading import Lock, Thread
+from typing import Any, Callable, Coroutine, Dict, List, Optional
 
 from gunicorn.app.base import traceback
 
+from ami.ai.resilience import LatencyHistogram
 from ami.base import Base
 
+class Priority(IntEnum):
+    """ Lanes of the Attention queue, the lower lane is always started first """
+    INTERACTIVE = 0         # The voice turn the human is waiting on
+    GUI = 1                 # Popups and reloads
+    BACKGROUND = 2          # IPC polling, syncs and maintenance
+
+WAIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+@dataclass
+class QueuedTask:
+    """ A scheduled coroutine waiting in the Attention queue """
+    name: str
+    coro: Coroutine[Any, Any, Any]
+    priority: Priority
+    timeout: Optional[float] = None
+    deadline: Optional[float] = None        # time.monotonic() after which it is dropped unstarted
+    on_failure: Optional[Callable[[BaseException], Any]] = None
+    queued: float = field(default_factory=time.monotonic)
+    cancelled: bool = False
+
+    @property
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() > self.deadline
+
 class Attention(Base):
     """
-    Manages an asynchronous task queue in a thread.
+    Manages an asynchronous priority task queue in a thread.
 
     This class allows scheduling of coroutines to be run asynchronously
     in a dedicated thread, providing a way to handle background tasks.
+    Each coroutine is queued in a Priority lane, a free slot always goes to the most urgent
+    lane first, and a coroutine still queued after its deadline is dropped. `metrics` reports
+    the depth and waiting times of every lane.
+    The worker runs up to `max_concurrency` scheduled coroutines at once as named tasks, each
+    with an optional timeout, so a long interaction doesn't hold up the IPC handling or the
+    popup. A task's `on_failure` callback is told when it raised, timed out or was dropped, so
+    whoever waits on its result still gets an answer. Tasks can be cancelled by name, queued or
+    running, and stopping cancels whatever is still running.
+    Blocking work (LLM calls, file and network IO) is awaited with `run_blocking`, which runs it
+    on a bounded thread pool, or a process pool for CPU-heavy work, so the loop stays responsive.
     """
 
-    def __init__(self, worker_timeout: float=1.0, ignore_coroname_logging: list=[]):
+    def __init__(self,
+                 worker_timeout: float=1.0,
+                 ignore_coroname_logging: list=[],
+                 max_concurrency: int=4,
+                 task_timeout: Optional[float]=None,
+                 shutdown_timeout: float=5.0,
+                 max_workers: int=4,
+                 process_workers: int=0):
         """
         Initialize an instance of Attention.
 
@@ -24,37 +74,236 @@ class Attention(Base):
                 Defaults to 1.0.
             ignore_coroname_logging (list, optional): List of coro names to ignore logging for.
                 Defaults to an empty list.
+            max_concurrency (int, optional): Scheduled coroutines running at once. Defaults to 4.
+            task_timeout (float, optional): Default seconds a task may run before it is cancelled,
+                None for no limit. Defaults to None.
+            shutdown_timeout (float, optional): Seconds `stop` waits for running tasks before
+                cancelling them. Defaults to 5.0.
+            max_workers (int, optional): Threads of `run_blocking`. Defaults to 4.
+            process_workers (int, optional): Processes of `run_blocking(process=True)`, 0 runs
+                that work on the threads too. Defaults to 0.
 
         Attributes:
             ignore_coroname_scheduling (list): A list of coro names to ignore logging for.
-            queue (asyncio.Queue): An asynchronous queue for storing tasks.
+            queue (asyncio.PriorityQueue): An asynchronous queue of (priority, order, QueuedTask).
             loop (asyncio.AbstractEventLoop): The event loop used for asynchronous operations.
             thread (Thread or None): Internal thread responsible for executing tasks from the queue.
             worker_timeout (float): The timeout value in seconds for the worker thread.
             shutdown_event (asyncio.Event): An event used to signal the worker thread to shut down.
+            tasks (Dict[str, asyncio.Task]): The running tasks by name.
+            waiting (List[QueuedTask]): The tasks still in the queue.
         """
         super().__init__()
         self.ignore_coroname_scheduling = ignore_coroname_logging
-        self.queue: asyncio.Queue = asyncio.Queue()
+        self.queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
         self.loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
         self.thread: Thread | None = None
         self.worker_timeout: float = worker_timeout
         self.shutdown_event: asyncio.Event = asyncio.Event()
 
+        self.max_concurrency = max_concurrency
+        self.task_timeout = task_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.slots: asyncio.Semaphore = asyncio.Semaphore(max_concurrency)
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.waiting: List[QueuedTask] = []
+        self._numbers: Dict[str, int] = {}
+        self._lock = Lock()
+
+        self.max_workers = max_workers
+        self.process_workers = process_workers
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+        self._order = count()                               # FIFO within a lane
+        self.depth: Counter = Counter()                     # Queued tasks per lane
+        self.max_depth: Counter = Counter()
+        self.started: Counter = Counter()
+        self.dropped: Counter = Counter()
+        self.waits: Dict[Priority, LatencyHistogram] = { lane: LatencyHistogram(WAIT_BUCKETS) for lane in Priority }
+
+    def executor(self, process: bool=False) -> Executor:
+        """ The thread pool, or the process pool when asked for and configured, created on first use """
+        with self._lock:
+            if process and self.process_workers > 0:
+                if self._processes is None:
+                    self._processes = ProcessPoolExecutor(max_workers=self.process_workers)
+                return self._processes
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="attention")
+            return self._threads
+
+    async def run_blocking(self, func: Callable[..., Any], *args: Any, process: bool=False, **kwargs: Any) -> Any:
+        """
+        Await a blocking call without blocking the event loop.
+
+        The call runs on the bounded thread pool with the caller's context variables, or on the
+        process pool with `process=True` (the function and its arguments must be picklable).
+        Cancelling the awaiting task abandons the call, it still runs to its end in the pool.
+
+        :param func: The blocking function.
+        :param process: Run CPU-heavy work in a separate process.
+        :return: The result of the call.
+        """
+        loop = asyncio.get_running_loop()
+        call = partial(func, *args, **kwargs)
+        executor = self.executor(process)
+        if isinstance(executor, ProcessPoolExecutor):
+            return await loop.run_in_executor(executor, call)
+        return await loop.run_in_executor(executor, contextvars.copy_context().run, call)
+
+    @property
+    def running(self) -> List[str]:
+        """ The names of the running tasks """
+        with self._lock:
+            return list(self.tasks)
+
     async def worker(self) -> None:
-        """Main worker coroutine that processes tasks from the queue."""
+        """Main worker coroutine that takes a free slot, then starts the most urgent task of the queue."""
         while not self.shutdown_event.is_set():
+            if not await self._acquire_slot():
+                break
             try:
-                coro = await asyncio.wait_for(self.queue.get(), timeout=self.worker_timeout)
-                await coro
-                self.queue.task_done()
+                _, _, queued = await asyncio.wait_for(self.queue.get(), timeout=self.worker_timeout)
             except asyncio.TimeoutError:
+                self.slots.release()
                 continue
             except asyncio.CancelledError:
+                self.slots.release()
                 break
-            except Exception as e:
-                error_msg = f"Error in worker: {str(e)}\n\nTraceback:\n{traceback.format_exc()}"
-                self.logs.critical(f"Error in worker: {error_msg}")
+
+            self.queue.task_done()
+            if not self._take(queued):
+                self.slots.release()
+                continue
+            with self._lock:
+                name = self._unique(queued.name)
+                task = self.loop.create_task(self._run(name, queued.coro, queued.timeout, queued.on_failure), name=name)
+                self.tasks[name] = task
+            task.add_done_callback(self._done)
+
+        await self._shutdown()
+
+    def _take(self, queued: QueuedTask) -> bool:
+        """ Account for a task leaving the queue, False when it was cancelled or its deadline passed and it was dropped """
+        with self._lock:
+            self.depth[queued.priority] -= 1
+            self.waiting = [ waiting for waiting in self.waiting if waiting is not queued ]
+        if queued.cancelled:
+            queued.coro.close()
+            self.logs.info(f"Attention task `{queued.name}` cancelled before it started.")
+            return False
+        if queued.expired:
+            queued.coro.close()
+            self.dropped[queued.priority] += 1
+            self.logs.warn(f"Dropped the {queued.priority.name} task `{queued.name}`, its deadline passed in the queue.")
+            self._failed(queued.name, queued.on_failure, asyncio.TimeoutError(f"`{queued.name}` waited past its deadline"))
+            return False
+        wait = time.monotonic() - queued.queued
+        self.waits[queued.priority].observe(wait)
+        self.started[queued.priority] += 1
+        if queued.priority == Priority.INTERACTIVE and wait > 0.5:
+            self.logs.warn(f"The interactive task `{queued.name}` waited {wait:.2f}s in the queue, {self.metrics}")
+        return True
+
+    async def _enqueue(self, queued: QueuedTask) -> None:
+        with self._lock:
+            self.depth[queued.priority] += 1
+            self.max_depth[queued.priority] = max(self.max_depth[queued.priority], self.depth[queued.priority])
+        await self.queue.put((queued.priority, next(self._order), queued))
+
+    @property
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """ Per lane the queued and most ever queued tasks, the started and dropped ones, and their waits in seconds """
+        with self._lock:
+            depth, max_depth = dict(self.depth), dict(self.max_depth)
+        metrics = {}
+        for lane in Priority:
+            waits = self.waits[lane]
+            metrics[lane.name.lower()] = {
+                "depth": depth.get(lane, 0),
+                "max_depth": max_depth.get(lane, 0),
+                "started": self.started[lane],
+                "dropped": self.dropped[lane],
+                "mean_wait": round(waits.total / waits.count, 4) if waits.count else 0.0,
+                "p95_wait": waits.percentile(0.95),
+            }
+        return metrics
+
+    async def _acquire_slot(self) -> bool:
+        """ Wait for one of the `max_concurrency` slots, False once shutting down """
+        while not self.shutdown_event.is_set():
+            try:
+                await asyncio.wait_for(self.slots.acquire(), timeout=self.worker_timeout)
+                return True
+            except asyncio.TimeoutError:
+                continue
+        return False
+
+    def _unique(self, name: str) -> str:
+        """ The task name, numbered while a task of the same name is running """
+        if name not in self.tasks:
+            return name
+        self._numbers[name] = self._numbers.get(name, 1) + 1
+        return f"{name}-{self._numbers[name]}"
+
+    async def _run(self,
+                   name: str,
+                   coro: Coroutine[Any, Any, Any],
+                   timeout: Optional[float],
+                   on_failure: Optional[Callable[[BaseException], Any]]=None) -> Any:
+        """ Run a scheduled coroutine, logging its failure, timeout or cancellation """
+        try:
+            if timeout is None:
+                return await coro
+            return await asyncio.wait_for(coro, timeout=timeout)
+        except asyncio.TimeoutError as e:
+            self.logs.error(f"Attention task `{name}` timed out after {timeout}s and was cancelled.")
+            self._failed(name, on_failure, e)
+        except asyncio.CancelledError:
+            self.logs.info(f"Attention task `{name}` cancelled.")
+            raise
+        except Exception as e:
+            error_msg = f"Error in worker: {str(e)}\n\nTraceback:\n{traceback.format_exc()}"
+            self.logs.critical(f"Error in task `{name}`: {error_msg}")
+            self._failed(name, on_failure, e)
+
+    def _failed(self, name: str, on_failure: Optional[Callable[[BaseException], Any]], error: BaseException) -> None:
+        """ Tell the task's `on_failure` callback why it didn't finish """
+        if on_failure is None:
+            return
+        try:
+            on_failure(error)
+        except Exception as e:
+            self.logs.error(f"The failure callback of `{name}` failed: {e}")
+
+    def _done(self, task: asyncio.Task) -> None:
+        """ Forget a finished task and free its slot """
+        with self._lock:
+            if self.tasks.get(task.get_name()) is task:
+                del self.tasks[task.get_name()]
+        self.slots.release()
+
+    async def _shutdown(self) -> None:
+        """ Drop the queued coroutines, give the running tasks `shutdown_timeout` seconds, then cancel them """
+        while not self.queue.empty():
+            _, _, queued = self.queue.get_nowait()
+            with self._lock:
+                self.depth[queued.priority] -= 1
+            queued.coro.close()
+        with self._lock:
+            self.waiting.clear()
+        self.logs.info(f"Attention queue metrics: {self.metrics}")
+
+        with self._lock:
+            running = list(self.tasks.values())
+        if not running:
+            return
+        self.logs.info(f"Waiting on {len(running)} Attention tasks: {[ task.get_name() for task in running ]}")
+        _, pending = await asyncio.wait(running, timeout=self.shutdown_timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
 
     def start(self) -> None:
         """Start the attention thread if it's not already running."""
@@ -66,7 +315,7 @@ class Attention(Base):
         self.logs.info("Attention Thread started.")
 
     def stop(self) -> None:
-        """Stop the attention thread and wait for it to finish."""
+        """Stop the attention thread, cancelling the tasks still running after `shutdown_timeout`, and wait for it to finish."""
         if not self.thread:
             return
         self.logs.info("Stopping Attention Thread...")
@@ -91,18 +340,63 @@ class Attention(Base):
             task.cancel()
         self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
         self.loop.close()
+        with self._lock:
+            executors, self._threads, self._processes = [self._threads, self._processes], None, None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
         self.logs.info("Attention event loop closed.")
 
-    def schedule(self, coro: Coroutine[Any, Any, Any]) -> None:
+    def schedule(self,
+                 coro: Coroutine[Any, Any, Any],
+                 name: Optional[str]=None,
+                 timeout: Optional[float]=None,
+                 priority: Priority=Priority.GUI,
+                 deadline: Optional[float]=None,
+                 on_failure: Optional[Callable[[BaseException], Any]]=None) -> Optional[str]:
         """
         Schedule a coroutine to be run by the worker.
 
         :param coro: The coroutine to be scheduled.
+        :param name: The task name, defaults to the coroutine's name.
+        :param timeout: Seconds the task may run, defaults to `task_timeout`.
+        :param priority: The lane of the task, defaults to Priority.GUI.
+        :param deadline: Seconds the task may wait in the queue before it is dropped, None to wait for ever.
+        :param on_failure: Called on the event loop with the error when the task raised, timed out or was dropped.
+        :return: The name of the task, None when Attention is shutting down.
         """
         if self.shutdown_event.is_set():
             self.logs.warn(f"Attention is in a shutdown state. Cannot schedule `{coro.__name__}`. Cancelling coroutine.")
             coro.close()
-        else:
-            if coro.__name__ not in self.ignore_coroname_scheduling:
-                self.logs.info(f"Attention.scheduled job: {coro}")
-            asyncio.run_coroutine_threadsafe(self.queue.put(coro), self.loop)
+            return None
+
+        if coro.__name__ not in self.ignore_coroname_scheduling:
+            self.logs.info(f"Attention.scheduled job: {coro}")
+        queued = QueuedTask(name=name or coro.__name__,
+                            coro=coro,
+                            priority=Priority(priority),
+                            timeout=self.task_timeout if timeout is None else timeout,
+                            deadline=None if deadline is None else time.monotonic() + deadline,
+                            on_failure=on_failure)
+        with self._lock:
+            self.waiting.append(queued)
+        asyncio.run_coroutine_threadsafe(self._enqueue(queued), self.loop)
+        return queued.name
+
+    def cancel(self, name: str) -> bool:
+        """
+        Cancel the running tasks of a name, including the numbered ones, e.g. "_human_to_ai-2",
+        and drop the queued tasks of that name before they start.
+
+        :param name: The task name, or the name it was scheduled with.
+        :return: Whether any task was cancelled.
+        """
+        with self._lock:
+            tasks = [ task for task_name, task in self.tasks.items()
+                      if task_name == name or (task_name.startswith(f"{name}-") and task_name[len(name) + 1:].isdigit()) ]
+            queued = [ queued for queued in self.waiting if queued.name == name ]
+            for waiting in queued:
+                waiting.cancelled = True
+        for task in tasks:
+            self.loop.call_soon_threadsafe(task.cancel)
+        return bool(tasks or queued)
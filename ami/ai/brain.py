@@ -1,23 +1,35 @@
 """ The Brain is the meat and potatoes of the AI. Access to LLMs should be managed here """
 import sys
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
 from importlib import import_module
 from importlib.util import spec_from_file_location, module_from_spec
 from pathlib import Path
 from types import ModuleType
-from typing import Any, Callable, List, Literal, Optional
+from threading import Lock
+from typing import Any, Callable, Dict, Generator, List, Literal, Optional, Tuple
 from functools import cached_property
+from itertools import zip_longest
 
-from langchain_together import Together
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, PromptTemplate
 from pydantic import BaseModel
 
+from ami.ai.cache import ResponseCache
+from ami.ai.llm import LLMPool
+from ami.ai.resilience import LLMGuard, canned_response
+from ami.ai.router import EmbeddingRouter
+from ami.ai.speculation import SpeculationCancelled, SpeculationGate
+from ami.ai.usage import LLMUsage
 from ami.base import Base
 from ami.config import Config
-from ami.headspace import Dialog
+from ami.headspace import AgentThoughts, Dialog, ResponseStream, close_summarizer_pool
 from ami.headspace.core.calendar import prompts
+from ami.tokens import TRUNCATIONS, cap_tokens, count_tokens
 
-HEADSPACE_ROUTER = """You are an AI router designed to responde with the approprate Headspace
+# The router prompt starts with everything that is the same for every query, so the provider can cache it
+HEADSPACE_ROUTER_PREFIX = """You are an AI router designed to responde with the approprate Headspace
 to use to fulfill a user request. The HUMAN query will be passed to the approprate Headspace,
 so choose carefully. It is very important you only respond with one word.
 
@@ -30,10 +42,14 @@ Here is a list of your availalbe headspaces:
 
 Begin!
 
-HUMAN: {query}
+"""
+
+HEADSPACE_ROUTER_QUERY = """HUMAN: {query}
 AI:
 """
 
+HEADSPACE_ROUTER = HEADSPACE_ROUTER_PREFIX + HEADSPACE_ROUTER_QUERY
+
 HUMAN_WITH_MEMORY = """
 Memory:
 {memory}
@@ -47,6 +63,12 @@ Human:
 {prompt}
 """
 
+ROUTER_TEMPLATE = ChatPromptTemplate.from_template("{prefix}" + HEADSPACE_ROUTER_QUERY)
+HUMAN_WITH_MEMORY_TEMPLATE = PromptTemplate.from_template(HUMAN_WITH_MEMORY)
+HUMAN_WITHOUT_MEMORY_TEMPLATE = PromptTemplate.from_template(HUMAN_WITHOUT_MEMORY)
+
+ROUTER_QUERY_TOKENS = 64        # Reserved in the router budget for the query, besides its history
+
 def get_prompts_as_module(from_module: str) -> ModuleType:
     """ Get a prompt.py file as a module, given a module name """
     module = sys.modules[from_module]
@@ -139,10 +161,22 @@ class Brain(Base):
         config = Config()
         self.tk =  config["together_apikey"]
 #       self.ak =  config["anthropic_apikey"]
+        self.usage = LLMUsage(config.llm_usage_file, prices=config.llm_prices)
+        self.guard = LLMGuard(**config.llm_resilience)
+        self.llms = LLMPool(self.tk, roles=config.llm_roles, callbacks=[self.usage], guard=self.guard, timeout=self.guard.max_deadline)
+        self.budget = config.llm_budget
 
         if not config.modules_dir.is_dir():
             raise FileNotFoundError(f"Directory not found: {config.modules_dir}")
 
+        self.router = EmbeddingRouter(config.router_cache_file) if config.embedding_router else None
+        self.cache = ResponseCache(ttl=config.response_cache_ttl) if config.response_cache_ttl > 0 else None
+
+        self.speculative_agents = config.speculative_agents if self.router is not None else 0
+        self.speculation_timeout: Optional[float] = config.attention["interactive_deadline"]
+        self._speculation_pool: Optional[ThreadPoolExecutor] = None
+        self._headspace_locks: Dict[str, Lock] = {}
+
     def __contains__(self, value: str):
         """ Check if the value exsits in the cache as a headsapce """
         return value.upper() in self.classes
@@ -168,49 +202,109 @@ class Brain(Base):
         return self._headspace_cache[cache_name].get_instance(spawner=self.llm_spawner)
 
     @cached_property
-    def routing(self):
-        """ Return a list of example router interaction frim the modules. Cached. """
-        routes = []
+    def routes(self) -> Dict[str, List[str]]:
+        """ Return the ROUTING examples of every Headspace by name. Cached. """
+        routes = {}
         for hs, cache in self._headspace_cache.items():
             try:
-                hs_opt = [ f"HUMAN: {route}\nAI: {hs.upper()}" for route in cache.prompts.ROUTING ]
+                routes[hs.upper()] = list(cache.prompts.ROUTING)
             except AttributeError as e:
                 self.logs.error(f"Cannot load the routing for {hs}! Mising ROUTING in script: {e}")
-                hs_opt = []
-            routes.extend(hs_opt)
+                routes[hs.upper()] = []
         return routes
 
+    @cached_property
+    def routing(self):
+        """ Return a list of example router interaction frim the modules. Cached. """
+        return [ f"HUMAN: {route}\nAI: {hs}" for hs, examples in self.routes.items() for route in examples ]
+
+    @cached_property
+    def router_prefix(self) -> str:
+        """ The static start of the router prompt with the routing examples and the Headspaces. Cached. """
+        options = str(self.classes)
+        reserved = (count_tokens(HEADSPACE_ROUTER) + count_tokens(options)
+                    + (self.budget.get("history_tokens") or 0) + ROUTER_QUERY_TOKENS)
+        return HEADSPACE_ROUTER_PREFIX.format(examples=self.routing_examples(reserved), headspaces=options)
+
+    @cached_property
+    def router_chain(self):
+        """ The LLM router chain, takes the `prefix` and the `query`. Cached. """
+        return ROUTER_TEMPLATE | self.llm_spawner(role="router") | StrOutputParser()
+
     def clear_routing_cache(self):
-        """ Clear the roughting for Brain.routing """
-        if 'routing' in self.__dict__:
-            del self.__dict__['routing']
+        """ Clear the roughting for Brain.routing, the router prompt and the local router """
+        for cached in ('routes', 'routing', 'router_prefix', 'router_chain'):
+            if cached in self.__dict__:
+                del self.__dict__[cached]
+        if self.router is not None:
+            self.router.clear()
+        if self.cache is not None:
+            self.cache.clear()
 
     @property
     def classes(self):
         """ Return the available Headspace cached """
         return [ key.upper() for key in self._headspace_cache.keys() ]
 
-    def llm_spawner(self,
-                    model_name="mistralai/Mistral-7B-Instruct-v0.2",
-                    temperature=0,
-                    top_k=1,
-                    max_tokens=200):
-        """ Return an instance Language Model from LangChain """
-        model_name = "meta-llama/Llama-3-8b-chat-hf"
-        return Together(model=model_name,
-                        temperature=temperature,
-                        top_k=top_k,
-                        together_api_key=self.tk,
-                        max_tokens=max_tokens)
-
-    def mixtral_llm(self, max_tokens=256):
-        """ Return an instance Language Model from LangChain """
-        model = "mistralai/Mistral-7B-Instruct-v0.2"
-        return Together(model=model,
-                        temperature=0,
-                        top_k=1,
-                        max_tokens=max_tokens,
-                        together_api_key=self.tk)
+    def llm_spawner(self, role: str="agent", **params):
+        """
+        Return the pooled Language Model from LangChain configured for a role.
+
+        Args:
+            role (str, optional): "router", "agent", "summarizer" or "comprehend_date", see Config.llm_roles. Defaults to "agent".
+            **params: Override the configured parameters, e.g. max_tokens.
+        """
+        return self.llms.spawn(role, **params)
+
+    def close(self):
+        """ Log the LLM connection reuse, finish the memory summaries, close the pooled connections and drop pending speculations """
+        self.logs.info(f"LLM pool: {self.llms.stats}, reply paths: {dict(self.reply_paths)}")
+        close_summarizer_pool()
+        self.save_usage()
+        self.llms.close()
+        if self._speculation_pool is not None:
+            self._speculation_pool.shutdown(wait=False, cancel_futures=True)
+
+    def save_usage(self):
+        """ Save the LLM usage with the latency histograms and circuit states """
+        self.usage.save(resilience=self.guard.snapshot())
+
+    def fallback_dialog(self, prompt: str, headspace: str, error: BaseException) -> Dialog:
+        """ The canned Dialog answering a query that failed, e.g. when the LLM provider is down """
+        return Dialog(headspace=headspace, convo=[ ("Human", prompt), ("AI", canned_response(error)) ])
+
+    def guard_stream(self, dialog: Dialog):
+        """ Answer with the canned response when the streamed reply fails while the GUI consumes it """
+        speaker, response = dialog.convo[-1]
+        if not isinstance(response, Generator):
+            return
+
+        def guarded(stream):
+            try:
+                yield from stream
+            except Exception as e:
+                self.logs.error(f"The streamed response failed: {e}")
+                yield canned_response(e)
+        dialog.convo[-1] = (speaker, guarded(response))
+
+    def start_stream(self, dialog: Dialog):
+        """ Produce a streamed or deferred reply on a worker thread, so the GUI only drains it """
+        speaker, response = dialog.convo[-1]
+        if isinstance(response, (Generator, Callable)) and not isinstance(response, ResponseStream):
+            dialog.convo[-1] = (speaker, ResponseStream(response, name=dialog.headspace.lower()))
+
+    @property
+    def reply_paths(self) -> Counter:
+        """ How the instanced Headspaces answered: tool response, final answer or summarizer """
+        paths = Counter()
+        for cache in self._headspace_cache.values():
+            if cache._instance is not None:
+                paths.update(cache._instance.reply_paths)
+        return paths
+
+    def headspace_lock(self, name: str) -> Lock:
+        """ The lock held while a Headspace runs its agent, a Headspace answers one query at a time """
+        return self._headspace_locks.setdefault(name.upper(), Lock())
 
     def get_human_prompt(self, prompt: str, history: str="") -> str:
         """ 
@@ -222,17 +316,121 @@ class Brain(Base):
 
         Returns:
         str: The formatted prompt string, including conversation history if provided.
+
+        History beyond the `history_tokens` budget is dropped, oldest first.
         """
         if history != "":
-            human_prompt = PromptTemplate.from_template(HUMAN_WITH_MEMORY)
-            return human_prompt.format(prompt=prompt, memory=history)
+            history = cap_tokens(history, self.budget.get("history_tokens"), "history", keep="tail")
+            return HUMAN_WITH_MEMORY_TEMPLATE.format(prompt=prompt, memory=history)
+
+        return HUMAN_WITHOUT_MEMORY_TEMPLATE.format(prompt=prompt)
+
+    def route(self, prompt: str, human_prompt: str) -> Tuple[Any, Optional[Future]]:
+        """
+        Determine the Headspace for a query, locally when the router is confident.
+
+        Args:
+            prompt (str): The user's input query.
+            human_prompt (str): The query as formatted for the LLM router.
+
+        Returns:
+            Tuple[Headspace, Future | None]: The appropriate Headspace instance to handle the query,
+                                             and its speculative agent run when one was started.
+        """
+        candidates = []
+        if self.router is not None:
+            start = time.perf_counter()
+            if not self.router.fitted:
+                self.router.fit(self.routes)
+            match = self.router.route(prompt)
+            elapsed = (time.perf_counter() - start) * 1000
+            if match is not None and match.headspace in self:
+                self.logs.debug(f"Routed locally to {match.headspace} ({match.score:.2f}, +{match.margin:.2f}) in {elapsed:.1f}ms")
+                return self[match.headspace], None
+            self.logs.debug(f"Local routing inconclusive after {elapsed:.1f}ms, asking the LLM router")
+
+            if self.speculative_agents > 0:
+                scores = sorted(self.router.scores(prompt).items(), key=lambda item: item[1], reverse=True)
+                candidates = [ name for name, score in scores[:self.speculative_agents] if score > 0 and name in self ]
+
+        if candidates:
+            return self.route_speculatively(prompt, human_prompt, candidates)
+        return self.get_headspace_from_prompt(human_prompt), None
+
+    def route_speculatively(self, prompt: str, human_prompt: str, candidates: List[str]) -> Tuple[Any, Optional[Future]]:
+        """
+        Ask the LLM router while the agents of the likeliest Headspaces already run the query.
+
+        The speculative agents are held back by a SpeculationGate before any tool that isn't
+        read-only, and the ones the router didn't choose are cancelled once it answers.
+
+        Returns:
+            Tuple[Headspace, Future | None]: The chosen Headspace, and its agent run if it was speculated.
+        """
+        if self._speculation_pool is None:
+            self._speculation_pool = ThreadPoolExecutor(max_workers=self.speculative_agents + 1, thread_name_prefix="speculation")
+
+        runs: Dict[str, Tuple[SpeculationGate, Future]] = {}
+        for name in candidates:
+            lock = self.headspace_lock(name)
+            if not lock.acquire(blocking=False):
+                continue                                        # Still busy with a cancelled speculation
+            try:
+                headspace = self[name]
+                gate = SpeculationGate(name, headspace.read_only_tools)
+                runs[name] = (gate, self._speculation_pool.submit(self._speculate, headspace, prompt, gate, lock))
+            except Exception:
+                lock.release()
+                raise
+        self.logs.debug(f"Speculatively running {list(runs)} while the LLM router decides")
+
+        chosen = None
+        try:
+            headspace = self.get_headspace_from_prompt(human_prompt)
+            chosen = headspace.name.upper()
+        finally:
+            for name, (gate, _) in runs.items():
+                gate.decide(won=name == chosen)
+
+        run = runs.get(chosen)
+        self.logs.debug(f"The LLM router chose {chosen}, the speculation {'hit' if run else 'missed'}")
+        return headspace, run[1] if run else None
+
+    def _speculate(self, headspace, prompt: str, gate: SpeculationGate, lock: Lock) -> dict:
+        """ Run a speculative agent, releasing the Headspace lock when done """
+        self.logs.info(f"Speculative {headspace.name}.run_agent(prompt='{prompt}')")
+        try:
+            return headspace.run_agent(prompt, callbacks=[gate])
+        except SpeculationCancelled:
+            self.logs.debug(f"Cancelled the speculative {headspace.name} agent")
+            raise
+        except Exception as e:
+            if not gate.won:
+                self.logs.debug(f"The speculative {headspace.name} agent failed after losing: {e}")
+            raise
+        finally:
+            lock.release()
+
+    def run_headspace(self, headspace, prompt: str, speculation: Optional[Future]=None,
+                      callbacks: Optional[List[Any]]=None) -> Dialog:
+        """
+        Run the Headspace on a query, answering from its speculative agent run when there is one.
+
+        The speculative run released the Headspace lock when it returned, so its response is
+        handed to `reply` rather than read back from a Headspace another query could have run
+        on meanwhile. It is waited on for at most the interactive deadline.
+        """
+        if speculation is not None:
+            agent_response = speculation.result(timeout=self.speculation_timeout)
+            with self.headspace_lock(headspace.name):
+                return headspace.reply(prompt, stream=True, agent_response=agent_response)
 
-        human_prompt = PromptTemplate.from_template(HUMAN_WITHOUT_MEMORY)
-        return human_prompt.format(prompt=prompt)
+        with self.headspace_lock(headspace.name):
+            return headspace.query(prompt, stream=True, callbacks=callbacks)
 
     def get_headspace_from_prompt(self, query: str):
         """ 
-        Determine the appropriate Headspace to use for a given user query.
+        Determine the appropriate Headspace to use for a given user query with the LLM router.
 
         Args:
             query (str): The user's input query.
@@ -240,17 +438,72 @@ class Brain(Base):
         Returns:
             Headspace: The appropriate Headspace instance to handle the query.
         """
-        prompt = ChatPromptTemplate.from_template(HEADSPACE_ROUTER)
-        chain = prompt | self.mixtral_llm() | StrOutputParser()
-
-        examples = "\n\n".join(self.routing)
-        options = str(self.classes)
-        result = chain.invoke({"examples": examples,"headspaces": options, "query": query})
+        result = self.router_chain.invoke({"prefix": self.router_prefix, "query": query})
         headspace_name = result.strip().split()[0]
 
         return self[headspace_name]
 
-    def query(self, prompt: str, history: str="", load_msg_callback=None) -> Dialog:
+    def routing_examples(self, reserved: int=0) -> str:
+        """
+        The ROUTING examples for the LLM router, within the `router_prompt_tokens` budget.
+
+        When the examples don't fit, they are taken in turns from every Headspace until the
+        budget is spent, so each Headspace keeps its first examples.
+
+        Args:
+            reserved (int, optional): Tokens of the router prompt besides the examples. Defaults to 0.
+        """
+        budget = self.budget.get("router_prompt_tokens")
+        if not budget or reserved + sum(count_tokens(example) for example in self.routing) <= budget:
+            return "\n\n".join(self.routing)
+
+        groups = [ [ f"HUMAN: {route}\nAI: {hs}" for route in examples ] for hs, examples in self.routes.items() ]
+        kept, used = set(), reserved
+        for example in ( example for turn in zip_longest(*groups) for example in turn if example ):
+            used += count_tokens(example)
+            if used > budget:
+                break
+            kept.add(example)
+        TRUNCATIONS["router"] += 1
+        self.logs.debug(f"Router prompt over budget, kept {len(kept)} of {len(self.routing)} routing examples")
+        return "\n\n".join(example for example in self.routing if example in kept)
+
+    def invalidate_cache(self, headspace: Optional[str]=None):
+        """ Drop the cached answers of a Headspace whose data changed, or of every Headspace """
+        if self.cache is not None:
+            self.cache.invalidate(headspace)
+
+    def cache_response(self, prompt: str, headspace, dialog: Dialog, routed: bool):
+        """
+        Update the response cache after a Headspace answered a query.
+
+        The route is remembered if the router chose the Headspace. An answer that only used
+        read-only tools is stored once the GUI has consumed the response stream. Any other
+        tool may have changed the Headspace data, so its cached answers are dropped.
+        """
+        name = headspace.name.upper()
+        if routed:
+            self.cache.store_route(prompt, name)
+
+        if not headspace.read_only_response:
+            if headspace.tools_used:
+                self.cache.invalidate(name)
+            return
+
+        speaker, response = dialog.convo[-1]
+        visual = dialog.visual
+        if isinstance(response, str):
+            self.cache.store_response(prompt, name, response, visual)
+        elif isinstance(response, Generator):
+            def capture(stream):
+                chunks = []
+                for chunk in stream:
+                    chunks.append(chunk)
+                    yield chunk
+                self.cache.store_response(prompt, name, "".join(chunks), visual)
+            dialog.convo[-1] = (speaker, capture(response))
+
+    def query(self, prompt: str, history: str="", load_msg_callback=None, headspace: Optional[str]=None) -> Dialog:
         """
         Query the AI with a given prompt and optional conversation history.
 
@@ -259,28 +512,67 @@ class Brain(Base):
             history (str, optional): The conversation history to provide context. Defaults to "".
             load_msg_callback (Callable, optional): A callback function to display loading messages.
                                                     Defaults to None.
+            headspace (str, optional): The Headspace to use, e.g. from a dedicated wake word.
+                                       Skips the router when it is available. Defaults to None.
 
         Returns:
             Dialog: The AI's response as a Dialog object.
+
+        Queries without history go through the response cache first, which can skip the
+        routing or answer the query outright.
         """
         human_prompt = self.get_human_prompt(prompt, history)
 
         if isinstance(load_msg_callback, Callable):
             load_msg_callback("Ingesting Commmand")
-        headspace = self.get_headspace_from_prompt(human_prompt)
-        self.logs.debug(f"The AI has choosen to use the {headspace.name} Headspace.")
+
+        cacheable = self.cache is not None and history == ""
+        cached = self.cache.lookup(prompt) if cacheable else None
+        if cached is not None and (cached.headspace not in self or (headspace is not None and headspace.upper() != cached.headspace)):
+            cached = None
+
+        routed = False
+        speculation = None
+        if headspace is not None and headspace in self:
+            headspace = self[headspace]
+            self.logs.debug(f"The wake word routed to the {headspace.name} Headspace.")
+        elif cached is not None:
+            headspace = self[cached.headspace]
+            self.logs.debug(f"Cached route to the {headspace.name} Headspace.")
+        else:
+            if headspace is not None:
+                self.logs.warn(f"Wake word Headspace {headspace} is not available, using the router.")
+            try:
+                headspace, speculation = self.route(prompt, human_prompt)
+            except Exception as e:
+                self.logs.error(f"Could not route the query: {e}")
+                self.save_usage()
+                return self.fallback_dialog(prompt, "Brain", e)
+            routed = True
+            self.logs.debug(f"The AI has choosen to use the {headspace.name} Headspace.")
+
+        if cached is not None and cached.response is not None:
+            self.logs.info(f"Answering from the response cache ({cached.hits} hits)")
+            return headspace.respond(prompt, cached.response, cached.visual)
 
         if isinstance(load_msg_callback, Callable):
             load_msg_callback("Thinking ...")
 
-        dialog = None
+        thoughts = [AgentThoughts(load_msg_callback)] if isinstance(load_msg_callback, Callable) else []
         try:
-            dialog = headspace.query(prompt, stream=True)
+            dialog = self.run_headspace(headspace, prompt, speculation, callbacks=thoughts)
         except Exception as e:
             self.logs.error(f"Something failed in the Headspace.query: {e}")
-            print("BRAIN TRY FAILED")
+            dialog = self.fallback_dialog(prompt, headspace.name, e)
+        else:
+            if cacheable:
+                self.cache_response(prompt, headspace, dialog, routed)
+            self.guard_stream(dialog)
+            self.start_stream(dialog)
 
         if isinstance(load_msg_callback, Callable):
             load_msg_callback("Formulating Response ...")
 
+        self.logs.debug(f"LLM pool: {self.llms.stats}, reply paths: {dict(self.reply_paths)}")
+        self.save_usage()
         return dialog
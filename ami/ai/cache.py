@@ -0,0 +1,149 @@
+""" Response cache in front of Brain.query for repeated household requests """
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import date
+from difflib import SequenceMatcher
+from pathlib import Path
+from threading import Lock
+from typing import Optional
+
+from ami.base import Base
+
+def normalize_query(query: str) -> str:
+    """ Lowercase the transcript and drop punctuation and extra whitespace """
+    query = re.sub(r"[^\w\s]", "", query.lower())
+    return " ".join(query.split())
+
+@dataclass
+class CachedResponse:
+    """
+    What the cache knows about a query.
+
+    Attributes:
+        headspace (str): The Headspace the query was routed to.
+        response (str | None): The final answer, only for queries answered with read-only tools.
+        visual (Path | None): The visual shown with the answer.
+        day (date | None): The day the answer was given, answers don't carry over to the next day.
+        answered (float): `time.monotonic()` when the answer was stored.
+        hits (int): How often the entry was served.
+    """
+    headspace: str
+    response: Optional[str] = None
+    visual: Optional[Path] = None
+    day: Optional[date] = None
+    answered: float = 0.0
+    hits: int = 0
+
+class ResponseCache(Base):
+    """
+    LRU cache of routed Headspaces and read-only answers keyed by the normalized transcript.
+
+    The route of a query is kept until it is evicted. The final answer is kept for `ttl` seconds,
+    for the day it was given on (so "tomorrow" doesn't go stale at midnight) and until the
+    Headspace is invalidated because one of its write tools ran or its data was reloaded. A
+    query that misses exactly is matched against the cached queries by string similarity, so
+    small transcription differences still reuse the route. Answers are only served on an exact
+    match, similar queries can ask for a different day or number ("october 21" vs "october 23").
+    """
+
+    def __init__(self, ttl: float=300.0, max_entries: int=256, similarity: float=0.92):
+        """
+        Initialize the cache.
+
+        Args:
+            ttl (float, optional): Seconds an answer stays valid. Defaults to 300.
+            max_entries (int, optional): Queries kept before the least recently used is evicted. Defaults to 256.
+            similarity (float, optional): Lowest SequenceMatcher ratio for a fuzzy route hit, 1 to disable. Defaults to 0.92.
+        """
+        super().__init__()
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _find(self, key: str) -> Optional[str]:
+        if key in self._entries:
+            return key
+        if self.similarity >= 1:
+            return None
+        best, best_ratio = None, self.similarity
+        for cached in self._entries:
+            matcher = SequenceMatcher(None, key, cached)
+            if matcher.real_quick_ratio() < best_ratio or matcher.quick_ratio() < best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio >= best_ratio:
+                best, best_ratio = cached, ratio
+        return best
+
+    def _fresh(self, entry: CachedResponse) -> bool:
+        return (entry.response is not None
+                and entry.day == date.today()
+                and time.monotonic() - entry.answered < self.ttl)
+
+    def lookup(self, query: str) -> Optional[CachedResponse]:
+        """
+        Look up a query.
+
+        Returns:
+            CachedResponse | None: The entry, its `response` is None when only the route is known
+                                   or the answer went stale.
+        """
+        key = normalize_query(query)
+        with self._lock:
+            found = self._find(key)
+            if found is None:
+                return None
+            entry = self._entries[found]
+            self._entries.move_to_end(found)
+
+            if entry.response is not None and not self._fresh(entry):
+                entry.response = entry.visual = entry.day = None
+            entry.hits += 1
+            if found != key:
+                return CachedResponse(headspace=entry.headspace, hits=entry.hits)     # Only the route carries over
+            return CachedResponse(**vars(entry))
+
+    def store_route(self, query: str, headspace: str):
+        """ Remember the Headspace a query was routed to """
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.headspace != headspace:
+                self._entries[key] = CachedResponse(headspace=headspace)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def store_response(self, query: str, headspace: str, response: str, visual: Optional[Path]=None):
+        """ Remember the answer to a query that only used read-only tools """
+        self.store_route(query, headspace)
+        key = normalize_query(query)
+        with self._lock:
+            entry = self._entries[key]
+            entry.response = response
+            entry.visual = visual
+            entry.day = date.today()
+            entry.answered = time.monotonic()
+
+    def invalidate(self, headspace: Optional[str]=None):
+        """ Drop the cached answers of a Headspace, or of every Headspace. Routes are kept. """
+        dropped = 0
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.response is not None and (headspace is None or entry.headspace.upper() == headspace.upper()):
+                    entry.response = entry.visual = entry.day = None
+                    dropped += 1
+        if dropped:
+            self.logs.debug(f"Invalidated {dropped} cached answers for {headspace or 'all Headspaces'}")
+
+    def clear(self):
+        """ Forget everything """
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,340 @@
+"""
+LLM providers and the pool of LLM clients shared by every Headspace
+
+Each role (router, agent, summarizer) is configured in config.yaml with a provider and a model:
+    together    Together completions API
+    openai      Any OpenAI compatible completions endpoint, e.g. llama.cpp, vLLM, Ollama or ami.ai.standin
+    fake        Deterministic in-process model for tests and benchmarks, no network
+"""
+import json
+import re
+import time
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from langchain_together import Together
+
+from ami.ai.resilience import GuardedLLM, LLMGuard, LLMHTTPError, parse_retry_after
+from ami.base import Base
+
+class InvalidLLMProvider(Exception):
+    """Exception raised for an unknown or unloadable LLM provider."""
+    pass
+
+class PooledTogether(Together):
+    """
+    Together completions client that posts through a shared `requests.Session`.
+
+    `Together._call` goes through `requests.post`, which opens a new connection and does a new
+    TLS handshake for every completion. This client keeps the payload and error handling of
+    `Together` but sends it through the session of its LLMPool, so connections are kept alive
+    and reused across calls, models and Headspaces.
+    """
+    pool: Any = None
+    """ The LLMPool that created the client """
+
+    def _call(self,
+              prompt: str,
+              stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None,
+              **kwargs: Any) -> str:
+        if self.pool is None:
+            return super()._call(prompt, stop=stop, run_manager=run_manager, **kwargs)
+
+        headers = {
+            "Authorization": f"Bearer {self.together_api_key.get_secret_value()}",
+            "Content-Type": "application/json",
+        }
+        payload: Dict[str, Any] = {
+            **self.default_params,
+            "prompt": prompt,
+            "stop": stop[0] if stop and len(stop) == 1 else stop,
+            **kwargs,
+        }
+        payload = { k: v for k, v in payload.items() if v is not None }
+        response = self.pool.post(self.base_url, json=payload, headers=headers)
+
+        if response.status_code >= 500:
+            raise LLMHTTPError(f"Together Server: Error {response.status_code}", response.status_code)
+        elif response.status_code >= 400:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            raise LLMHTTPError(f"Together rejected the request with status {response.status_code}: {response.text}",
+                               response.status_code, retry_after)
+        elif response.status_code != 200:
+            raise Exception(f"Together returned an unexpected response with status {response.status_code}: {response.text}")
+
+        return self._format_output(response.json())
+
+class FakeLLM(LLM):
+    """
+    Deterministic stand-in for a remote model, so the whole pipeline runs without network access.
+
+    The first pattern of `responses` found in the prompt decides the answer. Otherwise the
+    answer depends on the `role`:
+        router      The Headspace of the ROUTING example sharing the most words with the query
+        agent       A structured chat Final Answer
+        summarizer  A short past tense sentence
+    `latency` seconds are slept before answering to stand in for the model's inference time.
+    """
+    model: str = "fake"
+    role: str = "agent"
+    responses: Dict[str, str] = {}
+    latency: float = 0.0
+    temperature: Optional[float] = None
+    top_k: Optional[int] = None
+    max_tokens: Optional[int] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {"model": self.model, "role": self.role}
+
+    @staticmethod
+    def _words(text: str) -> set:
+        return set(re.findall(r"\w+", text.lower()))
+
+    def route(self, prompt: str) -> str:
+        """ Answer a HEADSPACE_ROUTER prompt with the Headspace of the closest example """
+        examples = re.findall(r"HUMAN: (.*)\nAI: (\S+)", prompt)
+        query = re.findall(r"HUMAN: (.*)", prompt)
+        if not examples:
+            headspaces = re.findall(r"'(\w+)'", prompt)
+            return headspaces[0] if headspaces else "UTILS"
+        words = self._words(query[-1] if query else prompt)
+        best = max(examples, key=lambda example: len(words & self._words(example[0])))
+        return best[1]
+
+    def answer(self, prompt: str) -> str:
+        """ The deterministic answer to a prompt """
+        for pattern, response in self.responses.items():
+            if re.search(pattern, prompt):
+                return response
+        if self.role == "router":
+            return self.route(prompt)
+        if self.role == "summarizer":
+            return "I took care of it"
+        return "```json\n" + json.dumps({"action": "Final Answer", "action_input": "Done"}) + "\n```"
+
+    def _call(self,
+              prompt: str,
+              stop: Optional[List[str]] = None,
+              run_manager: Optional[CallbackManagerForLLMRun] = None,
+              **kwargs: Any) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        text = self.answer(prompt)
+        for token in stop or []:
+            if token in text:
+                text = text[:text.index(token)]
+        return text
+
+    def _stream(self,
+                prompt: str,
+                stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None,
+                **kwargs: Any) -> Iterator[GenerationChunk]:
+        for word in re.findall(r"\S+\s*", self._call(prompt, stop=stop)):
+            chunk = GenerationChunk(text=word)
+            if run_manager:
+                run_manager.on_llm_new_token(word, chunk=chunk)
+            yield chunk
+
+def together_llm(pool: 'LLMPool', model: str, **params) -> LLM:
+    return PooledTogether(model=model, together_api_key=pool.api_key, pool=pool, **params)
+
+def openai_llm(pool: 'LLMPool', model: str, base_url: Optional[str]=None, api_key: Optional[str]=None,
+               top_k: Optional[int]=None, extra_body: Optional[Dict[str, Any]]=None, **params) -> LLM:
+    try:
+        from langchain_openai import OpenAI
+    except ImportError as exc:
+        raise InvalidLLMProvider("The openai LLM provider requires the `langchain-openai` package") from exc
+    if base_url is None:
+        raise InvalidLLMProvider(f"The openai LLM provider needs a base_url for {model}")
+    extra_body = { **(extra_body or {}), **({"top_k": top_k} if top_k is not None else {}) }
+    return OpenAI(model=model,
+                  base_url=base_url,
+                  api_key=api_key or "none",            # Local servers ignore it, the client requires one
+                  http_client=pool.http_client,
+                  request_timeout=pool.timeout,
+                  extra_body=extra_body or None,
+                  **params)
+
+def fake_llm(pool: 'LLMPool', model: str, **params) -> LLM:
+    return FakeLLM(model=model, **params)
+
+LLM_PROVIDERS: Dict[str, Callable[..., LLM]] = {
+    "together": together_llm,
+    "openai": openai_llm,
+    "fake": fake_llm,
+}
+
+class LLMPool(Base):
+    """
+    Creates each LLM client once per (provider, model, params) and hands out the same instance afterwards.
+
+    Together clients share one `requests.Session` and OpenAI compatible clients one `httpx.Client`,
+    both keep up to `max_connections` alive connections per host, so only the first completion
+    after start (or after the server closed an idle connection) pays for the TCP and TLS handshake.
+    `spawn` returns the client configured for a role. `stats` counts how often clients and
+    connections were reused.
+    """
+
+    def __init__(self, api_key: str, roles: Optional[Dict[str, Dict[str, Any]]]=None,
+                 max_connections: int=8, timeout: float=60.0, callbacks: Optional[List[Any]]=None,
+                 guard: Optional[LLMGuard]=None):
+        """
+        Initialize the pool.
+
+        Args:
+            api_key (str): The Together API key.
+            roles (Dict[str, Dict[str, Any]], optional): Per role the `provider`, `model` and parameters of
+                its LLM, see Config.llm_roles. Defaults to none.
+            max_connections (int, optional): Keep-alive connections kept per host. Defaults to 8.
+            timeout (float, optional): Seconds to wait for a completion. Defaults to 60.
+            callbacks (List, optional): LangChain callbacks of every spawned client, e.g. LLMUsage.
+            guard (LLMGuard, optional): Deadlines, retries and circuit breakers of every spawned client.
+        """
+        super().__init__()
+        self.api_key = api_key
+        self.roles = roles or {}
+        self.callbacks = callbacks or []
+        self.guard = guard
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._clients: Dict[Tuple, LLM] = {}
+        self._lock = Lock()
+        self._http_client = None
+        self._http_lock = Lock()        # Not self._lock, the factories reach the client while get holds that
+        self._httpx_connections = 0
+
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_connections)
+        self.session = requests.Session()
+        self.session.mount("https://", self.adapter)
+        self.session.mount("http://", self.adapter)
+
+        self.clients_created = 0
+        self.clients_reused = 0
+        self.requests = 0
+
+    @staticmethod
+    def key(provider: str, model: str, params: Dict[str, Any]) -> Tuple:
+        return (provider, model, json.dumps(params, sort_keys=True, default=str))
+
+    def get(self, model: str, provider: str="together", **params) -> LLM:
+        """
+        Return the client for a model and its generation parameters, creating it on first use.
+
+        Args:
+            model (str): The model name.
+            provider (str, optional): One of the keys of LLM_PROVIDERS. Defaults to "together".
+            **params: Parameters of the provider, e.g. temperature, top_k, max_tokens.
+
+        Raises:
+            InvalidLLMProvider: If the provider is unknown or cannot be loaded.
+        """
+        factory = LLM_PROVIDERS.get(provider)
+        if factory is None:
+            raise InvalidLLMProvider(f"LLM provider {provider} not valid. Please reconfigure with one of the following {list(LLM_PROVIDERS.keys())}")
+
+        key = self.key(provider, model, params)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self.clients_reused += 1
+                return client
+
+            client = factory(self, model, **params)
+            self._clients[key] = client
+            self.clients_created += 1
+        self.logs.debug(f"Created {provider} LLM client {model} {params}")
+        return client
+
+    def spawn(self, role: str="agent", **overrides):
+        """
+        Return the client configured for a role.
+
+        The client is bound to the pool callbacks with the role as `run_name`, so instrumentation
+        sees the call site. Callers can name a more specific call site with `config={"run_name": ...}`.
+        With a guard the client is a GuardedLLM, whose calls have the deadline of their call site.
+
+        Args:
+            role (str, optional): The role in Config.llm_roles, unknown roles use the agent's LLM. Defaults to "agent".
+            **overrides: Replace configured parameters, e.g. max_tokens.
+        """
+        params = { **self.roles.get(role, self.roles.get("agent", {})), **overrides }
+        provider = params.pop("provider", "together")
+        model = params.pop("model")
+        if provider == "fake":
+            params.setdefault("role", role)
+        client = self.get(model, provider=provider, **params).with_config(run_name=role, callbacks=self.callbacks)
+        if self.guard is None:
+            return client
+        return GuardedLLM(client, self.guard, key=f"{provider}:{model}", site=role)
+
+    @property
+    def http_client(self):
+        """ The keep-alive httpx client shared by the OpenAI compatible clients, created on first use """
+        with self._http_lock:
+            if self._http_client is None:
+                import httpx
+
+                def trace(event: str, info: Dict):
+                    if event == "connection.connect_tcp.complete":
+                        with self._lock:
+                            self._httpx_connections += 1
+
+                def count(request):
+                    request.extensions["trace"] = trace
+                    with self._lock:
+                        self.requests += 1
+
+                limits = httpx.Limits(max_connections=self.max_connections * 4, max_keepalive_connections=self.max_connections)
+                self._http_client = httpx.Client(limits=limits, timeout=self.timeout, event_hooks={"request": [count]})
+            return self._http_client
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """ POST through the shared session """
+        with self._lock:
+            self.requests += 1
+        return self.session.post(url, timeout=self.timeout, **kwargs)
+
+    @property
+    def connections(self) -> int:
+        """ HTTP connections opened so far by the live host pools """
+        pools = self.adapter.poolmanager.pools
+        with pools.lock:
+            opened = sum(getattr(pool, "num_connections", 0) for pool in pools._container.values())
+        return opened + self._httpx_connections
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """ Client and connection reuse counters """
+        connections = self.connections
+        return {
+            "clients": len(self._clients),
+            "clients_created": self.clients_created,
+            "clients_reused": self.clients_reused,
+            "requests": self.requests,
+            "connections": connections,
+            "connections_reused": max(0, self.requests - connections),
+        }
+
+    def close(self):
+        """ Close the keep-alive connections and forget the clients """
+        if self.guard is not None:
+            self.guard.close()
+        with self._lock:
+            self._clients.clear()
+        self.session.close()
+        with self._http_lock:
+            if self._http_client is not None:
+                self._http_client.close()
+                self._http_client = None
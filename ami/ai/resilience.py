@@ -0,0 +1,394 @@
+"""
+Deadlines, retries and circuit breakers around every LLM call
+
+LLMPool.spawn wraps each client in a GuardedLLM, which runs the calls through the LLMGuard:
+    deadline        Seconds a call may take in total, per call site (router, agent, summarizer, ...).
+                    The call runs on a worker thread, a hung request raises LLMTimeout at the deadline
+                    instead of blocking the caller.
+    retries         Failed calls are retried with exponential backoff and full jitter while the
+                    deadline allows. Timeouts and invalid requests are not retried, throttled
+                    requests (408, 429) are and wait at least as long as the provider's Retry-After.
+    circuit breaker After `failure_threshold` failures in a row a provider model is considered
+                    degraded, calls fail fast with CircuitOpen for `reset_timeout` seconds, then one
+                    probe call decides whether it recovered.
+Latencies are kept in a histogram per call site, see LLMGuard.snapshot.
+"""
+import random
+import time
+from collections import Counter
+from concurrent.futures import TimeoutError as FutureTimeout
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from langchain_core.runnables import Runnable, RunnableConfig
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+from ami.ai.speculation import SpeculationCancelled
+from ami.base import Base
+
+class LLMUnavailable(Exception):
+    """ An LLM call could not be answered in time or at all """
+    pass
+
+class LLMTimeout(LLMUnavailable):
+    """ An LLM call missed its deadline """
+    pass
+
+class CircuitOpen(LLMUnavailable):
+    """ The provider model is failing, the call was not attempted """
+    pass
+
+class LLMHTTPError(Exception):
+    """ A provider answered an LLM call with an error status """
+
+    RETRYABLE_STATUS = (408, 429)       # Timed out or throttled, the same request can succeed later
+
+    def __init__(self, message: str, status: int, retry_after: Optional[float]=None):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        """ Whether the provider is at fault rather than the request """
+        return self.status >= 500 or self.status in self.RETRYABLE_STATUS
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """ Seconds to wait from a Retry-After header, given in seconds or as an HTTP date """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+NON_RETRYABLE = (ValueError, TypeError)    # The request itself is invalid, retrying won't help
+
+CANNED_RESPONSES = {
+    CircuitOpen: "I can't reach my language model right now, please try again in a minute.",
+    LLMTimeout: "That took me too long to think about, please try again.",
+}
+CANNED_RESPONSE = "Something went wrong on my end, please try again."
+
+def canned_response(error: BaseException) -> str:
+    """ The response for the human when a query failed with `error` """
+    for error_type, response in CANNED_RESPONSES.items():
+        if isinstance(error, error_type):
+            return response
+    return CANNED_RESPONSE
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class LatencyHistogram:
+    """ Latencies counted in fixed buckets of seconds, the last bucket counts everything slower """
+
+    def __init__(self, buckets: Tuple[float, ...]=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._lock = Lock()
+
+    def observe(self, seconds: float):
+        index = next((i for i, bound in enumerate(self.buckets) if seconds <= bound), len(self.buckets))
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+
+    def percentile(self, q: float) -> Optional[float]:
+        """ The upper bound of the bucket holding the q-th percentile, inf when it's past the last bucket """
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip((*self.buckets, float("inf")), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        labels = [ f"<={bound:g}s" for bound in self.buckets ] + [ f">{self.buckets[-1]:g}s" ]
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+class CircuitBreaker:
+    """
+    Fails fast once a provider model keeps failing.
+
+    closed      Calls go through, `failure_threshold` failures in a row open the circuit.
+    open        Calls are rejected until `reset_timeout` seconds passed.
+    half_open   One probe call goes through, its success closes the circuit, its failure opens it again.
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int=5, reset_timeout: float=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = 0                 # Times the circuit opened
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """ Whether a call may go through now """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            if self._probing:
+                return False
+            self._state, self._probing = self.HALF_OPEN, True
+            return True
+
+    def success(self):
+        with self._lock:
+            self._state, self.failures, self._probing = self.CLOSED, 0, False
+
+    def release(self):
+        """ The call was abandoned without telling anything about the provider """
+        with self._lock:
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opened += 1
+                self._state, self._opened_at, self._probing = self.OPEN, time.monotonic(), False
+
+class LLMGuard(Base):
+    """
+    Runs LLM calls under a deadline, with jittered retries, a circuit breaker per provider model
+    and a latency histogram per call site. Shared by every client of an LLMPool.
+    """
+
+    def __init__(self,
+                 deadline: float=30.0,
+                 deadlines: Optional[Dict[str, float]]=None,
+                 retries: int=2,
+                 backoff: float=0.5,
+                 max_backoff: float=4.0,
+                 failure_threshold: int=5,
+                 reset_timeout: float=30.0,
+                 max_workers: int=16):
+        """
+        Initialize the guard.
+
+        Args:
+            deadline (float, optional): Seconds a call may take including its retries. Defaults to 30.
+            deadlines (Dict[str, float], optional): Deadlines of specific call sites, e.g. the router.
+            retries (int, optional): Retries after a failed call. Defaults to 2.
+            backoff (float, optional): Seconds of the first retry's backoff, doubled for every retry. Defaults to 0.5.
+            max_backoff (float, optional): The longest backoff in seconds. Defaults to 4.
+            failure_threshold (int, optional): Failures in a row that open a circuit. Defaults to 5.
+            reset_timeout (float, optional): Seconds an open circuit rejects calls. Defaults to 30.
+            max_workers (int, optional): Threads running LLM calls at once. Defaults to 16.
+        """
+        super().__init__()
+        self.deadline = deadline
+        self.deadlines = deadlines or {}
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_workers = max_workers
+
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.latency: Dict[str, LatencyHistogram] = {}
+        self.events: Dict[str, Counter] = {}       # retries, timeouts, failures and rejections per call site
+        self._executor: Optional[ContextThreadPoolExecutor] = None
+        self._lock = Lock()
+
+    @property
+    def max_deadline(self) -> float:
+        return max([self.deadline, *self.deadlines.values()])
+
+    def deadline_for(self, site: str) -> float:
+        return self.deadlines.get(site, self.deadline)
+
+    def breaker(self, key: str) -> CircuitBreaker:
+        with self._lock:
+            if key not in self.breakers:
+                self.breakers[key] = CircuitBreaker(key, self.failure_threshold, self.reset_timeout)
+            return self.breakers[key]
+
+    def _site(self, site: str) -> Tuple[LatencyHistogram, Counter]:
+        with self._lock:
+            if site not in self.latency:
+                self.latency[site] = LatencyHistogram()
+                self.events[site] = Counter()
+            return self.latency[site], self.events[site]
+
+    @property
+    def executor(self) -> ContextThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ContextThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="llm")
+        return self._executor
+
+    def _wait(self, func: Callable[[], Any], end: float, site: str) -> Any:
+        """ Run `func` on a worker thread, raising LLMTimeout once `end` passed """
+        future = self.executor.submit(func)
+        try:
+            return future.result(timeout=max(0.0, end - time.monotonic()))
+        except FutureTimeout:
+            future.cancel()
+            raise LLMTimeout(f"The {site} LLM call missed its {self.deadline_for(site):g}s deadline") from None
+
+    def _attempts(self, key: str, site: str, func: Callable[[], Any]) -> Any:
+        """ Call `func` under the deadline of the site, retrying and tripping the breaker of `key` """
+        breaker = self.breaker(key)
+        histogram, events = self._site(site)
+        start = time.monotonic()
+        end = start + self.deadline_for(site)
+
+        for attempt in range(self.retries + 1):
+            if not breaker.allow():
+                events["rejected"] += 1
+                raise CircuitOpen(f"The circuit of {key} is open after {breaker.failures} failures")
+            try:
+                result = self._wait(func, end, site)
+            except LLMTimeout:
+                events["timeouts"] += 1
+                breaker.failure()
+                raise
+            except SpeculationCancelled:
+                breaker.release()
+                raise
+            except LLMHTTPError as e:
+                if not e.retryable:
+                    breaker.success()           # The provider answered, the request was at fault
+                    raise
+                error = e
+            except NON_RETRYABLE:
+                breaker.success()
+                raise
+            except Exception as e:
+                error = e
+            else:
+                breaker.success()
+                histogram.observe(time.monotonic() - start)
+                return result
+
+            events["failures"] += 1
+            breaker.failure()
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            if isinstance(error, LLMHTTPError) and error.retry_after is not None:
+                delay = max(delay, error.retry_after)
+            if attempt == self.retries or time.monotonic() + delay >= end:
+                raise error
+            events["retries"] += 1
+            self.logs.warn(f"The {site} LLM call failed ({error}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+    def call(self, key: str, site: str, func: Callable[[], Any]) -> Any:
+        """
+        Call an LLM.
+
+        Args:
+            key (str): The provider model, whose circuit breaker applies.
+            site (str): The call site, whose deadline and histogram apply.
+            func (Callable): Makes the call.
+
+        Raises:
+            LLMTimeout: If the call missed its deadline.
+            CircuitOpen: If the provider model's circuit is open.
+        """
+        return self._attempts(key, site, func)
+
+    def stream(self, key: str, site: str, start: Callable[[], Iterator]) -> Iterator:
+        """
+        Stream from an LLM. Retries until the first chunk arrived, every later chunk has to
+        arrive before the deadline of the site too.
+        """
+        iterator = None
+        end = None
+        sentinel = object()
+
+        def first():
+            nonlocal iterator
+            iterator = iter(start())
+            return next(iterator, sentinel)
+
+        chunk = self._attempts(key, site, first)
+        end = time.monotonic() + self.deadline_for(site)
+        while chunk is not sentinel:
+            yield chunk
+            try:
+                chunk = self._wait(lambda: next(iterator, sentinel), end, site)
+            except LLMTimeout:
+                self._site(site)[1]["timeouts"] += 1
+                raise
+
+    def snapshot(self) -> Dict[str, Any]:
+        """ The latency histogram and events per call site, and the state of every circuit """
+        with self._lock:
+            sites = list(self.latency)
+            breakers = list(self.breakers.values())
+        return {
+            "sites": { site: { **self.latency[site].snapshot(), **self.events[site] } for site in sites },
+            "breakers": { breaker.name: {"state": breaker.state, "failures": breaker.failures, "opened": breaker.opened}
+                          for breaker in breakers },
+        }
+
+    def close(self):
+        """ Stop the worker threads, calls still running are abandoned """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+class GuardedLLM(Runnable):
+    """
+    LLM client whose `invoke` and `stream` go through an LLMGuard.
+
+    The call site is the `run_name` of the call's config if it names one, the role of the
+    client otherwise. Everything else (bind, with_config, pipes) works as on the client.
+    """
+
+    def __init__(self, bound: Runnable, guard: LLMGuard, key: str, site: str):
+        self.bound = bound
+        self.guard = guard
+        self.key = key
+        self.site = site
+
+    @property
+    def InputType(self) -> Any:
+        return self.bound.InputType
+
+    @property
+    def OutputType(self) -> Any:
+        return self.bound.OutputType
+
+    def _site(self, config: Optional[RunnableConfig]) -> str:
+        return (config or {}).get("run_name") or self.site
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig]=None, **kwargs: Any) -> Any:
+        return self.guard.call(self.key, self._site(config), lambda: self.bound.invoke(input, config, **kwargs))
+
+    def stream(self, input: Any, config: Optional[RunnableConfig]=None, **kwargs: Any) -> Iterator[Any]:
+        return self.guard.stream(self.key, self._site(config), lambda: self.bound.stream(input, config, **kwargs))
@@ -0,0 +1,194 @@
+""" Local Headspace router. Classifies a query against the ROUTING examples without an LLM call """
+import os
+import json
+import pickle
+import hashlib
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+from ami.base import Base
+
+class RouteMatch(NamedTuple):
+    """
+    The result of routing a query.
+
+    Attributes:
+        headspace (str): The best matching Headspace.
+        score (float): Cosine similarity of the query to that Headspace, between 0 and 1.
+        margin (float): How far the best Headspace scored above the runner up.
+    """
+    headspace: str
+    score: float
+    margin: float
+
+class RouterModel(NamedTuple):
+    """ Everything a fitted router scores with, replaced as a whole so a query never sees half a fit """
+    fingerprint: str
+    vectorizer: Any                     # TfidfVectorizer
+    examples: np.ndarray                # (n_examples, n_features), L2 normalized
+    centroids: np.ndarray               # (n_headspaces, n_features), L2 normalized
+    labels: List[str]
+    example_labels: np.ndarray
+
+class EmbeddingRouter(Base):
+    """
+    Nearest neighbour / centroid router over the ROUTING examples of every Headspace.
+
+    The examples are embedded once with a TF-IDF model over character n-grams, which
+    is robust to the small wording changes of spoken queries, and the fitted model is cached to
+    disk keyed by a hash of the examples. A query scores every Headspace by the mean of its
+    similarity to the nearest example and to the Headspace centroid. `route` only answers when
+    the best score and its margin over the runner up are high enough, otherwise the caller
+    falls back to the LLM router. Fitting is serialized, a query that needs the router while
+    it is being fitted, e.g. by the warm up, waits for that fit instead of starting another.
+    """
+
+    def __init__(self, cache_file: Path, min_score: float=0.35, min_margin: float=0.08):
+        """
+        Initialize the router. It is fitted on the first `route` after `fit` was given examples.
+
+        Args:
+            cache_file (Path): Where the fitted model is cached.
+            min_score (float, optional): The lowest score to answer with. Defaults to 0.35.
+            min_margin (float, optional): The lowest margin over the runner up to answer with. Defaults to 0.08.
+        """
+        super().__init__()
+        self.cache_file = cache_file
+        self.min_score = min_score
+        self.min_margin = min_margin
+
+        self._model: Optional[RouterModel] = None
+        self._lock = Lock()
+
+    @property
+    def fitted(self) -> bool:
+        return self._model is not None
+
+    @staticmethod
+    def fingerprint(routes: Dict[str, List[str]]) -> str:
+        """ Hash of the examples, the cache is only valid for the examples it was fitted on """
+        return hashlib.sha256(json.dumps(routes, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def fit(self, routes: Dict[str, List[str]], fit_cache: Optional[Callable[[Path, Dict[str, List[str]]], Any]]=None):
+        """
+        Embed the routing examples, loading the cached model if it was fitted on the same examples.
+
+        Args:
+            routes (Dict[str, List[str]]): The ROUTING examples per Headspace name.
+            fit_cache (Callable, optional): Fits and caches the model elsewhere, e.g. `fit_router_cache`
+                                            in a process, before it is loaded from the cache.
+        """
+        routes = { name: examples for name, examples in routes.items() if examples }
+        fingerprint = self.fingerprint(routes)
+        with self._lock:
+            if self._model is not None and self._model.fingerprint == fingerprint:
+                return                  # Fitted while this call waited for the lock
+            if self._load(fingerprint):
+                return
+            if fit_cache is not None:
+                fit_cache(self.cache_file, routes)
+                if self._load(fingerprint):
+                    return
+
+            start = time.perf_counter()
+            labels = sorted(routes.keys())
+            texts = [ example for name in labels for example in routes[name] ]
+            example_labels = np.array([ i for i, name in enumerate(labels) for _ in routes[name] ])
+
+            if not texts:
+                self._model = None
+                return
+
+            vectorizer = TfidfVectorizer(analyzer="char_wb", ngram_range=(2, 4), lowercase=True, sublinear_tf=True)
+            examples = normalize(vectorizer.fit_transform(texts).toarray())
+            centroids = np.stack([ examples[example_labels == i].mean(axis=0) for i in range(len(labels)) ])
+
+            self._model = RouterModel(fingerprint=fingerprint,
+                                      vectorizer=vectorizer,
+                                      examples=examples.astype(np.float32),
+                                      centroids=normalize(centroids).astype(np.float32),
+                                      labels=labels,
+                                      example_labels=example_labels)
+            self.logs.info(f"Embedded {len(texts)} routing examples in {time.perf_counter() - start:.3f}s")
+            self._save(self._model)
+
+    def clear(self):
+        """ Forget the fitted model """
+        with self._lock:
+            self._model = None
+
+    def scores(self, query: str) -> Dict[str, float]:
+        """ The score of every Headspace for the query """
+        model = self._model
+        if model is None:
+            return {}
+        vector = normalize(model.vectorizer.transform([query]).toarray()).astype(np.float32)[0]
+        example_sims = model.examples @ vector
+        centroid_sims = model.centroids @ vector
+        nearest = np.full(len(model.labels), -1.0, dtype=np.float32)
+        np.maximum.at(nearest, model.example_labels, example_sims)
+        combined = (nearest + centroid_sims) / 2
+        return { name: float(score) for name, score in zip(model.labels, combined) }
+
+    def route(self, query: str) -> Optional[RouteMatch]:
+        """
+        Route a query.
+
+        Args:
+            query (str): The Human's query, without any prompt template around it.
+
+        Returns:
+            RouteMatch | None: The match, or None when the router isn't confident.
+        """
+        scores = sorted(self.scores(query).items(), key=lambda item: item[1], reverse=True)
+        if not scores:
+            return None
+
+        headspace, score = scores[0]
+        margin = score - scores[1][1] if len(scores) > 1 else score
+        if score < self.min_score or margin < self.min_margin:
+            self.logs.debug(f"Router not confident: {headspace}={score:.2f} margin={margin:.2f}")
+            return None
+        return RouteMatch(headspace, score, margin)
+
+    def _save(self, model: RouterModel):
+        """ Cache the model, written aside and moved in place so a concurrent reader never sees half a file """
+        temporary = self.cache_file.with_name(f"{self.cache_file.name}.{os.getpid()}.tmp")
+        try:
+            self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(temporary, 'wb') as file:
+                pickle.dump(model._asdict(), file)
+            os.replace(temporary, self.cache_file)
+        except OSError as e:
+            self.logs.error(f"Could not cache the router to {self.cache_file}: {e}")
+
+    def _load(self, fingerprint: str) -> bool:
+        if not self.cache_file.is_file():
+            return False
+        try:
+            with open(self.cache_file, 'rb') as file:
+                state = pickle.load(file)
+        except Exception as e:
+            self.logs.warn(f"Ignoring the router cache {self.cache_file}: {e}")
+            return False
+
+        if state.get("fingerprint") != fingerprint:
+            return False
+
+        try:
+            self._model = RouterModel(**state)
+        except TypeError as e:
+            self.logs.warn(f"Ignoring the router cache {self.cache_file}: {e}")
+            return False
+        self.logs.info(f"Loaded the router from {self.cache_file}")
+        return True
+
+def fit_router_cache(cache_file: Path, routes: Dict[str, List[str]]):
+    """ Fit a router and cache it, so the router of the Brain only loads it. For a separate process. """
+    EmbeddingRouter(cache_file).fit(routes)
@@ -0,0 +1,57 @@
+""" Speculative Headspace agents, started while the LLM router is still deciding """
+from threading import Event
+from typing import Any, Dict, Iterable, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+class SpeculationCancelled(Exception):
+    """ Raised inside a speculative agent run once the router picked another Headspace """
+    pass
+
+class SpeculationGate(BaseCallbackHandler):
+    """
+    Agent callback that keeps a speculative run from doing anything the router could regret.
+
+    The agent of a speculated Headspace runs freely through LLM calls and read-only tools. Any
+    other tool may change Headspace data, so the run blocks before it until the router decided.
+    When the router picked another Headspace the run is aborted at its next LLM call or tool,
+    an LLM call already in flight can't be interrupted.
+
+    Attributes:
+        headspace (str): The speculated Headspace.
+        read_only_tools (set): Names of the tools that can run before the decision.
+    """
+    raise_error = True              # Exceptions from the callbacks abort the agent
+
+    def __init__(self, headspace: str, read_only_tools: Iterable[str]):
+        self.headspace = headspace
+        self.read_only_tools = set(read_only_tools)
+        self._decided = Event()
+        self._won = False
+
+    @property
+    def decided(self) -> bool:
+        return self._decided.is_set()
+
+    @property
+    def won(self) -> bool:
+        return self._won
+
+    def decide(self, won: bool):
+        """ Let the run go on when its Headspace was chosen, else cancel it """
+        self._won = won
+        self._decided.set()
+
+    def _check(self):
+        if self.decided and not self.won:
+            raise SpeculationCancelled(f"The router did not choose {self.headspace}")
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts, *, run_id: UUID, **kwargs: Any):
+        self._check()
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID,
+                      parent_run_id: Optional[UUID] = None, **kwargs: Any):
+        if serialized.get("name") not in self.read_only_tools:
+            self._decided.wait()
+        self._check()
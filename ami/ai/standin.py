@@ -0,0 +1,121 @@
+"""
+Local stand-in for an OpenAI compatible completions server
+
+Serves `/v1/completions` and `/v1/models` from the deterministic FakeLLM, so the `openai`
+LLM provider and the whole HTTP path of the pipeline can be exercised and measured without
+network access or a GPU. The requested model name picks the FakeLLM role ("router", "agent"
+or "summarizer", anything else answers as the agent).
+
+Usage:
+    python -m ami.ai.standin [--host 127.0.0.1] [--port 8080] [--latency 0.05] [--responses responses.json]
+
+Then point a role at it in config.yaml:
+    llm:
+      router:
+        provider: openai
+        base_url: http://127.0.0.1:8080/v1
+        model: router
+"""
+import sys
+import json
+import time
+import uuid
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ami.ai.llm import FakeLLM
+
+ROLES = ("router", "agent", "summarizer")
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """ Answers completions with the FakeLLM of the requested role, keeping connections alive """
+    protocol_version = "HTTP/1.1"
+    models: Dict[str, FakeLLM] = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, data: Dict):
+        self._send(status, json.dumps(data).encode("utf-8"))
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/v1/models":
+            return self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+        self._json(200, {"object": "list", "data": [ {"id": role, "object": "model", "owned_by": "ami"} for role in ROLES ]})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            return self._json(400, {"error": {"message": str(e)}})
+        if self.path.rstrip("/") != "/v1/completions":
+            return self._json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+        name = request.get("model", "agent")
+        model = self.models.get(name, self.models["agent"])
+        prompt = request.get("prompt", "")
+        prompt = prompt[0] if isinstance(prompt, list) else prompt
+        stop = request.get("stop")
+        stop = [stop] if isinstance(stop, str) else stop
+        completion = {
+            "id": f"cmpl-{uuid.uuid4().hex}",
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": name,
+        }
+
+        if not request.get("stream"):
+            text = model.invoke(prompt, stop=stop)
+            completion["choices"] = [{"text": text, "index": 0, "logprobs": None, "finish_reason": "stop"}]
+            completion["usage"] = {"prompt_tokens": len(prompt.split()), "completion_tokens": len(text.split()),
+                                   "total_tokens": len(prompt.split()) + len(text.split())}
+            return self._json(200, completion)
+
+        chunks = [ chunk for chunk in model.stream(prompt, stop=stop) ] + [""]
+        events = []
+        for i, chunk in enumerate(chunks):
+            choice = {"text": chunk, "index": 0, "logprobs": None, "finish_reason": "stop" if i == len(chunks) - 1 else None}
+            events.append(f"data: {json.dumps({**completion, 'choices': [choice]})}\n\n")
+        events.append("data: [DONE]\n\n")
+        self._send(200, "".join(events).encode("utf-8"), content_type="text/event-stream")
+
+def create_server(host: str="127.0.0.1", port: int=8080, latency: float=0.0,
+                  responses: Optional[Dict[str, str]]=None) -> ThreadingHTTPServer:
+    """ Create the stand-in server, port 0 picks a free port """
+    models = { role: FakeLLM(model=role, role=role, latency=latency, responses=responses or {}) for role in ROLES }
+    handler = type("Handler", (StandInHandler,), {"models": models})
+    return ThreadingHTTPServer((host, port), handler)
+
+def parse_args(argv: Optional[List[str]]=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m ami.ai.standin", description="Local OpenAI compatible stand-in LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds every completion takes")
+    parser.add_argument("--responses", type=Path, help="JSON object of prompt regex to canned response")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]]=None) -> int:
+    args = parse_args(argv)
+    responses = json.loads(args.responses.read_text(encoding="utf-8")) if args.responses else None
+    server = create_server(args.host, args.port, args.latency, responses)
+    print(f"Stand-in LLM server on http://{args.host}:{server.server_port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+""" Token, latency and cost accounting of every LLM call """
+import json
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from ami.base import Base
+from ami.tokens import TRUNCATIONS, count_tokens
+
+@dataclass
+class SiteUsage:
+    """
+    Accumulated usage of one call site.
+
+    Attributes:
+        calls (int): LLM calls made.
+        errors (int): Calls that raised.
+        prompt_tokens (int): Tokens sent.
+        completion_tokens (int): Tokens generated.
+        latency (float): Seconds spent in the calls.
+        max_latency (float): The slowest call in seconds.
+        cost (float): USD per the configured llm_prices.
+    """
+    calls: int = 0
+    errors: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+    max_latency: float = 0.0
+    cost: float = 0.0
+
+class LLMUsage(BaseCallbackHandler, Base):
+    """
+    LangChain callback recording the prompt and completion tokens, latency and cost of every LLM call.
+
+    Calls are grouped by call site, which is the `run_name` of the call: the role the client was
+    spawned for (router, agent, summarizer) unless the caller names it, e.g. comprehend_date.
+    Token counts come from the provider when it reports them and are counted otherwise. The
+    totals are written as JSON to `filepath` by `save`, where the Flask usage page reads them.
+    """
+
+    def __init__(self, filepath: Path, prices: Optional[Dict[str, Dict[str, float]]]=None):
+        """
+        Initialize the tracker.
+
+        Args:
+            filepath (Path): The JSON file the usage is saved to.
+            prices (Dict, optional): USD per million `prompt` and `completion` tokens by model name.
+        """
+        Base.__init__(self)
+        self.filepath = filepath
+        self.prices = prices or {}
+        self.sites: Dict[str, SiteUsage] = {}
+        self.started = datetime.now().isoformat(timespec="seconds")
+        self._runs: Dict[UUID, Tuple[str, str, float, int]] = {}
+        self._lock = Lock()
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any):
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model") or params.get("model_name") or "unknown"
+        site = kwargs.get("name") or "llm"
+        prompt_tokens = sum(count_tokens(prompt) for prompt in prompts)
+        with self._lock:
+            self._runs[run_id] = (site, model, time.perf_counter(), prompt_tokens)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        site, model, start, prompt_tokens = run
+        reported = (response.llm_output or {}).get("token_usage") or {}
+        text = "".join(generation.text for generations in response.generations for generation in generations)
+        self.record(site, model,
+                    reported.get("prompt_tokens", prompt_tokens),
+                    reported.get("completion_tokens", count_tokens(text)),
+                    time.perf_counter() - start)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        with self._lock:
+            run = self._runs.pop(run_id, None)
+            if run is not None:
+                self.sites.setdefault(run[0], SiteUsage()).errors += 1
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        price = self.prices.get(model, {})
+        return (prompt_tokens * price.get("prompt", 0.0) + completion_tokens * price.get("completion", 0.0)) / 1e6
+
+    def record(self, site: str, model: str, prompt_tokens: int, completion_tokens: int, latency: float):
+        """ Add a finished call to its call site """
+        cost = self.cost(model, prompt_tokens, completion_tokens)
+        with self._lock:
+            usage = self.sites.setdefault(site, SiteUsage())
+            usage.calls += 1
+            usage.prompt_tokens += prompt_tokens
+            usage.completion_tokens += completion_tokens
+            usage.latency += latency
+            usage.max_latency = max(usage.max_latency, latency)
+            usage.cost += cost
+        self.logs.debug(f"LLM {site} ({model}): {prompt_tokens} prompt + {completion_tokens} completion tokens in {latency:.2f}s, ${cost:.5f}")
+
+    def snapshot(self, **sections: Any) -> Dict[str, Any]:
+        """ The usage per call site, with the truncation counts and any further `sections` """
+        with self._lock:
+            sites = { site: asdict(usage) for site, usage in self.sites.items() }
+        for site, count in TRUNCATIONS.items():
+            sites.setdefault(site, asdict(SiteUsage()))["truncations"] = count
+        return {
+            "started": self.started,
+            "updated": datetime.now().isoformat(timespec="seconds"),
+            "sites": sites,
+            **sections,
+        }
+
+    def save(self, **sections: Any):
+        """ Write the snapshot to `filepath`, with `sections` such as the LLMGuard snapshot """
+        try:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.filepath, 'w', encoding='utf-8') as file:
+                json.dump(self.snapshot(**sections), file, indent=2)
+        except OSError as e:
+            self.logs.error(f"Could not save the LLM usage to {self.filepath}: {e}")
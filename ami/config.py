@@ -121,6 +121,100 @@ class Config:
         """ Get the enabled headspaces per the config as a tuple """
         return tuple(self.get('enabled_headspaces', default=[]))
 
+    @property
+    def embedding_router(self) -> bool:
+        """ Route queries with the local embedding router before asking the LLM """
+        return bool(self.get("embedding_router", default=True))
+
+    @property
+    def response_cache_ttl(self) -> float:
+        """ Seconds a cached read-only answer stays valid, 0 disables the response cache """
+        return float(self.get("response_cache_ttl", default=300))
+
+    @property
+    def speculative_agents(self) -> int:
+        """ Agents of the likeliest Headspaces started while the LLM router decides, 0 disables speculation """
+        return int(self.get("speculative_agents", default=0))
+
+    @property
+    def llm_roles(self) -> Dict[str, Dict[str, Any]]:
+        """ The provider, model and parameters of the LLM of each role, `llm.default` applies to every role """
+        roles = {
+            "router": {"provider": "together", "model": "mistralai/Mistral-7B-Instruct-v0.2", "max_tokens": 256},
+            "agent": {"provider": "together", "model": "meta-llama/Llama-3-8b-chat-hf", "max_tokens": 200},
+            "summarizer": {"provider": "together", "model": "meta-llama/Llama-3-8b-chat-hf", "max_tokens": 200},
+            "comprehend_date": {"provider": "together", "model": "mistralai/Mistral-7B-Instruct-v0.2", "max_tokens": 32},
+        }
+        configured = self.get("llm", default={})
+        return { role: {"temperature": 0, "top_k": 1, **default, **(configured.get("default") or {}), **(configured.get(role) or {})}
+                 for role, default in roles.items() }
+
+    @property
+    def llm_budget(self) -> Dict[str, int]:
+        """ Token caps of the prompt inputs, a cap of 0 disables it """
+        budget = {
+            "router_prompt_tokens": 2000,       # Routing examples are dropped beyond this
+            "history_tokens": 1000,             # The oldest conversation history is dropped beyond this
+            "observation_tokens": 1000,         # Tool observations are cut beyond this
+            "summarizer_prompt_tokens": 1500,   # The oldest agent steps are dropped from the summary beyond this
+        }
+        return { **budget, **self.get("llm_budget", default={}) }
+
+    @property
+    def attention(self) -> Dict[str, Any]:
+        """ Concurrency and timeouts of the tasks in the Attention event loop """
+        attention = {
+            "max_concurrency": 4,           # Scheduled coroutines running at once
+            "task_timeout": None,           # Default seconds a task may run, None for no limit
+            "interaction_timeout": 120,     # Seconds a query may take from the human message to the response
+            "interactive_deadline": 10,     # Seconds a voice turn may wait in the queue before it is dropped
+            "shutdown_timeout": 5,          # Seconds running tasks get to finish when stopping
+            "max_workers": 4,               # Threads running blocking calls, e.g. the Brain queries
+            "process_workers": 0,           # Processes for CPU-heavy work like the router embeddings, 0 uses the threads
+        }
+        return { **attention, **self.get("attention", default={}) }
+
+    @property
+    def llm_resilience(self) -> Dict[str, Any]:
+        """ Deadlines, retries and circuit breaker of the LLM calls, `deadlines` by call site """
+        resilience = {
+            "deadline": 30.0,           # Seconds an LLM call may take including its retries
+            "deadlines": {"router": 10.0, "summarizer": 15.0, "comprehend_date": 10.0},
+            "retries": 2,               # Retries of a failed call, with jittered exponential backoff
+            "backoff": 0.5,
+            "max_backoff": 4.0,
+            "failure_threshold": 5,     # Failures in a row that open the circuit of a provider model
+            "reset_timeout": 30.0,      # Seconds calls fail fast once the circuit opened
+        }
+        configured = self.get("llm_resilience", default={})
+        return { **resilience, **configured,
+                 "deadlines": { **resilience["deadlines"], **(configured.get("deadlines") or {}) } }
+
+    @property
+    def memory_tokens(self) -> int:
+        """ Token budget of each Headspace's conversation memory, 0 disables the memory """
+        return int(self.get("memory_tokens", default=600))
+
+    @property
+    def memory_dir(self) -> Path:
+        """ Where each Headspace persists its conversation memory """
+        return self.ai_dir / "resources" / "memory"
+
+    @property
+    def llm_prices(self) -> Dict[str, Dict[str, float]]:
+        """ USD per million `prompt` and `completion` tokens by model name, for the LLM usage cost """
+        return self.get("llm_prices", default={})
+
+    @property
+    def llm_usage_file(self) -> Path:
+        """ Where the LLM usage per call site is saved, shown on the /usage page """
+        return self.ai_dir / "logs" / "llm_usage.json"
+
+    @property
+    def router_cache_file(self) -> Path:
+        """ Where the Brain caches the fitted embedding router """
+        return self.ai_dir / "resources" / "router.pkl"
+
     @property
     def listening_patience(self):
         return self["listening_patience"]
@@ -137,6 +231,53 @@ class Config:
     def detection_threshold(self):
         return self.get("detection_threshold", default=0.5)
 
+    @property
+    def auto_calibrate(self) -> bool:
+        """ Tune the silence and detection thresholds from the ambient noise """
+        return bool(self.get("auto_calibrate", default=False))
+
+    @property
+    def calibration_file(self) -> Path:
+        """ Where the Ears persist their noise calibration """
+        return self.ai_dir / "resources" / "ears_calibration.yaml"
+
+    @property
+    def hot_words(self) -> List[Dict[str, Any]]:
+        """ The wake words as dicts of `name`, `threshold` and `headspace`, hot_word when unset """
+        hot_words = self.get("hot_words", default=[{"name": self.hot_word}])
+        return [ {
+                    "name": hot_word["name"],
+                    "threshold": hot_word.get("threshold", self.detection_threshold),
+                    "headspace": hot_word.get("headspace")
+                 } for hot_word in hot_words ]
+
+    @property
+    def vad_hangover(self) -> float:
+        """ Seconds of silence that end an utterance, by default 0.8 or the listening patience if shorter """
+        return float(self.get("vad_hangover", default=min(self.listening_patience or 0.8, 0.8)))
+
+    @property
+    def vad_model(self) -> Path|None:
+        """ Optional Silero VAD ONNX model within oww_models_dir, energy based VAD when unset """
+        if self["vad_model"] is None:
+            return None
+        return self.oww_models_dir / self["vad_model"]
+
+    @property
+    def stt_engine(self) -> str:
+        """ Speech to text engine used by the Ears, see ami.ears.stt.STT_ENGINES """
+        return self.get("stt_engine", default="google")
+
+    @property
+    def stt_model(self) -> str|None:
+        """ Model name or directory (within oww_models_dir) for local STT engines """
+        return self["stt_model"]
+
+    @property
+    def ears_process(self) -> bool:
+        """ Run microphone capture and hotword detection in a dedicated process """
+        return bool(self.get("ears_process", default=False))
+
 #---------------- HEADSPACE SPECIFIC
 
     @property
@@ -0,0 +1,7 @@
+""" __init.py """
+
+from .buffer import AmplitudeStats, AudioRingBuffer, GrowableAudioBuffer
+from .calibration import NoiseCalibrator
+from .ears import Ears, InvalidModel, ListeningState, ListeningTimeout
+from .process import WakeWordProcess
+from .wakeword import Detection, HotWord
@@ -0,0 +1,231 @@
+"""
+Offline wake word and endpointing benchmark for the Ears
+
+Replays a corpus of recordings through the same `Ears.listen` path used with the microphone
+(openWakeWord `Model.predict`, the VAD endpointer and the STT stream) and reports detection
+latency, false accepts, per-chunk CPU time and time-to-transcript. Runs headless.
+
+Corpus layout:
+    <corpus>/positive/*.wav     Recordings that contain the hot word followed by a command
+    <corpus>/negative/*.wav     Recordings without the hot word (conversation, TV, silence)
+    <corpus>/labels.csv         Optional. `file,wake_end,speech_end` in seconds for positive files
+
+Usage:
+    python -m ami.ears.benchmark <corpus> [--detection-threshold 0.5] [--silence-threshold 4000]
+                                          [--stt] [--json results.json]
+                                          [--max-chunk-ms 40] [--max-false-accepts 1] [--min-recall 0.9]
+
+The process exits with status 1 when one of the --max/--min limits is not met, so it can gate CI.
+"""
+import csv
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from ami.ears.ears import Ears
+from ami.ears.source import WavFileSource
+from ami.ears.stt import NullSTT
+
+class ReplaySource(WavFileSource):
+    """ WavFileSource that records the CPU and wall time spent on each chunk between reads """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chunk_cpu: List[float] = []
+        self.chunk_wall: List[float] = []
+        self._last_cpu: Optional[float] = None
+        self._last_wall: Optional[float] = None
+
+    @property
+    def seconds(self) -> float:
+        """ Position of the replay in seconds of audio """
+        return self.position / self.sample_rate
+
+    def read(self) -> np.ndarray:
+        cpu, wall = time.thread_time(), time.perf_counter()
+        if self._last_cpu is not None:
+            self.chunk_cpu.append(cpu - self._last_cpu)
+            self.chunk_wall.append(wall - self._last_wall)
+        chunk = super().read()
+        self._last_cpu, self._last_wall = time.thread_time(), time.perf_counter()
+        return chunk
+
+class EventRecorder:
+    """ Stands in for TemporalCommunications and timestamps everything the Ears publish """
+
+    def __init__(self):
+        self.source: Optional[ReplaySource] = None
+        self.events: List[tuple] = []
+        self.interaction_finished: Optional[Callable[[], None]] = None
+
+    def publish(self, event, data=None):
+        position = self.source.seconds if self.source else 0.0
+        self.events.append((event, position, time.perf_counter(), data))
+        if event in ("ears.recorder_callback", "ears.timeout") and self.interaction_finished:
+            self.interaction_finished()     # What the GUI does once the popup closes
+
+    def first(self, event: str, data=None) -> Optional[tuple]:
+        """ The first recorded occurrence of an event, optionally matching its data """
+        for recorded in self.events:
+            if recorded[0] == event and (data is None or recorded[3] == data):
+                return recorded
+        return None
+
+    def count(self, event: str) -> int:
+        return sum(1 for recorded in self.events if recorded[0] == event)
+
+@dataclass
+class FileResult:
+    """ Measurements for one replayed recording """
+    name: str
+    positive: bool
+    duration: float
+    detections: int = 0
+    detection_at: Optional[float] = None
+    detection_latency: Optional[float] = None
+    endpoint_delay: Optional[float] = None
+    stt_time: Optional[float] = None
+    time_to_transcript: Optional[float] = None
+    transcript: Optional[str] = None
+    chunk_cpu: List[float] = field(default_factory=list, repr=False)
+
+def load_labels(corpus: Path) -> Dict[str, Dict[str, float]]:
+    """ Read `labels.csv` from the corpus if it exists """
+    labels_file = corpus / "labels.csv"
+    if not labels_file.is_file():
+        return {}
+    with labels_file.open("r", encoding="utf-8") as f:
+        return { row["file"]: { key: float(value) for key, value in row.items() if key != "file" and value }
+                 for row in csv.DictReader(f) }
+
+def run_file(ears: Ears, filepath: Path, positive: bool, labels: Dict[str, float]) -> FileResult:
+    """ Replay one recording through Ears.listen """
+    source = ReplaySource(filepath, ears.CHUNK)
+    recorder = EventRecorder()
+    recorder.source = source
+    ears.source = source
+    ears.temp_comms = recorder
+
+    def interaction_finished():
+        if positive:
+            ears.running = False        # Only the first interaction of a positive is measured
+        else:
+            ears.resume()
+    recorder.interaction_finished = interaction_finished
+
+    ears.running = True
+    ears.listen()
+
+    result = FileResult(name=filepath.name,
+                        positive=positive,
+                        duration=source.duration,
+                        detections=recorder.count("ears.hotword_detected"),
+                        chunk_cpu=source.chunk_cpu)
+
+    detected = recorder.first("ears.hotword_detected")
+    if detected is not None:
+        result.detection_at = detected[1]
+        if "wake_end" in labels:
+            result.detection_latency = detected[1] - labels["wake_end"]
+
+    endpoint = recorder.first("gui.popup.loading_message", "Transcribing Audio")
+    transcribed = recorder.first("ears.recorder_callback")
+    if endpoint is not None and transcribed is not None:
+        result.stt_time = transcribed[2] - endpoint[2]
+        result.transcript = transcribed[3]
+        if "speech_end" in labels:
+            result.endpoint_delay = endpoint[1] - labels["speech_end"]
+            result.time_to_transcript = result.endpoint_delay + result.stt_time
+
+    return result
+
+def summarize(results: List[FileResult]) -> Dict[str, Optional[float]]:
+    """ Aggregate the per file results """
+    mean = lambda values : float(np.mean(values)) if values else None
+    positives = [ r for r in results if r.positive ]
+    negatives = [ r for r in results if not r.positive ]
+    chunk_ms = np.array([ cpu for r in results for cpu in r.chunk_cpu ]) * 1000
+    negative_hours = sum(r.duration for r in negatives) / 3600
+
+    return {
+        "positives": len(positives),
+        "negatives": len(negatives),
+        "recall": (sum(1 for r in positives if r.detections) / len(positives)) if positives else None,
+        "false_accepts": sum(r.detections for r in negatives),
+        "false_accepts_per_hour": (sum(r.detections for r in negatives) / negative_hours) if negative_hours else None,
+        "detection_latency": mean([ r.detection_latency for r in positives if r.detection_latency is not None ]),
+        "endpoint_delay": mean([ r.endpoint_delay for r in positives if r.endpoint_delay is not None ]),
+        "stt_time": mean([ r.stt_time for r in positives if r.stt_time is not None ]),
+        "time_to_transcript": mean([ r.time_to_transcript for r in positives if r.time_to_transcript is not None ]),
+        "chunk_cpu_ms_mean": float(chunk_ms.mean()) if chunk_ms.size else None,
+        "chunk_cpu_ms_p95": float(np.percentile(chunk_ms, 95)) if chunk_ms.size else None,
+        "chunk_cpu_ms_max": float(chunk_ms.max()) if chunk_ms.size else None,
+        "realtime_factor": (chunk_ms.sum() / 1000 / sum(r.duration for r in results)) if chunk_ms.size else None,
+    }
+
+def parse_args(argv: Optional[List[str]]=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m ami.ears.benchmark", description="Offline Ears benchmark")
+    parser.add_argument("corpus", type=Path, help="Directory with positive/ and negative/ WAV recordings")
+    parser.add_argument("--detection-threshold", type=float, help="Override the threshold of every hot word")
+    parser.add_argument("--silence-threshold", type=float, help="Override SILENCE_THRESHOLD")
+    parser.add_argument("--stt", action="store_true", help="Use the configured STT engine instead of skipping transcription")
+    parser.add_argument("--json", type=Path, help="Write the per file results and summary to this file")
+    parser.add_argument("--max-chunk-ms", type=float, help="Fail if the p95 per-chunk CPU time is above this")
+    parser.add_argument("--max-false-accepts", type=float, help="Fail if false accepts per hour are above this")
+    parser.add_argument("--min-recall", type=float, help="Fail if the hot word recall is below this")
+    return parser.parse_args(argv)
+
+def main(argv: Optional[List[str]]=None) -> int:
+    args = parse_args(argv)
+    labels = load_labels(args.corpus)
+
+    ears = Ears(temp_comms=EventRecorder())
+    ears.reset_calibration()            # Replays are measured with the configured thresholds
+    if args.detection_threshold is not None:
+        ears.DETECTION_THRESHOLD = args.detection_threshold
+        ears.HOT_WORDS = [ hotword._replace(threshold=args.detection_threshold) for hotword in ears.HOT_WORDS ]
+    if args.silence_threshold is not None:
+        ears.SILENCE_THRESHOLD = args.silence_threshold
+    if not args.stt:
+        ears.stt = NullSTT()
+
+    results = []
+    for subdir, positive in (("positive", True), ("negative", False)):
+        for filepath in sorted((args.corpus / subdir).glob("*.wav")):
+            result = run_file(ears, filepath, positive, labels.get(filepath.name, {}))
+            results.append(result)
+            print(f"{'+' if positive else '-'} {result.name:<40} detections={result.detections} "
+                  f"at={result.detection_at} stt={result.stt_time} text={result.transcript!r}")
+
+    ears.stop()
+
+    summary = summarize(results)
+    summary.update(detection_threshold=ears.DETECTION_THRESHOLD, silence_threshold=ears.SILENCE_THRESHOLD)
+    print()
+    for key, value in summary.items():
+        print(f"{key:>24}: {value:.4f}" if isinstance(value, float) else f"{key:>24}: {value}")
+
+    if args.json:
+        records = [ {k: v for k, v in asdict(r).items() if k != "chunk_cpu"} for r in results ]
+        args.json.write_text(json.dumps({"summary": summary, "files": records}, indent=2), encoding="utf-8")
+
+    failures = []
+    if args.max_chunk_ms is not None and (summary["chunk_cpu_ms_p95"] or 0) > args.max_chunk_ms:
+        failures.append(f"p95 chunk CPU {summary['chunk_cpu_ms_p95']:.2f}ms > {args.max_chunk_ms}ms")
+    if args.max_false_accepts is not None and (summary["false_accepts_per_hour"] or 0) > args.max_false_accepts:
+        failures.append(f"false accepts {summary['false_accepts_per_hour']:.2f}/h > {args.max_false_accepts}/h")
+    if args.min_recall is not None and (summary["recall"] or 0) < args.min_recall:
+        failures.append(f"recall {summary['recall']} < {args.min_recall}")
+
+    for failure in failures:
+        print(f"FAILED: {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+""" Preallocated audio buffers used by the Ears """
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+class AmplitudeStats(NamedTuple):
+    """ Amplitude statistics of the absolute sample values held by an AudioRingBuffer """
+    minimum: int
+    maximum: int
+    mean: float
+    std: float
+
+class AudioRingBuffer:
+    """
+    Fixed-size circular buffer of int16 audio chunks with running amplitude statistics.
+
+    The buffer is allocated once and written chunk by chunk, so the hot read loop never
+    allocates or shifts a list. Per-chunk sums of |x| and x^2 are kept as exact integers and
+    folded into running totals as chunks are written and evicted, which makes `stats` cost
+    the same no matter how much audio the buffer holds.
+
+    Attributes:
+        chunk_size (int): The number of samples in every chunk written to the buffer.
+        capacity (int): The number of chunks the buffer can hold.
+    """
+
+    def __init__(self, seconds: float, chunk_size: int, sample_rate: int=16000, buffer: Optional[np.ndarray]=None):
+        """
+        Allocate the buffer.
+
+        Args:
+            seconds (float): The amount of audio history to hold.
+            chunk_size (int): The number of samples per chunk.
+            sample_rate (int, optional): The sample rate of the audio. Defaults to 16000.
+            buffer (np.ndarray, optional): A preallocated (capacity, chunk_size) int16 array to
+                hold the audio in, e.g. backed by shared memory. Its length overrides `seconds`.
+        """
+        self.chunk_size = chunk_size
+
+        if buffer is None:
+            self.capacity = max(1, int(seconds * sample_rate) // chunk_size)
+            self._audio = np.zeros((self.capacity, chunk_size), dtype=np.int16)
+        else:
+            if buffer.dtype != np.int16 or buffer.ndim != 2 or buffer.shape[1] != chunk_size:
+                raise ValueError(f"buffer must be a (capacity, {chunk_size}) int16 array")
+            self.capacity = buffer.shape[0]
+            self._audio = buffer
+
+        self._scratch = np.zeros(chunk_size, dtype=np.int64)
+
+        self._chunk_min = np.zeros(self.capacity, dtype=np.int64)
+        self._chunk_max = np.zeros(self.capacity, dtype=np.int64)
+        self._chunk_sum = np.zeros(self.capacity, dtype=np.int64)
+        self._chunk_sum_sq = np.zeros(self.capacity, dtype=np.int64)
+
+        self._total_sum = 0
+        self._total_sum_sq = 0
+        self._head = 0
+        self._count = 0
+
+    def __len__(self) -> int:
+        """ Number of chunks currently held """
+        return self._count
+
+    @property
+    def full(self) -> bool:
+        """ True once the buffer has wrapped around at least once """
+        return self._count == self.capacity
+
+    def write(self, chunk: np.ndarray) -> None:
+        """
+        Write one chunk into the buffer, evicting the oldest chunk when full.
+
+        Args:
+            chunk (np.ndarray): int16 samples, exactly `chunk_size` long.
+        """
+        slot = self._head
+        if self._count == self.capacity:
+            self._total_sum -= int(self._chunk_sum[slot])
+            self._total_sum_sq -= int(self._chunk_sum_sq[slot])
+        else:
+            self._count += 1
+
+        self._audio[slot] = chunk
+
+        # int64 scratch so abs(-32768) and the squared sums cannot overflow
+        magnitude = np.abs(self._audio[slot], out=self._scratch, dtype=np.int64)
+        chunk_sum = int(magnitude.sum())
+        chunk_sum_sq = int(np.dot(magnitude, magnitude))
+
+        self._chunk_min[slot] = magnitude.min()
+        self._chunk_max[slot] = magnitude.max()
+        self._chunk_sum[slot] = chunk_sum
+        self._chunk_sum_sq[slot] = chunk_sum_sq
+        self._total_sum += chunk_sum
+        self._total_sum_sq += chunk_sum_sq
+
+        self._head = (slot + 1) % self.capacity
+
+    @property
+    def last_rms(self) -> float:
+        """ RMS of the most recently written chunk, from the sums kept by `write` """
+        if self._count == 0:
+            return 0.0
+        return float(np.sqrt(self._chunk_sum_sq[(self._head - 1) % self.capacity] / self.chunk_size))
+
+    def stats(self) -> AmplitudeStats:
+        """ Return the amplitude statistics for everything currently held in the buffer """
+        if self._count == 0:
+            return AmplitudeStats(0, 0, 0.0, 0.0)
+
+        n_samples = self._count * self.chunk_size
+        mean = self._total_sum / n_samples
+        variance = max(self._total_sum_sq / n_samples - mean * mean, 0.0)
+        return AmplitudeStats(
+            minimum=int(self._chunk_min[:self._count].min()),
+            maximum=int(self._chunk_max[:self._count].max()),
+            mean=mean,
+            std=float(np.sqrt(variance))
+        )
+
+    def latest(self, n_chunks: int) -> np.ndarray:
+        """
+        Return a contiguous copy of the most recent chunks, oldest first.
+
+        Args:
+            n_chunks (int): How many chunks to return; clipped to what the buffer holds.
+
+        Returns:
+            np.ndarray: A 1-D int16 array of `n_chunks * chunk_size` samples.
+        """
+        n_chunks = min(n_chunks, self._count)
+        slots = (np.arange(self._head - n_chunks, self._head)) % self.capacity
+        return self._audio[slots].reshape(-1)
+
+    def clear(self) -> None:
+        """ Forget all held audio without releasing the allocation """
+        self._chunk_min[:] = 0
+        self._chunk_max[:] = 0
+        self._chunk_sum[:] = 0
+        self._chunk_sum_sq[:] = 0
+        self._total_sum = 0
+        self._total_sum_sq = 0
+        self._head = 0
+        self._count = 0
+
+class GrowableAudioBuffer:
+    """
+    Contiguous int16 buffer an utterance is appended to chunk by chunk.
+
+    The allocation doubles when it runs out and is kept by `clear`, so once it has grown to the
+    longest utterance recording never allocates. `view` exposes the audio without copying it.
+    """
+
+    def __init__(self, seconds: float=10, sample_rate: int=16000):
+        """
+        Allocate the buffer.
+
+        Args:
+            seconds (float, optional): The amount of audio to allocate for up front. Defaults to 10.
+            sample_rate (int, optional): The sample rate of the audio. Defaults to 16000.
+        """
+        self._audio = np.zeros(max(1, int(seconds * sample_rate)), dtype=np.int16)
+        self._length = 0
+
+    def __len__(self) -> int:
+        """ Number of samples currently held """
+        return self._length
+
+    @property
+    def capacity(self) -> int:
+        """ Number of samples the current allocation can hold """
+        return len(self._audio)
+
+    def append(self, chunk: np.ndarray) -> None:
+        """ Copy int16 samples to the end of the buffer, growing the allocation if needed """
+        end = self._length + len(chunk)
+        if end > len(self._audio):
+            grown = np.zeros(max(end, 2 * len(self._audio)), dtype=np.int16)
+            grown[:self._length] = self._audio[:self._length]
+            self._audio = grown
+
+        self._audio[self._length:end] = chunk
+        self._length = end
+
+    def view(self) -> np.ndarray:
+        """ The samples held, as a view into the buffer valid until the next `append` or `clear` """
+        return self._audio[:self._length]
+
+    def clear(self) -> None:
+        """ Forget the held audio without releasing the allocation """
+        self._length = 0
@@ -0,0 +1,174 @@
+""" Ambient noise calibration of the Ears thresholds """
+import math
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import yaml
+
+from ami.base import Base
+from ami.ears.vad import CREST_FACTOR
+
+class NoiseCalibrator(Base):
+    """
+    Tracks the noise floor of the capture stream and tunes the Ears thresholds from it.
+
+    Every chunk the Ears read while they aren't recording updates exponential moving statistics
+    of the chunk RMS and, while listening for the hotword, of the best hotword score. Chunks
+    well above the noise floor (someone talking, a door) are clipped to the gate before they
+    are averaged, so the floor follows the room and not the conversation in it. The tuned
+    thresholds are persisted and loaded again on start, so a restart doesn't begin from the
+    configured guess.
+
+    Attributes:
+        filepath (Path): The YAML file the calibration is persisted to.
+        noise_rms (float | None): Moving average of the ambient chunk RMS, None until the first chunk.
+        noise_std (float): Moving standard deviation of the ambient chunk RMS.
+        score_mean (float): Moving average of the best hotword score without a detection.
+        score_std (float): Moving standard deviation of that score.
+        frames (int): Chunks seen since the calibration was (re)started.
+    """
+    SPEECH_GATE = 3.0           # Chunks louder than this many std above the floor are clipped to it
+    RMS_MARGIN = 3.0            # Speech threshold in std above the noise floor
+    SCORE_MARGIN = 6.0          # Detection threshold in std above the background hotword score
+    MAX_DETECTION = 0.9
+
+    def __init__(self,
+                 filepath: Path,
+                 silence_threshold: float,
+                 detection_threshold: float,
+                 time_constant: float=30.0,
+                 chunk_seconds: float=0.08,
+                 warmup: float=5.0,
+                 save_interval: float=300.0):
+        """
+        Initialize the calibrator, loading the persisted calibration if there is one.
+
+        Args:
+            filepath (Path): The YAML file the calibration is persisted to.
+            silence_threshold (float): The configured `min_silence_threshold` (peak amplitude).
+                The tuned value stays between a quarter and twice this.
+            detection_threshold (float): The configured detection threshold, the tuned value never goes below it.
+            time_constant (float, optional): Seconds of audio the moving statistics average over. Defaults to 30.
+            chunk_seconds (float, optional): Seconds of audio per chunk. Defaults to 0.08.
+            warmup (float, optional): Seconds of audio before the statistics are trusted. Defaults to 5.
+            save_interval (float, optional): Seconds between tunings. Defaults to 300.
+        """
+        super().__init__()
+        self.filepath = filepath
+        self.configured_silence = silence_threshold
+        self.configured_detection = detection_threshold
+        self.alpha = min(1.0, chunk_seconds / time_constant)
+        self.warmup_frames = int(warmup / chunk_seconds)
+        self.save_interval = save_interval
+
+        self.noise_rms: Optional[float] = None
+        self.noise_var = 0.0
+        self.score_mean = 0.0
+        self.score_var = 0.0
+        self.frames = 0
+        self._last_tuning = time.monotonic()
+
+        self.load()
+
+    @property
+    def noise_std(self) -> float:
+        return math.sqrt(self.noise_var)
+
+    @property
+    def score_std(self) -> float:
+        return math.sqrt(self.score_var)
+
+    @property
+    def ready(self) -> bool:
+        """ True once the statistics cover enough audio to be trusted """
+        return self.noise_rms is not None and self.frames >= self.warmup_frames
+
+    @property
+    def rms_threshold(self) -> float:
+        """ RMS above which a chunk is speech, for the VoiceActivityDetector """
+        threshold = self.noise_rms + self.RMS_MARGIN * self.noise_std
+        configured = self.configured_silence / CREST_FACTOR
+        return min(max(threshold, configured / 4), configured * 2)
+
+    @property
+    def silence_threshold(self) -> float:
+        """ The tuned `min_silence_threshold` as a peak amplitude """
+        return self.rms_threshold * CREST_FACTOR
+
+    @property
+    def detection_threshold(self) -> float:
+        """ The tuned detection threshold, raised when the background scores high """
+        threshold = self.score_mean + self.SCORE_MARGIN * self.score_std
+        return min(max(threshold, self.configured_detection), self.MAX_DETECTION)
+
+    @staticmethod
+    def _ema(mean: float, var: float, value: float, alpha: float):
+        """ Exponentially weighted mean and variance """
+        delta = value - mean
+        mean += alpha * delta
+        var = (1 - alpha) * (var + alpha * delta * delta)
+        return mean, var
+
+    def update(self, rms: float, score: Optional[float]=None):
+        """
+        Add an ambient chunk to the statistics.
+
+        Args:
+            rms (float): The RMS of the chunk.
+            score (float, optional): The best hotword score of the chunk, when it was scored and not detected.
+        """
+        self.frames += 1
+        if self.noise_rms is None:
+            self.noise_rms = rms
+            return
+
+        alpha = self.alpha
+        if self.frames > self.warmup_frames:
+            rms = min(rms, self.noise_rms + self.SPEECH_GATE * self.noise_std)
+        else:
+            alpha = max(alpha, 1 / self.frames)
+        self.noise_rms, self.noise_var = self._ema(self.noise_rms, self.noise_var, rms, alpha)
+
+        if score is not None:
+            self.score_mean, self.score_var = self._ema(self.score_mean, self.score_var, score, self.alpha)
+
+    def due(self) -> bool:
+        """ True when the thresholds should be tuned and persisted again """
+        return self.ready and time.monotonic() - self._last_tuning >= self.save_interval
+
+    def save(self):
+        """ Persist the statistics and the tuned thresholds """
+        self._last_tuning = time.monotonic()
+        data = {
+            "updated": datetime.now().isoformat(timespec="seconds"),
+            "min_silence_threshold": round(self.silence_threshold),
+            "detection_threshold": round(self.detection_threshold, 3),
+            "noise_rms": round(self.noise_rms, 1),
+            "noise_std": round(self.noise_std, 1),
+            "score_mean": round(self.score_mean, 4),
+            "score_std": round(self.score_std, 4),
+        }
+        try:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.filepath, 'w', encoding='utf-8') as file:
+                yaml.safe_dump(data, file, sort_keys=False)
+        except OSError as e:
+            self.logs.error(f"Could not save the Ears calibration to {self.filepath}: {e}")
+
+    def load(self):
+        """ Start from the persisted statistics if there are any """
+        if not self.filepath.is_file():
+            return
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as file:
+                data = yaml.safe_load(file) or {}
+            self.noise_rms = float(data["noise_rms"])
+            self.noise_var = float(data.get("noise_std", 0.0)) ** 2
+            self.score_mean = float(data.get("score_mean", 0.0))
+            self.score_var = float(data.get("score_std", 0.0)) ** 2
+            self.frames = self.warmup_frames
+            self.logs.info(f"Loaded the Ears calibration from {data.get('updated')}: noise_rms={self.noise_rms:.0f}")
+        except (OSError, yaml.YAMLError, KeyError, TypeError, ValueError) as e:
+            self.logs.error(f"Ignoring the Ears calibration in {self.filepath}: {e}")
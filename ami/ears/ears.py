@@ -0,0 +1,419 @@
+""" eary.py """
+import traceback
+from enum import Enum
+from pathlib import Path
+from threading import Event, Thread
+from typing import List, Optional, Tuple
+
+import numpy as np
+from openwakeword.model import Model
+
+from ami.base import Base
+from ami.config import Config
+from ami.ears.buffer import AudioRingBuffer
+from ami.ears.calibration import NoiseCalibrator
+from ami.ears.process import WakeWordProcess
+from ami.ears.source import AudioSource, EndOfAudio, MicrophoneSource
+from ami.ears.stt import SpeechToText, TranscriptionStream, get_stt_engine
+from ami.ears.vad import CREST_FACTOR, VadEvent, VoiceActivityDetector
+from ami.ears import wakeword
+from ami.ears.wakeword import Detection, HotWord, InvalidModel, best_prediction, top_score
+
+SENSITIVITY = 0.3
+
+class ListeningTimeout(Exception):
+    """Exception raised when listening timeout occurs."""
+    pass
+
+class ListeningState(Enum):
+    """ What the Ears do with the audio of the capture session """
+    IDLE = "idle"               # No capture session
+    WAKE = "wake"               # Scoring every chunk for the hotword
+    RECORDING = "recording"     # Endpointing and transcribing a command
+    PAUSED = "paused"           # Reading audio without reacting to it until resumed
+
+class Ears(Base):
+    """
+    A class for handling audio input, hotword detection, and speech-to-text conversion.
+
+    This class uses OpenWakeWord for hotword detection and the speech to text engine
+    configured by `stt_engine` for speech-to-text conversion. It runs in a separate thread to continuously listen
+    for a specified hotword and then record and transcribe subsequent audio input.
+
+    Attributes:
+        temp_comms (TempComms): An instance of the TempComms class for communication.
+        source (AudioSource | None): Audio to listen to instead of the microphone, e.g. a WAV replay.
+        thread (Thread): A thread object for running the hotword detection.
+        stt (SpeechToText): The speech to text engine, loaded once and kept warm.
+        model (openwakeword.Model | None): An OpenWakeWord Model instance, None while detection runs in a process.
+        wakeword_process (WakeWordProcess | None): The capture and detection process when `ears_process` is set.
+        running (bool): A flag indicating whether the capture session is running.
+        state (ListeningState): What the capture session does with the audio it reads.
+        vad (VoiceActivityDetector): The endpointer deciding when the Human has stopped speaking.
+        calibrator (NoiseCalibrator | None): Tracks the ambient noise when `auto_calibrate` is set.
+        HOT_WORDS (List[HotWord]): The wake words, each with its own threshold and optional Headspace.
+        SILENCE_THRESHOLD (int): The minimum peak amplitude that determines if there is silence.
+
+    Methods:
+        get_model: Get or download the hotword detection model.
+        string_from_audio: Convert audio data to text.
+        detect_hotword: Block until the hotword is detected.
+        record: Record and transcribe the command following the hotword.
+        listen: Run the capture session.
+        pause: Stop reacting to the hotword, keeping the stream open.
+        resume: Listen for the hotword again.
+        start_listening: Start the capture session, or resume it.
+        stop: Stop the capture session.
+    """
+    def __init__(self, temp_comms, source: Optional[AudioSource]=None):
+        """
+        Initialize the Ears class.
+
+        Args:
+            temp_comms: An instance of the TempComms class for communication.
+            source (AudioSource, optional): Audio to listen to instead of opening the microphone.
+
+        This method sets up the initial state of the Ears object, including:
+        - Configuring audio processing parameters
+        - Loading the speech to text engine and the voice activity detector
+        - Loading the hotword detection model
+        - Initializing various attributes for audio processing and recording
+        """
+        super().__init__()
+        self.CHUNK = 1280
+
+        self.temp_comms = temp_comms
+        self.source = source
+        self.thread = None
+
+        config = Config()
+        self.stt: SpeechToText = get_stt_engine(config.stt_engine, config.oww_models_dir, config.stt_model)
+        self.logs.info(f"STT engine is {self.stt.name}")
+
+        self.DETECTION_THRESHOLD = config.detection_threshold
+        self.LISTENING_TIMEOUT = config.listening_timeout
+        self.SILENCE_THRESHOLD = config.silence_threshold
+        self.logs.info(f"DETECTION_THRESHOLD is {self.DETECTION_THRESHOLD}")
+        self.logs.info(f"SILENCE_THRESHOLD is {self.SILENCE_THRESHOLD}")
+
+        self.HOT_WORDS: List[HotWord] = [ HotWord(**hot_word) for hot_word in config.hot_words ]
+        self.logs.info(f"HOT_WORDS are {', '.join(f'{hw.name}>{hw.threshold}' for hw in self.HOT_WORDS)}")
+        self._configured_hot_words = list(self.HOT_WORDS)
+        self._configured_silence_threshold = self.SILENCE_THRESHOLD
+
+        self.model = None
+        self.wakeword_process = None
+        self.calibrator = None
+        if config.auto_calibrate:
+            self.calibrator = NoiseCalibrator(
+                config.calibration_file,
+                self.SILENCE_THRESHOLD,
+                self.DETECTION_THRESHOLD,
+                chunk_seconds=self.CHUNK / 16000
+            )
+            if self.calibrator.ready:
+                self.apply_calibration()
+
+        self.vad = VoiceActivityDetector(
+            self.CHUNK,
+            hangover=config.vad_hangover,
+            timeout=self.LISTENING_TIMEOUT,
+            model_path=config.vad_model
+        )
+        self.logs.info(f"VAD hangover is {config.vad_hangover} seconds")
+
+        if config.ears_process and source is None:
+            self.wakeword_process = WakeWordProcess(self.CHUNK, config.oww_models_dir, self.HOT_WORDS,
+                                                    on_ambient=self.calibrate_ambient)
+        if self.in_process:
+            self.logs.info("Hotword detection runs in a dedicated process")
+        else:
+            self.model = self.load_hotword_model()
+
+        self.running = False
+        self.state = ListeningState.IDLE
+        self._resumed = Event()
+
+    @property
+    def in_process(self) -> bool:
+        """ Whether the WakeWordProcess detects the hotword, only while no `source` replaces the microphone """
+        return self.wakeword_process is not None and self.source is None
+
+    def load_hotword_model(self) -> Model:
+        """ Load the model of the configured hot words for detection in this process """
+        config = Config()
+        return self.get_model(
+            config.oww_models_dir,
+            [ hotword.name for hotword in self.HOT_WORDS ],
+            melspec_model_path=str(wakeword.get_melspec_filepath(config.oww_models_dir)),
+            embedding_model_path=str(wakeword.get_embeddings_filepath(config.oww_models_dir))
+        )
+
+    def get_model(self, models_dir: Path, hotwords: List[str], **kwargs) -> Model:
+        """
+        Get or download the hotword detection models, loaded into a single Model.
+
+        Args:
+            models_dir (Path): The directory where models are stored.
+            hotwords (List[str]): The names of the hotwords to detect.
+
+        Returns:
+            Model: An instance of the OpenWakeWord Model class.
+
+        Raises:
+            InvalidModel: If the specified hotword is not valid.
+
+        See `ami.ears.wakeword.get_model`.
+        """
+        try:
+            return wakeword.get_model(models_dir, hotwords, **kwargs)
+        except InvalidModel as e:
+            self.logs.error(str(e))
+            raise
+
+    def string_from_audio(self, audio_data: np.ndarray) -> str:
+        """ Convert the audio data to text """
+        self.logs.info("Audio to text in progress...")
+        self.temp_comms.publish("gui.popup.loading_message", "Transcribing Audio")
+        return self.stt(audio_data)
+
+    def open_source(self) -> AudioSource:
+        """ Return the configured audio source, opening the microphone if there isn't one """
+        if self.source is not None:
+            return self.source
+        if self.in_process:
+            return self.wakeword_process.source()
+        return MicrophoneSource(self.CHUNK)
+
+    def apply_calibration(self):
+        """ Use the calibrated thresholds, hot words keep their configured threshold if it is higher """
+        self.SILENCE_THRESHOLD = self.calibrator.silence_threshold
+        detection_threshold = self.calibrator.detection_threshold
+        self.HOT_WORDS = [ hotword._replace(threshold=max(hotword.threshold, detection_threshold))
+                           for hotword in self._configured_hot_words ]
+        self.logs.info(f"Calibrated SILENCE_THRESHOLD to {self.SILENCE_THRESHOLD:.0f}, detection threshold to {detection_threshold:.2f}")
+        if self.wakeword_process is not None:
+            self.wakeword_process.set_hotwords(self.HOT_WORDS)
+
+    def reset_calibration(self):
+        """ Stop calibrating and go back to the configured thresholds, e.g. for reproducible benchmarks """
+        self.calibrator = None
+        self.SILENCE_THRESHOLD = self._configured_silence_threshold
+        self.HOT_WORDS = list(self._configured_hot_words)
+        if self.wakeword_process is not None:
+            self.wakeword_process.set_hotwords(self.HOT_WORDS)
+
+    def calibrate(self, rms: float, score: Optional[float]=None):
+        """ Feed an ambient chunk to the calibrator, periodically tuning and persisting the thresholds """
+        if self.calibrator is None:
+            return
+        self.calibrator.update(rms, score)
+        if self.calibrator.due():
+            self.apply_calibration()
+            self.calibrator.save()
+
+    def calibrate_ambient(self, samples: List[Tuple[float, float]]):
+        """ Feed the ambient levels the WakeWordProcess measured to the calibrator """
+        for rms, score in samples:
+            self.calibrate(rms, score)
+
+    def detect_hotword(self, audio_source: AudioSource, history: AudioRingBuffer) -> Optional[Detection]:
+        """
+        Block until the hotword is detected while the Ears are in the WAKE state.
+
+        In process mode the WakeWordProcess does the scoring and `audio_source` is moved to the
+        chunk after the detection, the ambient levels it sends while waiting go to the calibrator
+        through `calibrate_ambient`. Otherwise every chunk is read into `history`, also while
+        PAUSED so the stream never overruns and the noise floor stays current, and only scored
+        in the WAKE state. The model is reset whenever the Ears (re-)enter the WAKE state. Chunks
+        without a detection are ambient noise for the calibrator.
+
+        Returns:
+            Detection | None: The detection, or None when `self.running` was cleared.
+        """
+        armed = False
+
+        if self.in_process:
+            while self.running:
+                if self.state is not ListeningState.WAKE:
+                    armed = False
+                    self._resumed.wait(timeout=0.5)
+                    continue
+                if not armed:
+                    self.wakeword_process.arm()
+                    armed = True
+
+                detection = self.wakeword_process.wait(timeout=0.5)
+                if detection is not None and self.state is ListeningState.WAKE:
+                    audio_source.seek(detection.position + 1)
+                    return detection
+            return None
+
+        position = 0
+        while self.running:
+            audio = audio_source.read()
+            history.write(audio)
+            position += 1
+
+            if self.state is not ListeningState.WAKE:
+                armed = False
+                self.calibrate(history.last_rms)
+                continue
+            if not armed:
+                self.model.reset()
+                armed = True
+
+            self.model.predict(audio)
+            hit = best_prediction(self.model, self.HOT_WORDS)
+            if hit is not None:
+                hotword, score = hit
+                return Detection(hotword.name, score, position - 1, history.stats(), hotword.headspace)
+            self.calibrate(history.last_rms, top_score(self.model))
+        return None
+
+    def transcribe_chunk(self, transcription: TranscriptionStream, audio: np.ndarray):
+        """ Feed a recorded chunk to the transcription, publish the partial transcript if it changed """
+        partial = transcription.feed(audio)
+        if partial:
+            self.temp_comms.publish("ears.partial_transcript", partial)
+
+    def record(self, audio_source: AudioSource, detection: Detection):
+        """
+        Record and transcribe the command following a hotword detection.
+
+        The Ears are PAUSED before the result is published, so a `resume` triggered by the
+        result is never lost.
+        """
+        self.state = ListeningState.RECORDING
+        self.temp_comms.publish("ears.wakeword_route", detection.headspace)
+        self.temp_comms.publish("ears.hotword_detected")
+        self.logs.debug(f"Hotword detected! {detection.name}={detection.score:.2f}")
+        noise_rms = float(np.hypot(detection.noise_floor.mean, detection.noise_floor.std))
+        if self.calibrator is not None and self.calibrator.ready:
+            threshold = self.calibrator.rms_threshold      # The noise floor without the hotword in it
+        else:
+            threshold = max(noise_rms * 3, self.SILENCE_THRESHOLD / CREST_FACTOR)
+        self.logs.debug(f"Listening... noise_rms={noise_rms:.0f}, std={detection.noise_floor.std:.0f}, rms_threshold={threshold:.0f}")
+
+        transcription = self.stt.start_stream()
+        self.vad.reset(threshold)
+
+        try:
+            while self.running:
+                event, chunks = self.vad.update(audio_source.read())
+                for chunk in chunks:
+                    self.transcribe_chunk(transcription, chunk)
+
+                if event is VadEvent.TIMEOUT:
+                    raise ListeningTimeout("Listening timeout occurred")
+                if event is VadEvent.SPEECH_END:
+                    break
+            else:
+                return
+
+            self.temp_comms.publish("gui.popup.loading_message", "Transcribing Audio")
+            text = transcription.finish()
+
+            self.pause()
+            self.temp_comms.publish("ears.recorder_callback", text)
+            self.logs.info(f"Transcribed text: {text}. Listening paused.")
+
+        except ListeningTimeout:
+            self.logs.warn("Listening Timeout occurred. Ending interaction.")
+            self.pause()
+            self.temp_comms.publish("ears.timeout")
+
+    def listen(self):
+        """
+        Run the capture session: listen for the hotword and process audio input.
+
+        This method opens the audio source once and reads it until the Ears are stopped.
+        In the WAKE state the audio is analyzed for the presence of a hotword. When the
+        hotword is detected the Ears are RECORDING the subsequent audio until a period of
+        silence is detected. The recorded audio is fed to the STT engine while it is recorded;
+        partial transcripts are published as `ears.partial_transcript` and the final text via
+        `ears.recorder_callback`. The Ears are then PAUSED until `resume` is called, while
+        the stream stays open.
+
+        The method runs in a loop while self.running is True, allowing it to be stopped
+        externally by setting self.running to False.
+
+        Note:
+            This method is intended to be run in a separate thread to avoid blocking
+            the main program execution.
+        """
+        if not self.in_process and self.model is None:
+            self.model = self.load_hotword_model()     # A source replaced the microphone of the WakeWordProcess
+        audio_source = self.open_source()
+        history = AudioRingBuffer(seconds=60, chunk_size=self.CHUNK)    # Keep last minute of audio
+        self.state = ListeningState.WAKE
+
+        self.logs.debug("Listening started ...")
+
+        try:
+            while self.running:
+                detection = self.detect_hotword(audio_source, history)
+                if detection is not None:
+                    self.record(audio_source, detection)
+
+        except EndOfAudio as e:
+            self.logs.info(f"Audio source exhausted: {e}")
+
+        except Exception as e:
+            tb = traceback.extract_tb(e.__traceback__)
+            self.logs.error(f"An error occurred: {type(e).__name__} - {str(e)}")
+
+            for frame in tb:
+                filename, lineno, func, text = frame
+                log_message = f"File {filename}, line {lineno}, in {func}"
+                if text:
+                    log_message += f"\n    {text}"
+                self.logs.error(log_message)
+
+        finally:
+            self.running = False
+            self.state = ListeningState.IDLE
+            audio_source.close()
+            if self.model is not None:
+                self.model.reset()
+            if self.calibrator is not None and self.calibrator.ready:
+                self.calibrator.save()
+            self.logs.info("Thread Exiting")
+
+    def pause(self):
+        """ Stop reacting to the hotword, the audio stream stays open """
+        if self.state is not ListeningState.IDLE:
+            self._resumed.clear()
+            self.state = ListeningState.PAUSED
+
+    def resume(self):
+        """ Listen for the hotword again after an interaction """
+        if self.state is ListeningState.PAUSED:
+            self.state = ListeningState.WAKE
+            self._resumed.set()
+            self.logs.debug("Listening resumed")
+
+    def start_listening(self):
+        """ Start the capture session, or resume listening for the hotword if it is already running """
+        if self.running:
+            self.resume()
+            return
+
+        if self.in_process:
+            self.wakeword_process.start()
+        self.running = True
+        self.thread = Thread(target=self.listen, daemon=True)
+        self.logs.info("Ears running!")
+        self.thread.start()
+
+    def stop(self):
+        """ Stop listening and close the capture session """
+        if self.running:
+            self.running = False
+            self._resumed.set()
+            if self.thread:
+                self.logs.info("Listener thread.join() called!")
+                self.thread.join()
+            self.logs.info("Ears stopped!")
+        if self.wakeword_process is not None:
+            self.wakeword_process.stop()
@@ -0,0 +1,242 @@
+"""
+Hotword detection in a dedicated process
+
+The WakeWordProcess owns the microphone and the openWakeWord model. Every chunk it reads is
+written into a shared memory ring buffer and scored; detections are sent to the Ears over a
+pipe. The Ears then read the utterance straight out of shared memory with a SharedAudioSource.
+This keeps the detector's frame cadence independent of the GIL in the main AMI process.
+While armed, the levels of the chunks without a detection are sent to the Ears in Ambient
+batches for their noise calibration, which sends the recalibrated HotWords back.
+"""
+import multiprocessing
+import traceback
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from ami.config import Config
+from ami.ears.buffer import AudioRingBuffer
+from ami.ears.source import AudioSource, EndOfAudio, MicrophoneSource
+from ami.ears.wakeword import Detection, HotWord, best_prediction, load_model, top_score
+
+AMBIENT_BATCH = 16          # Chunks of ambient levels sent to the Ears at once, about a second
+
+class Ambient(NamedTuple):
+    """ Levels of chunks without a detection, for the noise calibration of the Ears """
+    samples: List[Tuple[float, float]]      # (rms, top hotword score) per chunk
+
+class SharedAudioRing:
+    """
+    Ring of int16 chunks in shared memory with a shared count of chunks written.
+
+    Chunk `n` of the stream lives in slot `n % capacity` until it is overwritten `capacity`
+    chunks later. The writer bumps `written` and notifies the condition after every chunk.
+    """
+
+    def __init__(self, seconds: float, chunk_size: int, sample_rate: int=16000):
+        self.chunk_size = chunk_size
+        self.capacity = max(1, int(seconds * sample_rate) // chunk_size)
+        self.shm = shared_memory.SharedMemory(create=True, size=self.capacity * chunk_size * 2)
+        self.written = multiprocessing.Value('Q', 0, lock=False)
+        self.condition = multiprocessing.Condition()
+        self._view: Optional[np.ndarray] = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_view"] = None           # Views can't be pickled, the child makes its own
+        return state
+
+    @property
+    def chunks(self) -> np.ndarray:
+        """ (capacity, chunk_size) int16 view of the shared memory """
+        if self._view is None:
+            self._view = np.ndarray((self.capacity, self.chunk_size), dtype=np.int16, buffer=self.shm.buf)
+        return self._view
+
+    def writer(self) -> AudioRingBuffer:
+        """ An AudioRingBuffer whose audio lives in the shared memory, for the writing process """
+        return AudioRingBuffer(0, self.chunk_size, buffer=self.chunks)
+
+    def publish(self):
+        """ Mark one more chunk as written and wake up readers """
+        with self.condition:
+            self.written.value += 1
+            self.condition.notify_all()
+
+    def wait_for(self, count: int, timeout: float) -> bool:
+        """ Block until at least `count` chunks have been written """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.written.value >= count, timeout=timeout)
+
+    def close(self, unlink: bool=False):
+        """ Release the view and the shared memory, unlinking it from the owning process """
+        self._view = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+class SharedAudioSource(AudioSource):
+    """
+    Reads the audio stream written by the WakeWordProcess out of shared memory.
+
+    Attributes:
+        position (int): Index of the next chunk to read.
+    """
+
+    def __init__(self, ring: SharedAudioRing, alive: Callable[[], bool]):
+        super().__init__(ring.chunk_size)
+        self.ring = ring
+        self.alive = alive
+        self.position = 0
+
+    def seek(self, position: int):
+        """ Continue reading at chunk `position` of the stream """
+        self.position = position
+
+    def read(self) -> np.ndarray:
+        while not self.ring.wait_for(self.position + 1, timeout=1.0):
+            if not self.alive():
+                raise EndOfAudio("The wake word process is not running")
+
+        written = self.ring.written.value
+        if written - self.position > self.ring.capacity:
+            self.position = written - self.ring.capacity + 1       # Overrun, skip to the oldest chunk left
+
+        chunk = self.ring.chunks[self.position % self.ring.capacity].copy()
+        self.position += 1
+        return chunk
+
+def _capture(ring: SharedAudioRing, conn, stop_event, models_dir: Path, hotwords: List[HotWord]):
+    """ Entry point of the WakeWordProcess: read the mic, fill the ring, score every chunk """
+    logs = Config().load_blank_logging()("ami.ears.process")
+    source = MicrophoneSource(ring.chunk_size)
+    history = ring.writer()
+    model = load_model(models_dir, [ hotword.name for hotword in hotwords ])
+    armed = True
+    ambient = []
+
+    try:
+        while not stop_event.is_set():
+            audio = source.read()
+            history.write(audio)
+            ring.publish()
+            model.predict(audio)
+
+            while conn.poll():
+                message = conn.recv()
+                if message == "arm":
+                    model.reset()
+                    armed = True
+                elif isinstance(message, list):
+                    hotwords = message      # Recalibrated thresholds
+
+            if not armed:
+                continue
+
+            hit = best_prediction(model, hotwords)
+            if hit is not None:
+                hotword, score = hit
+                armed = False
+                conn.send(Detection(hotword.name, score, ring.written.value - 1, history.stats(), hotword.headspace))
+                continue
+
+            ambient.append((history.last_rms, top_score(model)))
+            if len(ambient) >= AMBIENT_BATCH:
+                conn.send(Ambient(ambient))
+                ambient = []
+
+    except Exception:
+        logs.error(f"Wake word process failed:\n{traceback.format_exc()}")
+    finally:
+        source.close()
+        del history                     # Its buffer views the shared memory, which can't close while exported
+        ring.close()
+
+class WakeWordProcess:
+    """
+    Runs microphone capture and hotword detection in a child process.
+
+    After a detection the child is disarmed until `arm` is called, so a single utterance never
+    produces a second detection while the Ears are recording it. Ambient levels received while
+    waiting are handed to `on_ambient`.
+    """
+
+    def __init__(self,
+                 chunk_size: int,
+                 models_dir: Path,
+                 hotwords: List[HotWord],
+                 seconds: float=60,
+                 on_ambient: Optional[Callable[[List[Tuple[float, float]]], None]]=None):
+        self._ring_args = (seconds, chunk_size)
+        self.ring: Optional[SharedAudioRing] = SharedAudioRing(*self._ring_args)
+        self._conn, self._child_conn = multiprocessing.Pipe()
+        self._stop_event = multiprocessing.Event()
+        self._args = (models_dir, list(hotwords))
+        self.process: Optional[multiprocessing.Process] = None
+        self.on_ambient = on_ambient
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def source(self) -> SharedAudioSource:
+        """ A reader for the audio stream in shared memory """
+        return SharedAudioSource(self.ring, lambda: self.alive)
+
+    def start(self):
+        """ Start the child process if it isn't running """
+        if self.alive:
+            return
+        self._stop_event.clear()
+        if self.ring is None:           # Stopped before, its shared memory is gone
+            self.ring = SharedAudioRing(*self._ring_args)
+        self.ring.written.value = 0     # A fresh writer starts at slot 0
+        self.process = multiprocessing.Process(
+            target=_capture,
+            args=(self.ring, self._child_conn, self._stop_event, *self._args),
+            daemon=True
+        )
+        self.process.start()
+
+    def _receive(self) -> Optional[Detection]:
+        """ The next message, a detection or None once its ambient levels were handed on """
+        message = self._conn.recv()
+        if isinstance(message, Ambient):
+            if self.on_ambient is not None:
+                self.on_ambient(message.samples)
+            return None
+        return message
+
+    def arm(self):
+        """ Drop pending detections, reset the model and allow the next detection """
+        while self._conn.poll():
+            self._receive()
+        self._conn.send("arm")
+
+    def set_hotwords(self, hotwords: List[HotWord]):
+        """ Detect with new thresholds, e.g. after a calibration """
+        self._args = (self._args[0], list(hotwords))
+        if self.alive:
+            self._conn.send(list(hotwords))
+
+    def wait(self, timeout: float) -> Optional[Detection]:
+        """ Wait up to `timeout` seconds for a detection, discarding stale ones """
+        detection = None
+        if self._conn.poll(timeout):
+            while self._conn.poll():
+                detection = self._receive() or detection
+        return detection
+
+    def stop(self):
+        """ Stop the child process and free the shared memory, also when it never started """
+        if self.process is not None:
+            self._stop_event.set()
+            self.process.join(timeout=2)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+        if self.ring is not None:
+            self.ring.close(unlink=True)
+            self.ring = None
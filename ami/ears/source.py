@@ -0,0 +1,119 @@
+""" Audio sources the Ears can listen to: the microphone, a WAV file, or audio already in memory """
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import numpy as np
+
+class EndOfAudio(Exception):
+    """Exception raised when a finite audio source has no more chunks."""
+    pass
+
+class AudioSource(ABC):
+    """
+    Abstract source of int16 mono audio, read one chunk at a time.
+
+    Attributes:
+        chunk_size (int): The number of samples returned by every `read`.
+        sample_rate (int): The sample rate of the audio.
+    """
+
+    def __init__(self, chunk_size: int, sample_rate: int=16000):
+        self.chunk_size = chunk_size
+        self.sample_rate = sample_rate
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @abstractmethod
+    def read(self) -> np.ndarray:
+        """
+        Read the next chunk.
+
+        Returns:
+            np.ndarray: `chunk_size` int16 samples.
+
+        Raises:
+            EndOfAudio: If the source is finite and exhausted.
+        """
+        raise NotImplementedError("Subclasses must implement the read method.")
+
+    def close(self) -> None:
+        """ Release the source """
+        pass
+
+class MicrophoneSource(AudioSource):
+    """ The default input device through PyAudio """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        import pyaudio
+
+        self._pyaudio = pyaudio.PyAudio()
+        self._stream = self._pyaudio.open(
+            format=pyaudio.paInt16,
+            channels=1,
+            rate=self.sample_rate,
+            input=True,
+            frames_per_buffer=self.chunk_size
+        )
+
+    def read(self) -> np.ndarray:
+        return np.frombuffer(self._stream.read(self.chunk_size), dtype=np.int16)
+
+    def close(self) -> None:
+        if self._stream is None:
+            return
+        self._stream.stop_stream()
+        self._stream.close()
+        self._pyaudio.terminate()
+        self._stream = None
+
+class ArraySource(AudioSource):
+    """
+    Replays audio held in a NumPy array. The last chunk is zero padded.
+
+    Attributes:
+        position (int): The number of samples read so far.
+    """
+
+    def __init__(self, audio: np.ndarray, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if audio.dtype != np.int16:
+            raise ValueError(f"ArraySource expects int16 audio, not {audio.dtype}")
+
+        padding = -len(audio) % self.chunk_size
+        self.audio = np.concatenate([audio, np.zeros(padding, dtype=np.int16)]) if padding else audio
+        self.position = 0
+
+    @property
+    def duration(self) -> float:
+        """ Length of the audio in seconds """
+        return len(self.audio) / self.sample_rate
+
+    @property
+    def exhausted(self) -> bool:
+        """ True when every chunk has been read """
+        return self.position >= len(self.audio)
+
+    def read(self) -> np.ndarray:
+        if self.exhausted:
+            raise EndOfAudio(f"End of audio after {self.position} samples")
+        chunk = self.audio[self.position:self.position + self.chunk_size]
+        self.position += self.chunk_size
+        return chunk
+
+class WavFileSource(ArraySource):
+    """ Replays a 16 bit WAV file. Multi-channel files are reduced to their first channel. """
+
+    def __init__(self, filepath: Path, chunk_size: int, sample_rate: int=16000):
+        import soundfile as sf
+
+        audio, file_rate = sf.read(str(filepath), dtype='int16', always_2d=True)
+        if file_rate != sample_rate:
+            raise ValueError(f"{filepath} is sampled at {file_rate}Hz, expected {sample_rate}Hz")
+
+        self.filepath = Path(filepath)
+        super().__init__(np.ascontiguousarray(audio[:, 0]), chunk_size, sample_rate)
@@ -0,0 +1,262 @@
+""" Speech to Text engines for the Ears. Selected in config.yaml by `stt_engine` """
+import json
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, List, Optional, Type
+
+import numpy as np
+import speech_recognition as sr
+
+from ami.base import Base
+from ami.ears.buffer import GrowableAudioBuffer
+
+class InvalidSTTEngine(Exception):
+    """Exception raised for an unknown or unloadable speech to text engine."""
+    pass
+
+class TranscriptionStream:
+    """
+    Incremental transcription of a single utterance.
+
+    The Ears feed audio chunks as they are recorded and call `finish` at end of speech. This
+    default implementation only buffers the audio and transcribes it in one shot at `finish`,
+    engines that can decode incrementally override it and return partial hypotheses from `feed`.
+    The audio is collected in the engine's `utterance` buffer, so only one stream per engine
+    can be open at a time.
+    """
+
+    def __init__(self, engine: 'SpeechToText'):
+        self.engine = engine
+        self.engine.utterance.clear()
+
+    def feed(self, chunk: np.ndarray) -> Optional[str]:
+        """
+        Feed the next chunk of the utterance.
+
+        Args:
+            chunk (np.ndarray): int16 mono samples.
+
+        Returns:
+            Optional[str]: The new partial hypothesis if it changed, else None.
+        """
+        self.engine.utterance.append(chunk)
+        return None
+
+    def finish(self) -> str:
+        """ End the utterance and return the final transcript """
+        if len(self.engine.utterance) == 0:
+            return ""
+        return self.engine(self.engine.utterance.view())
+
+class SpeechToText(ABC, Base):
+    """
+    Abstract speech to text engine.
+
+    Engines are created once by the Ears and kept for the lifetime of the process, so local
+    models stay loaded in memory between utterances. Calling the engine transcribes the audio
+    and records how long it took in `last_latency`. `start_stream` returns a TranscriptionStream
+    that is fed while the Human is still speaking.
+
+    Attributes:
+        name (str): The name used for the engine in config.yaml.
+        accepts_pcm (bool): The backend takes any buffer of raw PCM, so `pcm` hands it a memoryview
+                            of the recorded audio instead of a copy as bytes.
+        sample_rate (int): The sample rate of the audio handed to the engine.
+        last_latency (float): Seconds spent in the last transcription.
+        utterance (GrowableAudioBuffer): Reused buffer the TranscriptionStream records into.
+    """
+    name: str = ""
+    accepts_pcm: bool = False
+
+    def __init__(self, sample_rate: int=16000):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.last_latency = 0.0
+        self.utterance = GrowableAudioBuffer(sample_rate=sample_rate)
+
+    def __call__(self, audio: np.ndarray) -> str:
+        """ Transcribe int16 mono audio and log the time it took """
+        start = time.perf_counter()
+        text = self.transcribe(audio)
+        self.last_latency = time.perf_counter() - start
+        self.logs.info(f"{self.name} STT took {self.last_latency:.3f}s for {len(audio) / self.sample_rate:.1f}s of audio")
+        return text
+
+    def start_stream(self) -> TranscriptionStream:
+        """ Begin the incremental transcription of a new utterance """
+        return TranscriptionStream(self)
+
+    def pcm(self, audio: np.ndarray):
+        """ Raw int16 PCM of the audio, a zero-copy memoryview when the backend accepts one, else bytes """
+        if self.accepts_pcm and audio.flags.c_contiguous:
+            return memoryview(audio).cast('B')
+        return audio.tobytes()
+
+    @abstractmethod
+    def transcribe(self, audio: np.ndarray) -> str:
+        """
+        Convert audio to text.
+
+        Args:
+            audio (np.ndarray): int16 mono samples at `sample_rate`.
+
+        Returns:
+            str: The transcribed text, or an empty string if nothing was understood.
+        """
+        raise NotImplementedError("Subclasses must implement the transcribe method.")
+
+class GoogleSTT(SpeechToText):
+    """ Google Speech Recognition through SpeechRecognition. Cloud based. """
+    name = "google"
+    accepts_pcm = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.r = sr.Recognizer()
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        try:
+            return self.r.recognize_google(sr.AudioData(self.pcm(audio), sample_rate=self.sample_rate, sample_width=2))
+        except sr.UnknownValueError:
+            self.logs.error("Google Speech Recognition could not understand audio")
+            return ""
+        except sr.RequestError as e:
+            self.logs.error(f"Could not request results for speech recognition service; {e}")
+            return ""
+
+class NullSTT(SpeechToText):
+    """ Transcribes nothing. For benchmarking the Ears without a speech to text engine. """
+    name = "none"
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        return ""
+
+class SphinxSTT(GoogleSTT):
+    """ CMU Sphinx through SpeechRecognition. Local, requires `pocketsphinx`. """
+    name = "sphinx"
+    accepts_pcm = False         # pocketsphinx wants bytes
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        try:
+            return self.r.recognize_sphinx(sr.AudioData(self.pcm(audio), sample_rate=self.sample_rate, sample_width=2))
+        except sr.UnknownValueError:
+            self.logs.error("Sphinx could not understand audio")
+            return ""
+        except sr.RequestError as e:
+            self.logs.error(f"Sphinx is not available; {e}")
+            return ""
+
+class VoskSTT(SpeechToText):
+    """ Vosk (Kaldi) model loaded from the models directory. Local, requires `vosk`. """
+    name = "vosk"
+    default_model = "vosk-model-small-en-us-0.15"
+
+    def __init__(self, models_dir: Path, model: Optional[str]=None, **kwargs):
+        super().__init__(**kwargs)
+        try:
+            import vosk
+        except ImportError as exc:
+            raise InvalidSTTEngine("The vosk STT engine requires the `vosk` package") from exc
+
+        model_path = Path(models_dir) / (model or self.default_model)
+        if not model_path.is_dir():
+            raise InvalidSTTEngine(f"Vosk model not found at {model_path}. Download one from https://alphacephei.com/vosk/models")
+
+        vosk.SetLogLevel(-1)
+        self._vosk = vosk
+        self.model = vosk.Model(str(model_path))
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        recognizer = self._vosk.KaldiRecognizer(self.model, self.sample_rate)
+        recognizer.AcceptWaveform(self.pcm(audio))
+        return json.loads(recognizer.FinalResult()).get("text", "")
+
+    def start_stream(self) -> TranscriptionStream:
+        return VoskStream(self)
+
+class VoskStream(TranscriptionStream):
+    """ Vosk decodes every chunk as it is fed, so `finish` only flushes the last few frames """
+
+    def __init__(self, engine: VoskSTT):
+        super().__init__(engine)
+        self.recognizer = engine._vosk.KaldiRecognizer(engine.model, engine.sample_rate)
+        self._segments: List[str] = []
+        self._partial = ""
+
+    def feed(self, chunk: np.ndarray) -> Optional[str]:
+        if self.recognizer.AcceptWaveform(self.engine.pcm(chunk)):
+            segment = json.loads(self.recognizer.Result()).get("text", "")
+            if segment:
+                self._segments.append(segment)
+            partial = " ".join(self._segments)
+        else:
+            partial = " ".join(self._segments + [json.loads(self.recognizer.PartialResult()).get("partial", "")]).strip()
+
+        if partial == self._partial:
+            return None
+        self._partial = partial
+        return partial
+
+    def finish(self) -> str:
+        start = time.perf_counter()
+        segment = json.loads(self.recognizer.FinalResult()).get("text", "")
+        text = " ".join(self._segments + [segment]).strip()
+        self.engine.last_latency = time.perf_counter() - start
+        self.engine.logs.info(f"vosk STT stream finished {self.engine.last_latency:.3f}s after end of speech")
+        return text
+
+class WhisperSTT(SpeechToText):
+    """ Whisper on the CPU through CTranslate2. Local, requires `faster-whisper`. """
+    name = "whisper"
+    default_model = "tiny.en"
+
+    def __init__(self, models_dir: Path, model: Optional[str]=None, **kwargs):
+        super().__init__(**kwargs)
+        try:
+            from faster_whisper import WhisperModel
+        except ImportError as exc:
+            raise InvalidSTTEngine("The whisper STT engine requires the `faster-whisper` package") from exc
+
+        self.model = WhisperModel(model or self.default_model,
+                                  device="cpu",
+                                  compute_type="int8",
+                                  download_root=str(models_dir))
+
+        # The first inference pays for lazy initialization, pay it before the first utterance
+        self.transcribe(np.zeros(self.sample_rate // 2, dtype=np.int16))
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        samples = np.multiply(audio, 1 / 32768.0, dtype=np.float32)     # One float32 copy, no float64 temporary
+        segments, _ = self.model.transcribe(samples, language="en", beam_size=1, vad_filter=False)
+        return " ".join(segment.text.strip() for segment in segments)
+
+STT_ENGINES: Dict[str, Type[SpeechToText]] = {
+    NullSTT.name: NullSTT,
+    GoogleSTT.name: GoogleSTT,
+    SphinxSTT.name: SphinxSTT,
+    VoskSTT.name: VoskSTT,
+    WhisperSTT.name: WhisperSTT,
+}
+
+def get_stt_engine(name: str, models_dir: Path, model: Optional[str]=None) -> SpeechToText:
+    """
+    Create the speech to text engine named in the config.
+
+    Args:
+        name (str): One of the keys of STT_ENGINES.
+        models_dir (Path): Directory holding local models.
+        model (str, optional): Model name or directory for local engines.
+
+    Returns:
+        SpeechToText: The loaded engine.
+
+    Raises:
+        InvalidSTTEngine: If the name is unknown or the engine cannot be loaded.
+    """
+    engine = STT_ENGINES.get(name.lower())
+    if engine is None:
+        raise InvalidSTTEngine(f"STT engine {name} not valid. Please reconfigure with one of the following {list(STT_ENGINES.keys())}")
+    if engine in (NullSTT, GoogleSTT, SphinxSTT):
+        return engine()
+    return engine(models_dir, model)
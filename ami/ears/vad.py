@@ -0,0 +1,216 @@
+""" Voice activity detection and endpointing for the Ears """
+from collections import deque
+from enum import Enum
+from pathlib import Path
+from typing import Deque, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from ami.base import Base
+
+CREST_FACTOR = 4.0      # Typical peak to RMS ratio of speech, converts peak thresholds to RMS
+
+class VadEvent(Enum):
+    """ What the endpointer decided about the latest chunk """
+    WAITING = "waiting"             # No speech yet
+    SPEECH_START = "speech_start"   # Onset confirmed, pre-roll released
+    SPEECH = "speech"               # Inside the utterance
+    SPEECH_END = "speech_end"       # Hangover expired, the utterance is complete
+    TIMEOUT = "timeout"             # No speech before the listening timeout
+
+class FrameFeatures(NamedTuple):
+    """ Features computed once per chunk """
+    rms: float
+    zcr: float
+
+class EnergyVAD:
+    """
+    Frame classifier on RMS energy and zero-crossing rate.
+
+    A frame is speech when its RMS clears the threshold and it isn't hiss-like (a very high
+    zero-crossing rate with little energy), or when its RMS is well above the threshold.
+    """
+
+    def __init__(self, chunk_size: int, threshold: float=1000.0, max_zcr: float=0.4):
+        self.threshold = threshold
+        self.max_zcr = max_zcr
+        self._samples = np.zeros(chunk_size, dtype=np.float32)
+        self._signs = np.zeros(chunk_size, dtype=bool)
+
+    def features(self, chunk: np.ndarray) -> FrameFeatures:
+        """ RMS and zero-crossing rate of an int16 chunk """
+        samples = self._samples[:len(chunk)]
+        samples[:] = chunk
+        signs = np.signbit(samples, out=self._signs[:len(chunk)])
+        crossings = np.count_nonzero(signs[1:] != signs[:-1])
+        return FrameFeatures(
+            rms=float(np.sqrt(np.dot(samples, samples) / len(samples))),
+            zcr=crossings / len(samples)
+        )
+
+    def is_speech(self, chunk: np.ndarray) -> Tuple[bool, FrameFeatures]:
+        """ Classify a chunk, also returning the features for logging """
+        feats = self.features(chunk)
+        if feats.rms > 2 * self.threshold:
+            return True, feats
+        return feats.rms > self.threshold and feats.zcr < self.max_zcr, feats
+
+class SileroVAD(EnergyVAD):
+    """
+    Frame classifier backed by the Silero VAD ONNX model (v5) through onnxruntime.
+
+    Silero consumes 512 sample windows (plus 64 samples of context) at 16kHz, so the chunk is
+    split into windows and the remainder is carried into the next chunk. A chunk is speech when
+    any of its windows scores above `probability`.
+    """
+    WINDOW = 512
+    CONTEXT = 64
+
+    def __init__(self, model_path: Path, chunk_size: int, probability: float=0.5, sample_rate: int=16000, **kwargs):
+        super().__init__(chunk_size, **kwargs)
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.inter_op_num_threads = 1
+        options.intra_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(str(model_path), sess_options=options, providers=["CPUExecutionProvider"])
+        self.probability = probability
+        self._sr = np.array(sample_rate, dtype=np.int64)
+        self._window = np.zeros((1, self.CONTEXT + self.WINDOW), dtype=np.float32)
+        self._pending = np.zeros(chunk_size + self.WINDOW, dtype=np.float32)
+        self._last_probability = 0.0
+        self.reset()
+
+    def reset(self):
+        """ Reset the recurrent state between utterances """
+        self._state = np.zeros((2, 1, 128), dtype=np.float32)
+        self._window[:] = 0
+        self._n_pending = 0
+        self._last_probability = 0.0
+
+    def is_speech(self, chunk: np.ndarray) -> Tuple[bool, FrameFeatures]:
+        feats = self.features(chunk)
+
+        n_total = self._n_pending + len(chunk)
+        self._pending[self._n_pending:n_total] = self._samples[:len(chunk)] / 32768.0
+
+        best = None
+        start = 0
+        while n_total - start >= self.WINDOW:
+            self._window[0, self.CONTEXT:] = self._pending[start:start + self.WINDOW]
+            output, self._state = self.session.run(None, {"input": self._window, "state": self._state, "sr": self._sr})
+            self._window[0, :self.CONTEXT] = self._window[0, -self.CONTEXT:]
+            best = max(best or 0.0, float(output[0][0]))
+            start += self.WINDOW
+
+        remainder = n_total - start
+        self._pending[:remainder] = self._pending[start:n_total]
+        self._n_pending = remainder
+
+        if best is not None:
+            self._last_probability = best
+        return self._last_probability > self.probability, feats
+
+class VoiceActivityDetector(Base):
+    """
+    Endpointer for the utterance that follows the hotword.
+
+    Every chunk is classified once and counted in frames rather than wall-clock time. Speech
+    must last `onset_frames` to start the utterance, which then includes `pre_roll_frames` of
+    audio from before the onset. The utterance ends after `hangover_frames` of silence.
+
+    Audio recorded during the first `settle_frames` (the tail of the hotword) is always kept
+    since the Human often starts speaking straight after the hotword.
+    """
+
+    def __init__(self,
+                 chunk_size: int,
+                 sample_rate: int=16000,
+                 hangover: float=0.8,
+                 pre_roll: float=0.3,
+                 onset: float=0.16,
+                 settle: float=1.0,
+                 timeout: float=30,
+                 model_path: Optional[Path]=None):
+        """
+        Args:
+            chunk_size (int): Samples per chunk read from the microphone.
+            sample_rate (int, optional): Defaults to 16000.
+            hangover (float, optional): Seconds of silence that end the utterance.
+            pre_roll (float, optional): Seconds of audio kept from before the speech onset.
+            onset (float, optional): Seconds of speech needed to start the utterance.
+            settle (float, optional): Seconds after the hotword before onset detection begins.
+            timeout (float, optional): Seconds without speech before a timeout.
+            model_path (Path, optional): Silero VAD ONNX model; energy based detection if absent.
+        """
+        super().__init__()
+        frame = chunk_size / sample_rate
+        to_frames = lambda seconds : max(1, round(seconds / frame))
+
+        self.hangover_frames = to_frames(hangover)
+        self.onset_frames = to_frames(onset)
+        self.settle_frames = to_frames(settle)
+        self.timeout_frames = to_frames(timeout)
+        self._pre_roll: Deque[np.ndarray] = deque(maxlen=to_frames(pre_roll) + self.onset_frames)
+
+        if model_path is not None and Path(model_path).is_file():
+            self.classifier = SileroVAD(model_path, chunk_size, sample_rate=sample_rate)
+            self.logs.info(f"Silero VAD loaded from {model_path}")
+        else:
+            self.classifier = EnergyVAD(chunk_size)
+
+        self.reset()
+
+    def reset(self, threshold: Optional[float]=None):
+        """
+        Prepare for a new utterance.
+
+        Args:
+            threshold (float, optional): The RMS threshold for energy based classification.
+        """
+        if threshold is not None:
+            self.classifier.threshold = threshold
+        if isinstance(self.classifier, SileroVAD):
+            self.classifier.reset()
+        self._pre_roll.clear()
+        self.frames = 0
+        self.speech_started = False
+        self._voiced = 0
+        self._silent = 0
+
+    def update(self, chunk: np.ndarray) -> Tuple[VadEvent, List[np.ndarray]]:
+        """
+        Classify the next chunk and advance the endpointing state.
+
+        Args:
+            chunk (np.ndarray): int16 samples.
+
+        Returns:
+            Tuple[VadEvent, List[np.ndarray]]: The event and the chunks that now belong to the
+                utterance, in order. Waiting chunks are held back in the pre-roll.
+        """
+        self.frames += 1
+        speech, _ = self.classifier.is_speech(chunk)
+
+        if self.speech_started:
+            self._silent = 0 if speech else self._silent + 1
+            if self._silent >= self.hangover_frames:
+                return VadEvent.SPEECH_END, [chunk]
+            return VadEvent.SPEECH, [chunk]
+
+        if self.frames <= self.settle_frames:
+            return VadEvent.WAITING, [chunk]
+
+        self._voiced = self._voiced + 1 if speech else 0
+        self._pre_roll.append(chunk)
+
+        if self._voiced >= self.onset_frames:
+            self.speech_started = True
+            released = list(self._pre_roll)
+            self._pre_roll.clear()
+            return VadEvent.SPEECH_START, released
+
+        if self.frames > self.timeout_frames:
+            return VadEvent.TIMEOUT, []
+
+        return VadEvent.WAITING, []
@@ -0,0 +1,117 @@
+""" OpenWakeWord model loading and hotword detection for the Ears """
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+import openwakeword
+from openwakeword.utils import download_models
+from openwakeword.model import Model
+
+from ami.ears.buffer import AmplitudeStats
+
+def get_melspec_filepath(models_dir: Path, search_string: str="melspectrogram", extension: str="tflite"):
+    """ Get the melspec model for OpenWakeWord """
+    for file in models_dir.glob(f"*{search_string}*.{extension}"):
+        return file
+    return None
+
+def get_embeddings_filepath(models_dir: Path, search_string: str="embedding", extension: str="tflite"):
+    """ Get the embeddings model for OpenWakeWord """
+    for file in models_dir.glob(f"*{search_string}*.{extension}"):
+        return file
+    return None
+
+class InvalidModel(Exception):
+    """Exception raised for invalid hotword models."""
+    pass
+
+class HotWord(NamedTuple):
+    """
+    A configured wake word.
+
+    Attributes:
+        name (str): The openWakeWord model name, also matched against the model file name.
+        threshold (float): The score above which the wake word is detected.
+        headspace (str | None): The Headspace the query goes to, skipping the router when set.
+    """
+    name: str
+    threshold: float
+    headspace: Optional[str] = None
+
+class Detection(NamedTuple):
+    """
+    A hotword detection.
+
+    Attributes:
+        name (str): The name of the HotWord that fired.
+        score (float): The model score for the chunk.
+        position (int): Index of the detecting chunk in the audio stream.
+        noise_floor (AmplitudeStats): Amplitude statistics of the audio before the detection.
+        headspace (str | None): The Headspace configured for the HotWord.
+    """
+    name: str
+    score: float
+    position: int
+    noise_floor: AmplitudeStats
+    headspace: Optional[str] = None
+
+def get_model(models_dir: Path, hotwords: List[str], **kwargs) -> Model:
+    """
+    Get or download the hotword detection models and load them into a single Model.
+
+    Args:
+        models_dir (Path): The directory where models are stored.
+        hotwords (List[str]): The names of the hotwords to detect.
+
+    Returns:
+        Model: An instance of the OpenWakeWord Model class scoring every hotword in one `predict`.
+
+    Raises:
+        InvalidModel: If one of the specified hotwords is not valid.
+
+    This function checks if a model for every hotword exists in the models directory.
+    Missing models are downloaded from the OpenWakeWord repository. If a missing hotword is
+    not valid, it raises an InvalidModel exception.
+    """
+    model_paths = []
+    for hotword in hotwords:
+        tflite_files = list(models_dir.glob(f"*{hotword}*.tflite"))
+
+        if len(tflite_files) == 0:
+            if hotword not in openwakeword.MODELS.keys():
+                raise InvalidModel(f"Hotword {hotword} not valid. Please reconfigire with one of the following {openwakeword.MODELS.keys()}")
+            download_models(model_names=[hotword], target_directory=str(models_dir))
+            tflite_files = list(models_dir.glob(f"*{hotword}*.tflite"))
+
+        model_paths.append(str(tflite_files[0]))
+
+    return Model(wakeword_models=model_paths, **kwargs)
+
+def load_model(models_dir: Path, hotwords: List[str]) -> Model:
+    """ Get the hotword models together with the shared melspec and embedding models from `models_dir` """
+    return get_model(
+        models_dir,
+        hotwords,
+        melspec_model_path=str(get_melspec_filepath(models_dir)),
+        embedding_model_path=str(get_embeddings_filepath(models_dir))
+    )
+
+def match_hotword(model_key: str, hotwords: List[HotWord]) -> Optional[HotWord]:
+    """ The HotWord a `Model.prediction_buffer` key belongs to, keys are the model file names """
+    for hotword in hotwords:
+        if hotword.name in model_key:
+            return hotword
+    return None
+
+def top_score(model: Model) -> float:
+    """ The highest score of any hotword in the latest prediction """
+    return max((float(buffer[-1]) for buffer in model.prediction_buffer.values()), default=0.0)
+
+def best_prediction(model: Model, hotwords: List[HotWord]) -> Optional[Tuple[HotWord, float]]:
+    """ Return `(hotword, score)` for the highest scoring hotword above its own threshold in the latest prediction """
+    best = None
+    for model_key, buffer in model.prediction_buffer.items():
+        hotword = match_hotword(model_key, hotwords)
+        score = float(buffer[-1])
+        if hotword is not None and score > hotword.threshold and (best is None or score > best[1]):
+            best = hotword, score
+    return best
@@ -1,5 +1,6 @@
 """ AMI Flask Server """
 
+import json
 from pathlib import Path
 
 from flask import Flask, render_template,  redirect, url_for, make_response, send_file, abort
@@ -71,6 +72,16 @@ def get_app():
 
         return render_template('logs.html', logfile=logfile, log_content=content)
 
+    @app.route('/usage')
+    def usage():
+        usage_file = Config().llm_usage_file
+        try:
+            with usage_file.open('r', encoding='utf-8') as f:
+                usage_data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            usage_data = None
+        return render_template('usage.html', usage=usage_data)
+
 # ------------------------------------------------------------------------------
 #                       TREE ROUTING
 #                          + /upload
@@ -8,6 +8,7 @@ from typing import Any, Callable, Generator, List
 from PIL import ImageTk, Image
 
 from ami.base import Base
+from ami.headspace import ResponseStream
 
 class TimeoutBar(Progressbar):
     """ 
@@ -122,6 +123,7 @@ class AIDialogWindow(Frame):
         height (int): Height of the popup window in pixels.
         timeout_bar (TimeoutBar): The timeout bar that countdowns til the popup closes.
         target (tk.Label): Changes the target for text rendering in conjunction with the AI class.
+        stream_interval (int): Milliseconds between drains of a streamed response.
     """
 
     def __init__(self, parent, width: int=500, height: int=700) -> None:
@@ -145,6 +147,7 @@ class AIDialogWindow(Frame):
         self._loading_flag = False
 
         self.load_interval = 150
+        self.stream_interval = 30
         self.border_color = '#666666'
         self.text_size = 14
         self.width = width
@@ -290,6 +293,20 @@ class AIDialogWindow(Frame):
             print("Human message just fucked up")
         self.ai_message()
 
+    def partial_human_message(self, text: str):
+        """
+        Show the partial transcript of what the Human is still saying.
+
+        Args:
+            text (str): The latest partial transcript from the Ears
+        """
+        if self._popup is None:
+            return
+
+        if self.focus == "HUMAN" and self.target:
+            self._loading_flag = False
+            self.target.config(text=text)
+
     def ai_message(self):
         """ Initialize the AI message, return if the popup isn't on screen """
         if self._popup is None:
@@ -311,6 +328,9 @@ class AIDialogWindow(Frame):
         """
         Display the AI's response in the dialog window.
 
+        Streamed and deferred responses are produced on a worker thread by a ResponseStream,
+        whose chunks `stream_response` drains without blocking the Tk thread.
+
         Args:
             dialog (Dialog): An instance of the Dialog class containing the AI's response
                              and other relevant information.
@@ -321,13 +341,40 @@ class AIDialogWindow(Frame):
         payload = dialog.convo[-1][-1]
         if isinstance(payload, str):
             self.target.config(text=payload)
-        if isinstance(payload, Callable):
-            self.target.config(text=payload())
-        elif isinstance(payload, Generator):
-            self.target.config(text="")
-            for chunk in payload:
-                self.target.config(text=self.target.cget('text') + chunk)
-                self.target.update()
+            self.show_dialog(dialog)
+            return
+
+        if not isinstance(payload, ResponseStream):
+            payload = ResponseStream(payload)
+        self.target.config(text="")
+        self.stream_response(dialog, payload)
+
+    def stream_response(self, dialog, stream: ResponseStream):
+        """
+        Append the chunks the stream produced so far, then check again after `stream_interval`.
+
+        Args:
+            dialog (Dialog): The Dialog the stream answers.
+            stream (ResponseStream): The response being produced.
+        """
+        if self._popup is None:
+            stream.cancel()
+            return
+        chunks = stream.drain()
+        if chunks:
+            self.target.config(text=self.target.cget('text') + "".join(chunks))
+        if stream.finished:
+            self.show_dialog(dialog)
+        else:
+            self._after(self.stream_interval, self.stream_response, dialog, stream)
+
+    def show_dialog(self, dialog):
+        """
+        Finish displaying the AI's response with its visual, and start the timeout.
+
+        Args:
+            dialog (Dialog): The Dialog whose response is on screen.
+        """
         dialog.convo[-1] = ('AI', self.target.cget('text'))
 
         if isinstance(dialog.visual, str):
@@ -361,6 +408,10 @@ class AIDialogWindow(Frame):
         """ Hand off method for outside access to self.human_message via the tkinter Queue """
         self._after(0, self.human_message, message)
 
+    def set_partial_message(self, message:str):
+        """ Hand off method for outside access to self.partial_human_message via the tkinter Queue """
+        self._after(0, self.partial_human_message, message)
+
     def set_ai_response(self, dialog):
         """ Hand off method for outside access to self.ai_dialog via the tkinter Queue """
         self._after(0, self.ai_dialog, dialog)
@@ -1,4 +1,6 @@
 """ __init.py """
 
 from .dialog import Dialog
-from .headspace import Headspace, agent_observation, ami_tool, generate_qr_image
+from .memory import ConversationMemory, close_summarizer_pool
+from .stream import AgentThoughts, ResponseStream
+from .headspace import Headspace, ToolResponse, agent_observation, ami_tool, generate_qr_image, user_response
@@ -0,0 +1,283 @@
+"""
+Rule-based resolution of natural language dates, the fast path of Calendar.comprehend_date
+
+Relative dates are resolved the way the INFER_DATE prompt's lookahead table names them, always
+looking forward from today:
+    today, tomorrow, the day after tomorrow, yesterday
+    friday, this friday             The next friday, "this friday" on a friday is today
+    next friday                     The friday 7 to 13 days from today
+    following friday                The friday 14 to 20 days from today
+    in 3 days, in two weeks, 3 days from now
+    the first, the 21st, the twenty-first       The next such day of the month
+    march 3, 3rd of march, march 3rd 2025       The next such date when no year is given
+    2024-05-01
+Anything else returns None and is left to the LLM.
+
+`coverage` measures the resolver against DATE_CORPUS:
+    python -m ami.headspace.core.calendar.dates
+"""
+import re
+import sys
+import time
+import calendar
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+WEEKDAYS = { name.lower(): i for i, name in enumerate(calendar.day_name) }
+WEEKDAYS.update({ name.lower(): i for i, name in enumerate(calendar.day_abbr) })
+WEEKDAYS.update({"tues": 1, "weds": 2, "thur": 3, "thurs": 3})
+
+MONTHS = { name.lower(): i for i, name in enumerate(calendar.month_name) if name }
+MONTHS.update({ name.lower(): i for i, name in enumerate(calendar.month_abbr) if name })
+MONTHS["sept"] = 9
+
+NUMBERS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14,
+    "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19, "twenty": 20,
+    "thirty": 30,
+}
+
+ORDINALS = {
+    "first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "sixth": 6, "seventh": 7,
+    "eighth": 8, "ninth": 9, "tenth": 10, "eleventh": 11, "twelfth": 12, "thirteenth": 13,
+    "fourteenth": 14, "fifteenth": 15, "sixteenth": 16, "seventeenth": 17, "eighteenth": 18,
+    "nineteenth": 19, "twentieth": 20, "thirtieth": 30,
+}
+
+FILLER = {"on", "the", "of", "for", "at", "please"}
+
+_weekday = "|".join(sorted(WEEKDAYS, key=len, reverse=True))
+_month = "|".join(sorted(MONTHS, key=len, reverse=True))
+_ordinal = "|".join(sorted(ORDINALS, key=len, reverse=True))
+_number = r"\d+|" + "|".join(sorted(NUMBERS, key=len, reverse=True))
+_day = rf"(?:\d{{1,2}}(?:st|nd|rd|th)?|(?:twenty|thirty)(?: |-)?(?:{_ordinal})|{_ordinal})"
+
+ISO_DATE = re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})$")
+WEEKDAY = re.compile(rf"^(?:(this|coming|next|following) )?(?:week )?({_weekday})(?: (next|this) week)?$")
+OFFSET = re.compile(rf"^(?:in )?({_number}) (days?|weeks?)(?: from (?:now|today))?$")
+DAY_OF_MONTH = re.compile(rf"^({_day})$")
+MONTH_DAY = re.compile(rf"^(?:({_month}) ({_day})|({_day}) ({_month}))(?: (\d{{4}}))?$")
+
+def _normalize(text: str) -> str:
+    """ Lowercase words without punctuation or filler, ISO dates kept whole """
+    text = text.lower().strip(" '\"")
+    if ISO_DATE.match(text):
+        return text
+    words = re.sub(r"[^\w\s-]", " ", text).replace("-", " ").split()
+    return " ".join(word for word in words if word not in FILLER)
+
+def _number_value(word: str) -> int:
+    return int(word) if word.isdigit() else NUMBERS[word]
+
+def _day_value(text: str) -> int:
+    """ The day of month of '21', '21st', 'twenty first' or 'first' """
+    digits = re.match(r"\d+", text)
+    if digits:
+        return int(digits.group())
+    words = text.replace("-", " ").split()
+    return sum(NUMBERS.get(word) or ORDINALS[word] for word in words)
+
+def _next_day_of_month(day: int, today: date) -> Optional[date]:
+    """ The next date, today included, falling on a day of the month """
+    if not 1 <= day <= 31:
+        return None
+    year, month = today.year, today.month
+    if day < today.day:
+        month += 1
+    for _ in range(12):                 # Skips the months that are too short
+        if month > 12:
+            year, month = year + 1, 1
+        if day <= calendar.monthrange(year, month)[1]:
+            return date(year, month, day)
+        month += 1
+    return None
+
+def _next_month_day(month: int, day: int, year: Optional[int], today: date) -> Optional[date]:
+    """ The date, or its next occurrence from today when the year is not given """
+    try:
+        if year is not None:
+            return date(year, month, day)
+        resolved = date(today.year, month, day)
+        return resolved if resolved >= today else date(today.year + 1, month, day)
+    except ValueError:
+        return None
+
+def resolve_date(user_input: str, today: Optional[date]=None) -> Optional[date]:
+    """
+    Resolve a natural language date without the LLM.
+
+    Args:
+        user_input (str): What the user said, e.g. 'next tuesday' or 'the first'.
+        today (date, optional): The date it is relative to. Defaults to today.
+
+    Returns:
+        date | None: The date, None when the input is not covered by the rules.
+    """
+    today = today or date.today()
+    text = _normalize(user_input)
+
+    if text in ("today", "tonight", "now"):
+        return today
+    if text in ("tomorrow", "tmrw", "tomorrow night"):
+        return today + timedelta(days=1)
+    if text in ("after tomorrow", "day after tomorrow", "overmorrow"):
+        return today + timedelta(days=2)
+    if text == "yesterday":
+        return today - timedelta(days=1)
+
+    match = ISO_DATE.match(text)
+    if match:
+        try:
+            return date(*map(int, match.groups()))
+        except ValueError:
+            return None
+
+    match = WEEKDAY.match(text)
+    if match:
+        modifier, weekday, week = match.groups()
+        delta = (WEEKDAYS[weekday] - today.weekday()) % 7
+        if modifier in ("next", "following") or week == "next":
+            delta += 14 if modifier == "following" else 7
+        elif delta == 0 and modifier != "this" and week != "this":
+            delta = 7                   # A bare weekday is in the future
+        return today + timedelta(days=delta)
+
+    match = OFFSET.match(text)
+    if match:
+        number, unit = match.groups()
+        days = _number_value(number) * (7 if unit.startswith("week") else 1)
+        try:
+            return today + timedelta(days=days)
+        except (OverflowError, ValueError):     # Past date.max, e.g. "in 99999999 weeks"
+            return None
+
+    match = DAY_OF_MONTH.match(text)
+    if match:
+        return _next_day_of_month(_day_value(match.group(1)), today)
+
+    match = MONTH_DAY.match(text)
+    if match:
+        month_first, day_after, day_first, month_after, year = match.groups()
+        month = MONTHS[month_first or month_after]
+        day = _day_value(day_after or day_first)
+        return _next_month_day(month, day, int(year) if year else None, today)
+
+    return None
+
+CORPUS_TODAY = date(2024, 5, 15)           # A Wednesday
+
+DATE_CORPUS: List[Tuple[str, Optional[str]]] = [
+    # Phrases users give comprehend_date and what they mean on CORPUS_TODAY, None is left to the LLM
+    ("today", "2024-05-15"),
+    ("tomorrow", "2024-05-16"),
+    ("Tomorrow.", "2024-05-16"),
+    ("the day after tomorrow", "2024-05-17"),
+    ("yesterday", "2024-05-14"),
+    ("friday", "2024-05-17"),
+    ("Friday", "2024-05-17"),
+    ("on friday", "2024-05-17"),
+    ("fri", "2024-05-17"),
+    ("this friday", "2024-05-17"),
+    ("coming friday", "2024-05-17"),
+    ("next friday", "2024-05-24"),
+    ("following friday", "2024-05-31"),
+    ("friday next week", "2024-05-24"),
+    ("monday", "2024-05-20"),
+    ("this monday", "2024-05-20"),
+    ("next monday", "2024-05-27"),
+    ("tuesday", "2024-05-21"),
+    ("next tuesday", "2024-05-28"),
+    ("tues", "2024-05-21"),
+    ("wednesday", "2024-05-22"),
+    ("this wednesday", "2024-05-15"),
+    ("next wednesday", "2024-05-22"),
+    ("thursday", "2024-05-16"),
+    ("thurs", "2024-05-16"),
+    ("saturday", "2024-05-18"),
+    ("next saturday", "2024-05-25"),
+    ("sunday", "2024-05-19"),
+    ("the following sunday", "2024-06-02"),
+    ("in 3 days", "2024-05-18"),
+    ("in three days", "2024-05-18"),
+    ("in a day", "2024-05-16"),
+    ("in 10 days", "2024-05-25"),
+    ("in two weeks", "2024-05-29"),
+    ("in a week", "2024-05-22"),
+    ("5 days from now", "2024-05-20"),
+    ("the first", "2024-06-01"),
+    ("the 1st", "2024-06-01"),
+    ("1st", "2024-06-01"),
+    ("the 15th", "2024-05-15"),
+    ("the 20th", "2024-05-20"),
+    ("the twentieth", "2024-05-20"),
+    ("the 21st", "2024-05-21"),
+    ("the twenty-first", "2024-05-21"),
+    ("the twenty first", "2024-05-21"),
+    ("the 31st", "2024-05-31"),
+    ("the third", "2024-06-03"),
+    ("on the 2nd", "2024-06-02"),
+    ("may 20", "2024-05-20"),
+    ("May 20th", "2024-05-20"),
+    ("20th of may", "2024-05-20"),
+    ("june 1st", "2024-06-01"),
+    ("the 4th of july", "2024-07-04"),
+    ("jan 3", "2025-01-03"),
+    ("march 3rd 2025", "2025-03-03"),
+    ("dec 25", "2024-12-25"),
+    ("christmas", None),
+    ("2024-06-10", "2024-06-10"),
+    ("next week", None),
+    ("next month", None),
+    ("end of the month", None),
+    ("in a fortnight", None),
+    ("the weekend", None),
+    ("my birthday", None),
+    ("in 99999999 weeks", None),
+]
+
+def coverage(corpus: Optional[List[Tuple[str, Optional[str]]]]=None, today: date=CORPUS_TODAY) -> Dict:
+    """
+    Measure the resolver against a corpus of (phrase, expected YYYY-MM-DD or None).
+
+    Returns:
+        Dict: `total`, `resolved` (answered without the LLM), `correct` (right or rightly left to
+        the LLM), `coverage` and `accuracy` as fractions, the `wrong` and `unresolved` phrases and
+        the mean resolution time in microseconds.
+    """
+    corpus = DATE_CORPUS if corpus is None else corpus
+    wrong, unresolved = [], []
+    resolved = correct = 0
+    start = time.perf_counter()
+    for phrase, expected in corpus:
+        result = resolve_date(phrase, today)
+        got = result.isoformat() if result else None
+        resolved += got is not None
+        correct += got == expected
+        if got is None and expected is not None:
+            unresolved.append(phrase)
+        elif got != expected:
+            wrong.append((phrase, got, expected))
+    elapsed = time.perf_counter() - start
+    total = len(corpus)
+    answerable = sum(1 for _, expected in corpus if expected is not None)
+    return {
+        "total": total,
+        "resolved": resolved,
+        "correct": correct,
+        "coverage": resolved / answerable if answerable else 0.0,
+        "accuracy": correct / total if total else 0.0,
+        "wrong": wrong,
+        "unresolved": unresolved,
+        "mean_us": elapsed / total * 1e6 if total else 0.0,
+    }
+
+if __name__ == '__main__':
+    report = coverage()
+    print(f"Resolved {report['resolved']}/{report['total']} phrases, coverage {report['coverage']:.0%}, "
+          f"accuracy {report['accuracy']:.0%}, {report['mean_us']:.1f}us per phrase")
+    for phrase, got, expected in report["wrong"]:
+        print(f"  wrong: {phrase!r} -> {got}, expected {expected}")
+    for phrase in report["unresolved"]:
+        print(f"  left to the LLM: {phrase!r}")
+    sys.exit(1 if report["wrong"] else 0)
@@ -1,14 +1,16 @@
 import re
+from collections import Counter
 from datetime import datetime, timedelta
 
 from langchain_core.prompts import PromptTemplate
 
 from ami.flask.manager import get_network_url
-from ami.headspace import Headspace, ami_tool
+from ami.headspace import Headspace, ami_tool, user_response
 #from ami.headspace import Headspace, ami_tool, agent_observation
 from ami.headspace.core.calendar.google_sync import GoogleAuth
 from ami.headspace.headspace import generate_qr_image
 
+from .dates import resolve_date
 from .json_calendar import JsonCalendar, Event
 
 INFER_DATE_PROMPT = """Your goal is to infer what the user meant when they said '{user_input}'. You should only respond with only YYYY-MM-DD and nothing else.
@@ -19,6 +21,8 @@ You should only respond with a 'YYYY-MM-DD format' and nothing else. Reminder th
 What do you think the user meant by '{user_input}' from the perspective of {date_string}?
 """
 
+INFER_DATE_TEMPLATE = PromptTemplate.from_template(INFER_DATE_PROMPT)
+
 class Calendar(Headspace):
     """ Built-in calendar agent """
 
@@ -29,6 +33,7 @@ class Calendar(Headspace):
         calendar_filepath = self.filesystem / self.yaml.get("calendar_filename", "calendar.json")
         self.cal = JsonCalendar(calendar_filepath)
         self.auth = GoogleAuth(self.filesystem.path)
+        self.date_paths: Counter = Counter()     # How comprehend_date answered: rules or llm
 
     def verbose_date(self, date_str):
         date_obj = datetime.strptime(date_str, "%Y-%m-%d")
@@ -37,12 +42,12 @@ class Calendar(Headspace):
     def remove_quotes(self, string):
         return string.strip("' \"")
 
-    @ami_tool
+    @ami_tool(read_only=True)
     def get_calendar(self):
         """ Return the contents of the calendar """
         return str(self.cal._json)
 
-    @ami_tool
+    @ami_tool(read_only=True)
     def get_date_events(self, date: str):
         """ Given a date (YYYY-MM-DD), return an list of events. Use if you don't know the name of an event. """
         try:
@@ -67,11 +72,13 @@ class Calendar(Headspace):
 
         try:
             self.cal.save(events=[event])
-        except ValueError as e:
-            return f"Add Event({event.to_json()}) Completed Successfully!!"
+        except ValueError as e:         # The event is already on the calendar
+            return user_response(f"Add Event({event.to_json()}) Completed Successfully!!",
+                                 f"{event.name} is already on the calendar on {date}.")
 #           return agent_observation(f"Add Event({event.to_json()}) Completed Successfully!!")
 
-        return f"Add Event({event.to_json()}) Completed Successfully!!"
+        return user_response(f"Add Event({event.to_json()}) Completed Successfully!!",
+                             f"I added {event.name} to the calendar on {date}.")
 #       return agent_observation(f"Add Event({event.to_json()}) Completed Successfully!!")
 
     @ami_tool
@@ -123,12 +130,20 @@ class Calendar(Headspace):
 
         return result
 
-    @ami_tool
+    @ami_tool(read_only=True)
     def comprehend_date(self, user_input: str):
         """
         Always use this tool to translate natural language into a usable date string since you don't know what day it is.
         user_input is the relitive context for the target date (e.g. 'the first' or 'friday' or 'next tuesday').
         """
+        resolved = resolve_date(self.remove_quotes(user_input))
+        if resolved is not None:
+            self.date_paths["rules"] += 1
+            return f"The user means: {resolved.isoformat()}"
+
+        self.logs.debug(f"No date rule for '{user_input}', asking the LLM")
+        self.date_paths["llm"] += 1
+
         def date_lookahead(weeks, start_date):
             dates = []
 
@@ -154,8 +169,9 @@ class Calendar(Headspace):
         dates = [(f"Today, {today_date.strftime('%A')}", today_date.strftime("%Y-%m-%d"))] + date_lookahead(week_lookahead+1, today_date+timedelta(days=1))
         date_string = f"{today_date.strftime('%A')} {today_date.day} {today_date.strftime('%B')}"
 
-        infer_date_prompt = PromptTemplate.from_template(INFER_DATE_PROMPT)
-        result = self.spawn_llm().invoke(infer_date_prompt.format(user_input=user_input, dates=dates, date_string=date_string), stop=[".", "\n"])
+        result = self.spawn_llm(role="comprehend_date").invoke(INFER_DATE_TEMPLATE.format(user_input=user_input, dates=dates, date_string=date_string),
+                                                               stop=[".", "\n"],
+                                                               config={"run_name": "comprehend_date"})
 
         match = re.search(r'\b\d{4}-\d{2}-\d{2}\b', result)
         if match:
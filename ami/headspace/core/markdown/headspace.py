@@ -1,6 +1,6 @@
 from urllib.parse import quote_plus
 
-from ami.headspace import Headspace, ami_tool, agent_observation
+from ami.headspace import Headspace, ami_tool, agent_observation, user_response
 from ami.flask.manager import get_network_url
 from ami.headspace.headspace import generate_qr_image
 
@@ -15,12 +15,12 @@ class Markdown(Headspace):
         super().__init__(*args, **kwargs)
         self.markdown = MarkdownTool()
 
-    @ami_tool
+    @ami_tool(read_only=True)
     def list_md_files(self):
         """ Use this tool to list out the known markdown files """
         return agent_observation(str(self.markdown.md_files))
 
-    @ami_tool
+    @ami_tool(read_only=True)
     def list_lists(self):
         """ Use this tool to list out the known lists in the markdown files """
         return agent_observation(str(self.markdown.lists))
@@ -35,7 +35,8 @@ class Markdown(Headspace):
         else:
             return agent_observation(f"List '{list_name}' not found! Try the `list_lists` tool, then retry the add_to_list tool.")
 
-        return agent_observation(f"'{item}' successfully added to the '{list_name}' list!")
+        return user_response(f"'{item}' successfully added to the '{list_name}' list!",
+                             f"I added {item} to the {list_name} list.")
 
     @ami_tool
     def remove_from_list(self, list_name: str, item: str):
@@ -47,7 +48,8 @@ class Markdown(Headspace):
         else:
             return agent_observation(f"List '{list_name}' not found! Try the `list_lists` tool, then retry the remove_from_list tool.")
 
-        return agent_observation(f"'{item}' successfully removed from the '{list_name}' list!")
+        return user_response(f"'{item}' successfully removed from the '{list_name}' list!",
+                             f"I removed {item} from the {list_name} list.")
 
     @ami_tool
     def spawn_list(self, list_name: str, filename: str):
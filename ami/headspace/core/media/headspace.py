@@ -11,7 +11,7 @@ class Media(Headspace):
         super().__init__(*args, **kwargs)
         self.media = MediaTool()
 
-    @ami_tool
+    @ami_tool(read_only=True)
     def list_videos_from_youtube_creator(self, creator: str):
         """ Use this tool to list out the known markdown files """
         return agent_observation(str(self.media.get_youtube_videos(creator)))
@@ -18,7 +18,7 @@ class Utils(Headspace):
         self.get_headspace_dir = config.get_headspace_dir
         self.tool = UtilsTool()
 
-    @ami_tool
+    @ami_tool(read_only=True)
     def see_headspaces(self):
         """ Return a list of avialible headspaces """
         return agent_observation(f"Enabled Headspace: {self.headspaces}")
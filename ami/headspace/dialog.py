@@ -9,7 +9,7 @@ visual elements, and other related attributes.
 """
 
 from pathlib import Path
-from typing import Optional, List
+from typing import Any, Callable, ClassVar, Generator, Optional, List
 
 from pydantic import BaseModel, Field
 
@@ -24,26 +24,60 @@ class Dialog(BaseModel):
         visual (Optional[Path]): Optional path to the visual to display.
         timeout (int): Timeout value for the dialog, default is 10.
         finished (bool): Indicates if the dialog is finished, default is True.
+        memory (ConversationMemory | None): Token-bounded memory of the conversation, summarized in the background.
 
     The Dialog class manages conversation history, thoughts, visual elements, and other related attributes.
-    It provides methods for accessing the conversation history and adding new entries to it.
+    It provides methods for accessing the conversation history and adding new entries to it. Only the
+    last MAX_CONVO entries are kept in `convo`, the conversation lives on in the memory.
     """
+    MAX_CONVO: ClassVar[int] = 20
+
     headspace: str
     convo: List[tuple] = Field(default_factory=list, description="List of tuples describing the conversation history")
     thoughts: Optional[str] = Field(None, description="These are the background thoughts of the AI or the Agent")
     visual: Optional[Path] = Field(None, description="Optional path to the visual to display")
     timeout: int = 10
     finished: bool = True
+    memory: Optional[Any] = Field(None, exclude=True, description="ConversationMemory of the Headspace")
 
     class Config:
         arbitrary_types_allowed=True
 
     @property
     def history(self):
-        """ Histroy property for the convo member """
+        """ Histroy property for the convo member, the bounded memory when there is one """
+        if self.memory is not None:
+            return self.memory.history
         history = [ f"{entity}: {message}" for (entity, message) in self.convo ]
         return "\n".join(history)
 
+    def remember(self, entity: str, message: Any) -> Any:
+        """ Add the message to the memory, once a streamed or deferred response has been produced """
+        if self.memory is None:
+            return message
+        if isinstance(message, str):
+            self.memory.add(entity, message)
+            return message
+        if isinstance(message, Generator):
+            def record(stream):
+                chunks = []
+                try:
+                    for chunk in stream:
+                        chunks.append(chunk)
+                        yield chunk
+                finally:
+                    if chunks:                              # Also the partial response of a cancelled stream
+                        self.memory.add(entity, "".join(chunks))
+            return record(message)
+        if isinstance(message, Callable):
+            def produce():
+                text = message()
+                self.memory.add(entity, text)
+                return text
+            return produce
+        return message
+
     def push(self, conversation_history: List[tuple]):
         """ Append to the conversation """
-        self.convo.extend(conversation_history)
+        self.convo.extend([ (entity, self.remember(entity, message)) for entity, message in conversation_history ])
+        del self.convo[:-self.MAX_CONVO]
@@ -1,9 +1,10 @@
 """ AMI Headspace Core Funcionality """
 
+from collections import Counter
 from functools import wraps
 from pathlib import Path
 from types import ModuleType
-from typing import Any, List
+from typing import Any, Callable, List, Optional
 
 from pprint import pprint as pp
 
@@ -14,29 +15,68 @@ import qrcode
 
 from ami.config import Config
 from ami.headspace.base import Primitive
+from ami.tokens import cap_tokens
 
 from .dialog import Dialog
+from .memory import ConversationMemory
 
 def agent_observation(observation:str):
     """ This function converts a result to an observation for the agent """
 #   return f"Observation: {observation}"
     return f"{observation}\n"
 
-def ami_tool(func):
+class ToolResponse(str):
+    """
+    A tool observation that carries a ready-made response for the human.
+
+    The agent sees the observation as usual. When the tool was the only step of the query,
+    `response` is shown to the human as is and the summarizer LLM call is skipped.
+    """
+    response: str
+
+    def __new__(cls, observation: str, response: str):
+        obj = super().__new__(cls, observation)
+        obj.response = response
+        return obj
+
+def user_response(observation: str, response: str) -> ToolResponse:
+    """ Return an observation for the agent along with the templated response for the human """
+    return ToolResponse(agent_observation(observation), response)
+
+def cap_observation(func: Callable, budget: Optional[int]) -> Callable:
+    """ Wrap a tool so its observation is cut to the `observation_tokens` budget, keeping its attributes """
+    @wraps(func)
+    def capped(*args, **kwargs):
+        observation = func(*args, **kwargs)
+        if not isinstance(observation, str):
+            return observation
+        cut = cap_tokens(observation, budget, "observation")
+        if cut is observation:
+            return observation
+        if isinstance(observation, ToolResponse):
+            return ToolResponse(cut, observation.response)
+        return cut
+    return capped
+
+def ami_tool(func: Optional[Callable]=None, *, read_only: bool=False):
     """ Decorator for creating tools within AI-controlled classes.
 
     This decorator marks a function as a tool that can be used by the AI agent.
     It adds an 'is_tool' attribute to the function for easy identification.
+    Use `@ami_tool(read_only=True)` for tools that only read Headspace data, answers that
+    only used read-only tools can be served from the Brain's response cache.
 
     Returns:
-        Callable: The decorated function with an added 'is_tool' attribute.
+        Callable: The decorated function with added 'is_tool' and 'read_only' attributes.
     """
-    @wraps(func)
-    def wrapper():
+    def mark(func):
         setattr(func, 'is_tool', True)
+        setattr(func, 'read_only', read_only)
         return func
 
-    return wrapper()
+    if func is None:
+        return mark
+    return mark(func)
 
 
 def generate_qr_image(url) -> Path:
@@ -57,6 +97,14 @@ STRUCTURED_AGENT_USER = """{input}
 {agent_scratchpad}
 """
 
+AGENT_INPUT_WITH_MEMORY = """Conversation so far:
+{memory}
+
+Human:
+{prompt}"""
+
+AGENT_INPUT_WITH_MEMORY_TEMPLATE = PromptTemplate.from_template(AGENT_INPUT_WITH_MEMORY)
+
 SUMMERIZE_AGENT = """ You are a companion AI.
 Your assignment is to summerize your internal monolog and respond back to the human as an AI companion would.
 Your inner monolog is things that you have already done. You AI Companion response should be in the past tense.
@@ -69,6 +117,10 @@ Your response should be a single sentence, goal orientated without pleasantries.
 ### AI companion Response:
 """
 
+SUMMERIZE_AGENT_TEMPLATE = PromptTemplate.from_template(SUMMERIZE_AGENT)
+
+AGENT_STOPPED = "Agent stopped due to iteration limit or time limit."
+
 class Headspace(Primitive):
     """ 
     Headspace is an abstract base class that is the framework for an AI-powered AMI agent built
@@ -97,9 +149,11 @@ class Headspace(Primitive):
 
     Member optionally set by subclass:
         HANDLE_PARSING_ERRORS: Boolean flag how the agent should be handling parsing errors
+        ALWAYS_SUMMARIZE: Boolean flag to summarize every response with the LLM, see `reply`
     """
 
     HANDLE_PARSING_ERRORS: bool = False
+    ALWAYS_SUMMARIZE: bool = False
 
     def __new__(cls, *args, **kwargs):
         """ This class is only inheritable, cannot be instantiated alone """
@@ -113,23 +167,34 @@ class Headspace(Primitive):
         Initialize the Headspace instance.
 
         Args:
-            spawner (callable): A function that spawns a language model instance.
+            spawner (callable): A function that spawns a language model instance, takes the `role` of the model.
 
         Attributes:
             spawn_llm (callable): The function used to spawn a language model instance.
             dialog (Dialog): An instance of the Dialog class for managing the conversation history.
+            memory (ConversationMemory | None): The token-bounded conversation memory of the Headspace,
+                                                None when `memory_tokens` is 0.
             agent_response (dict): The response from the agent, including intermediate steps.
             prompts (ModuleType): The module containing the prompts for the agent.
             agent (AgentType): The structured chat agent instance.
             agent_executor (AgentExecutor): The executor for the agent.
+            reply_paths (Counter): How often `reply` used a tool response, the final answer or the summarizer.
         """
         Primitive.__init__(self)
 
         self.spawn_llm = spawner
         self.prompts: ModuleType = prompts
-
-        self.dialog = Dialog(headspace=self.__class__.__name__)
+        config = Config()
+        self.budget = config.llm_budget
+
+        self.memory = None
+        if config.memory_tokens:
+            self.memory = ConversationMemory(config.memory_dir / f"{self.__class__.__name__.lower()}.json",
+                                             summarize=self.summarize_memory,
+                                             max_tokens=config.memory_tokens)
+        self.dialog = Dialog(headspace=self.__class__.__name__, memory=self.memory)
         self.agent_response = None
+        self.reply_paths: Counter = Counter()
 
         agent_prompt_template = ChatPromptTemplate.from_messages(
             [
@@ -138,7 +203,7 @@ class Headspace(Primitive):
             ]
         )
         tools = self.get_tools()
-        self.agent: Any = create_structured_chat_agent(self.spawn_llm(), tools, agent_prompt_template)
+        self.agent: Any = create_structured_chat_agent(self.spawn_llm(role="agent"), tools, agent_prompt_template)
         self.agent_executor = AgentExecutor(
                 agent=self.agent,
                 tools=tools,
@@ -168,14 +233,15 @@ class Headspace(Primitive):
         Returns:
             PromptTemplate: A prompt template for summarizing the agent's internal monologue.
         """
-        summary_prompt = PromptTemplate.from_template(SUMMERIZE_AGENT)
         if self.dialog.visual:
             visual = "Please note you have a visual you are responding with to the human. Whatever step you think you did in the past tense, the human needs to do in the present tense."
         else:
             visual = ""
-        return summary_prompt.format(
+        steps = cap_tokens(str(self.agent_response["intermediate_steps"]),
+                           self.budget.get("summarizer_prompt_tokens"), "summarizer", keep="tail")
+        return SUMMERIZE_AGENT_TEMPLATE.format(
             additional_visual=visual,
-            intermediate_steps=self.agent_response["intermediate_steps"]
+            intermediate_steps=steps
         )
 
     def get_tools(self) -> List[StructuredTool]:
@@ -187,7 +253,8 @@ class Headspace(Primitive):
         hai_tools = [ member_method
                       for member_method in class_methods
                       if hasattr(member_method, "is_tool") ]
-        tools = [ StructuredTool.from_function(func) for func in hai_tools ]
+        budget = self.budget.get("observation_tokens")
+        tools = [ StructuredTool.from_function(cap_observation(func, budget)) for func in hai_tools ]
         return tools
 
     def stream(self):
@@ -198,7 +265,7 @@ class Headspace(Primitive):
             generator: A summarized AI companion response.
         """
         prompt = self.get_summerize_agent_prompt()
-        return self.spawn_llm().stream(prompt, stop=[".", "\n"])
+        return self.spawn_llm(role="summarizer").stream(prompt, stop=[".", "\n"])
 
     def think(self):
         """
@@ -208,36 +275,147 @@ class Headspace(Primitive):
             str: A summarized AI companion response.
         """
         prompt = self.get_summerize_agent_prompt()
-        return self.spawn_llm().invoke(prompt, stop=[".", "\n"])
+        return self.spawn_llm(role="summarizer").invoke(prompt, stop=[".", "\n"])
+
+    def summarize_memory(self, prompt: str) -> str:
+        """ Answer a MEMORY_SUMMARY prompt of the conversation memory, in its background worker """
+        return self.spawn_llm(role="summarizer").invoke(prompt, config={"run_name": "memory"})
+
+    @property
+    def tools_used(self) -> List[str]:
+        """ The names of the tools the agent called for the last query """
+        if not self.agent_response:
+            return []
+        return [ action.tool for action, _ in self.agent_response.get("intermediate_steps", []) ]
 
-    def query(self, prompt: str, stream=False) -> Dialog:
+    @property
+    def read_only_tools(self) -> List[str]:
+        """ The names of the tools marked `@ami_tool(read_only=True)` """
+        return [ tool.name for tool in self.agent_executor.tools if getattr(getattr(tool, "func", None), "read_only", False) ]
+
+    @property
+    def read_only_response(self) -> bool:
+        """ True when the last query called tools, and only read-only ones """
+        read_only = set(self.read_only_tools)
+        used = self.tools_used
+        return len(used) > 0 and all(name in read_only for name in used)
+
+    def respond(self, prompt: str, response: str, visual: Optional[Path]=None) -> Dialog:
         """
-        Process a user query through the agent and generate a response.
+        Answer a query without the agent, e.g. from the response cache.
 
         Args:
             prompt (str): The user's input query.
-            stream (bool, optional): Whether to stream the response. Defaults to False.
+            response (str): The AI response.
+            visual (Path, optional): The visual to show with the response.
 
         Returns:
             Dialog: The updated dialog object containing the query and response.
         """
-        self.logs.info(f"Headspace.query(prompt='{prompt}')")
+        self.logs.info(f"Headspace.respond(prompt='{prompt}')")
+        self.agent_response = None
+        self.dialog.visual = visual
+        self.dialog.timeout = 15 if self.dialog.visual else 3
+        self.dialog.push([ ("Human", prompt), ("AI", response) ])
+        return self.dialog
+
+    def run_agent(self, prompt: str, callbacks: Optional[List[Any]]=None) -> dict:
+        """
+        Run the agent and its tools on a query, without answering it yet.
+
+        Args:
+            prompt (str): The user's input query.
+            callbacks (List, optional): LangChain callbacks for the run, e.g. a SpeculationGate.
+
+        Returns:
+            dict: The agent response, also kept in `agent_response` for `reply`.
+        """
         self.dialog.visual = None
 
-        self.agent_response = self.agent_executor.invoke({"input": prompt})
+        history = self.dialog.history if self.memory is not None else ""
+        agent_input = AGENT_INPUT_WITH_MEMORY_TEMPLATE.format(memory=history, prompt=prompt) if history else prompt
+        self.agent_response = self.agent_executor.invoke({"input": agent_input}, config={"callbacks": callbacks or []})
 
 #       pp(self.agent_response)
 
-        if self.agent_response['output'] == "Agent stopped due to iteration limit or time limit.":
+        if self.agent_response['output'] == AGENT_STOPPED:
             self.logs.warn("Agent stopped due to impossed limitation. Check logs and/or LangSmith")
 
+        return self.agent_response
+
+    def fast_response(self) -> Optional[str]:
+        """
+        The response for the human when the agent's monologue doesn't need summarizing.
+
+        A single step answers with the ToolResponse of its tool, or else with the agent's final
+        answer, as does a query the agent answered without tools. Multi-step monologues are
+        left to the summarizer.
+
+        Returns:
+            str | None: The response, or None when the summarizer has to run.
+        """
+        if self.ALWAYS_SUMMARIZE or not self.agent_response:
+            return None
+
+        steps = self.agent_response.get("intermediate_steps", [])
+        if len(steps) > 1:
+            return None
+
+        if steps and isinstance(steps[-1][1], ToolResponse):
+            self.reply_paths["tool_response"] += 1
+            return steps[-1][1].response
+
+        output = self.agent_response.get("output")
+        if isinstance(output, str) and output.strip() and output != AGENT_STOPPED:
+            self.reply_paths["final_answer"] += 1
+            return output.strip()
+        return None
+
+    def reply(self, prompt: str, stream=False, agent_response: Optional[dict]=None) -> Dialog:
+        """
+        Answer a query the agent already ran on, summarizing the monologue only when needed.
+
+        Args:
+            prompt (str): The user's input query.
+            stream (bool, optional): Whether to stream the response. Defaults to False.
+            agent_response (dict, optional): The agent run to answer from, e.g. a speculative run another
+                                             query may have overwritten `agent_response` since. Defaults to
+                                             the last run.
+
+        Returns:
+            Dialog: The updated dialog object containing the query and response.
+        """
+        if agent_response is not None:
+            self.agent_response = agent_response
         self.dialog.timeout = 15 if self.dialog.visual else 3
 
-        if stream:
-            ai_response = ("AI", self.stream())
+        response = self.fast_response()
+        if response is not None:
+            ai_response = ("AI", response)
         else:
-            ai_response = ("AI", self.think)
+            self.reply_paths["summarizer"] += 1
+            if stream:
+                ai_response = ("AI", self.stream())
+            else:
+                ai_response = ("AI", self.think)
+        self.logs.debug(f"{self.name} reply paths: {dict(self.reply_paths)}")
 
         self.dialog.push([ ("Human", prompt), ai_response ])
 
         return self.dialog
+
+    def query(self, prompt: str, stream=False, callbacks: Optional[List[Any]]=None) -> Dialog:
+        """
+        Process a user query through the agent and generate a response.
+
+        Args:
+            prompt (str): The user's input query.
+            stream (bool, optional): Whether to stream the response. Defaults to False.
+            callbacks (List, optional): LangChain callbacks for the agent run, e.g. AgentThoughts.
+
+        Returns:
+            Dialog: The updated dialog object containing the query and response.
+        """
+        self.logs.info(f"Headspace.query(prompt='{prompt}')")
+        self.run_agent(prompt, callbacks=callbacks)
+        return self.reply(prompt, stream=stream)
@@ -0,0 +1,193 @@
+""" Token-bounded conversation memory of a Headspace, with a rolling summary of older turns """
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Deque, List, Optional, Tuple
+
+from ami.base import Base
+from ami.tokens import cap_tokens, count_tokens
+
+MEMORY_SUMMARY = """Summarize the conversation between the Human and the AI companion for the AI's memory.
+Keep names, dates, list items and decisions, drop pleasantries. Respond with at most {max_words} words.
+
+### Summary so far
+{summary}
+
+### Conversation since
+{turns}
+
+### Updated summary:
+"""
+
+_summarizer_pool: Optional[ThreadPoolExecutor] = None
+
+def summarizer_pool() -> ThreadPoolExecutor:
+    """ The single background worker shared by every memory, summaries and saves never run on the request path """
+    global _summarizer_pool
+    if _summarizer_pool is None:
+        _summarizer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory")
+    return _summarizer_pool
+
+def close_summarizer_pool():
+    """ Wait for the pending summaries and saves, a later memory change starts a new worker """
+    global _summarizer_pool
+    if _summarizer_pool is not None:
+        _summarizer_pool.shutdown(wait=True)
+        _summarizer_pool = None
+
+class ConversationMemory(Base):
+    """
+    The recent turns of a conversation within a token budget, and a summary of everything older.
+
+    `add` keeps the newest turns in a window of `window_tokens`. Turns pushed out of the window
+    wait in `pending` until the background worker folds them into `summary` with the summarizer
+    LLM, so the history given to the LLMs stays around `max_tokens` however long the session
+    runs (pending turns are cut meanwhile). If the summarizer fails the pending turns are cut into
+    the summary instead. The memory is saved to `filepath` after every change, so it survives a
+    restart.
+    """
+
+    def __init__(self,
+                 filepath: Path,
+                 summarize: Optional[Callable[[str], str]]=None,
+                 max_tokens: int=600):
+        """
+        Initialize the memory, loading the persisted one if there is one.
+
+        Args:
+            filepath (Path): The JSON file the memory is persisted to.
+            summarize (Callable[[str], str], optional): Answers a MEMORY_SUMMARY prompt, e.g. the summarizer LLM.
+                Without it older turns are only truncated.
+            max_tokens (int, optional): Token budget of the history, two thirds for the recent turns and
+                one third for the summary. Defaults to 600.
+        """
+        super().__init__()
+        self.filepath = filepath
+        self.summarize = summarize
+        self.max_tokens = max_tokens
+        self.window_tokens = max_tokens * 2 // 3
+        self.summary_tokens = max_tokens - self.window_tokens
+
+        self.summary = ""
+        self.turns: Deque[Tuple[str, str, int]] = deque()       # (speaker, text, tokens)
+        self.pending: List[Tuple[str, str, int]] = []
+        self._window = 0
+        self._history: Optional[str] = None
+        self._summarizing = False
+        self._lock = Lock()
+
+        self.load()
+
+    @property
+    def history(self) -> str:
+        """ The summary and the recent turns as prompt text. Cached until the memory changes. """
+        with self._lock:
+            if self._history is None:
+                lines = [ f"Earlier: {self.summary}" ] if self.summary else []
+                if self.pending:        # Not summarized yet, cut so the history stays bounded meanwhile
+                    pending = "\n".join(f"{speaker}: {text}" for speaker, text, _ in self.pending)
+                    lines.append(cap_tokens(pending, self.summary_tokens, "memory", keep="tail"))
+                lines += [ f"{speaker}: {text}" for speaker, text, _ in self.turns ]
+                self._history = "\n".join(lines)
+            return self._history
+
+    def __len__(self) -> int:
+        return len(self.turns) + len(self.pending)
+
+    def _append(self, speaker: str, text: str) -> bool:
+        """ Add a turn to the window, True when a summary has to be scheduled """
+        tokens = count_tokens(text)
+        with self._lock:
+            self.turns.append((speaker, text, tokens))
+            self._window += tokens
+            while self._window > self.window_tokens and len(self.turns) > 1:
+                turn = self.turns.popleft()
+                self._window -= turn[2]
+                self.pending.append(turn)
+            self._history = None
+            schedule = bool(self.pending) and not self._summarizing
+            self._summarizing = self._summarizing or schedule
+        return schedule
+
+    def add(self, speaker: str, text: str):
+        """ Remember a turn, pushing the oldest turns out of the window to be summarized """
+        text = text.strip()
+        if not text:
+            return
+        schedule = self._append(speaker, text)
+        summarizer_pool().submit(self._summarize if schedule else self.save)
+
+    def _summarize(self):
+        """ Fold the pending turns into the summary, in the background worker, until none are left """
+        while True:
+            with self._lock:
+                folding, summary = list(self.pending), self.summary
+                if not folding:
+                    self._summarizing = False
+                    break
+            turns = "\n".join(f"{speaker}: {text}" for speaker, text, _ in folding)
+
+            updated = None
+            if self.summarize is not None:
+                prompt = MEMORY_SUMMARY.format(max_words=int(self.summary_tokens * 0.75), summary=summary or "Nothing yet.", turns=turns)
+                try:
+                    updated = self.summarize(prompt).strip()
+                except Exception as e:
+                    self.logs.error(f"Could not summarize the conversation memory: {e}")
+            if not updated:
+                updated = f"{summary}\n{turns}".strip()
+            updated = cap_tokens(updated, self.summary_tokens, "memory", keep="tail")
+
+            with self._lock:
+                self.summary = updated
+                del self.pending[:len(folding)]
+                self._history = None
+            self.save()
+
+    def clear(self):
+        """ Forget the conversation """
+        with self._lock:
+            self.summary = ""
+            self.turns.clear()
+            self.pending.clear()
+            self._window = 0
+            self._history = None
+        summarizer_pool().submit(self.save)
+
+    def save(self):
+        """ Persist the summary and the turns """
+        with self._lock:
+            data = {
+                "updated": datetime.now().isoformat(timespec="seconds"),
+                "summary": self.summary,
+                "turns": [ [speaker, text] for speaker, text, _ in (*self.pending, *self.turns) ],
+            }
+        try:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.filepath, 'w', encoding='utf-8') as file:
+                json.dump(data, file, indent=2)
+        except OSError as e:
+            self.logs.error(f"Could not save the conversation memory to {self.filepath}: {e}")
+
+    def load(self):
+        """ Start from the persisted memory if there is one """
+        if not self.filepath.is_file():
+            return
+        try:
+            with open(self.filepath, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            self.summary = data.get("summary", "")
+            turns = data.get("turns", [])
+        except (OSError, json.JSONDecodeError, AttributeError) as e:
+            self.logs.error(f"Ignoring the conversation memory in {self.filepath}: {e}")
+            return
+
+        schedule = False
+        for speaker, text in turns:
+            schedule = self._append(speaker, text) or schedule
+        if schedule:
+            summarizer_pool().submit(self._summarize)
+        self.logs.debug(f"Loaded {len(turns)} turns of conversation memory from {data.get('updated')}")
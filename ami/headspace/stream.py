@@ -0,0 +1,114 @@
+""" Responses produced on a worker thread and handed to the GUI through a queue """
+import time
+from queue import Empty, Queue
+from threading import Thread
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Union
+
+from langchain_core.agents import AgentAction
+from langchain_core.callbacks import BaseCallbackHandler
+
+from ami.base import Base
+
+_DONE = object()
+
+class ResponseStream(Base):
+    """
+    A response whose chunks are produced on a worker thread and pushed through a thread-safe queue.
+
+    The source is the streamed summarizer (any iterable of text chunks) or a deferred response
+    (a callable returning the text). Production starts as soon as the stream is created, so the
+    LLM is already generating while the Dialog makes its way to the GUI. The GUI `drain`s the
+    queue from a Tk `after` pump and never blocks on the LLM, other consumers can iterate it.
+
+    Attributes:
+        chunks (List[str]): The chunks consumed so far.
+        finished (bool): Set once the consumer drained the last chunk.
+        first_chunk (float | None): Seconds from the start to the first chunk produced.
+    """
+
+    def __init__(self, source: Union[Iterable[str], Callable[[], str]], name: str="response"):
+        """
+        Start producing the response.
+
+        Args:
+            source (Iterable[str] | Callable[[], str]): The chunks, or a function returning the whole text.
+            name (str, optional): Names the worker thread. Defaults to "response".
+        """
+        super().__init__()
+        self.chunks: List[str] = []
+        self.finished = False
+        self.first_chunk: Optional[float] = None
+        self._queue: Queue = Queue()
+        self._cancelled = False
+        self._started = time.perf_counter()
+        self._thread = Thread(target=self._produce, args=(source,), name=f"stream-{name}", daemon=True)
+        self._thread.start()
+
+    def _put(self, chunk: str):
+        if self.first_chunk is None:
+            self.first_chunk = time.perf_counter() - self._started
+        self._queue.put(chunk)
+
+    def _produce(self, source: Union[Iterable[str], Callable[[], str]]):
+        """ Push every chunk of the source onto the queue, then the end marker """
+        try:
+            if isinstance(source, Callable) and not isinstance(source, Iterable):
+                self._put(source())
+            else:
+                for chunk in source:
+                    if self._cancelled:
+                        break
+                    self._put(chunk)
+        except Exception as e:
+            self.logs.error(f"The response stream failed: {e}")
+        finally:
+            self._queue.put(_DONE)
+
+    def _take(self, chunk: Any) -> bool:
+        """ Consume a chunk off the queue, False at the end marker """
+        if chunk is _DONE:
+            self.finished = True
+            self.logs.debug(f"Streamed {len(self.chunks)} chunks, the first after {self.first_chunk or 0:.2f}s")
+            return False
+        self.chunks.append(chunk)
+        return True
+
+    def drain(self) -> List[str]:
+        """ The chunks produced since the last drain, without waiting """
+        chunks = []
+        while not self.finished:
+            try:
+                chunk = self._queue.get_nowait()
+            except Empty:
+                break
+            if self._take(chunk):
+                chunks.append(chunk)
+        return chunks
+
+    def __iter__(self) -> Iterator[str]:
+        """ Wait for every chunk in turn """
+        while not self.finished:
+            chunk = self._queue.get()
+            if self._take(chunk):
+                yield chunk
+
+    def cancel(self):
+        """ Stop producing after the current chunk, e.g. when the popup closed """
+        self._cancelled = True
+
+    @property
+    def text(self) -> str:
+        """ The response consumed so far """
+        return "".join(self.chunks)
+
+    def __str__(self) -> str:
+        return self.text
+
+class AgentThoughts(BaseCallbackHandler):
+    """ Agent callback passing what the agent is doing to the GUI while it runs, e.g. "Using get_calendar" """
+
+    def __init__(self, callback: Callable[[str], Any]):
+        self.callback = callback
+
+    def on_agent_action(self, action: AgentAction, **kwargs: Any):
+        self.callback(f"Using {action.tool.replace('_', ' ')} ...")
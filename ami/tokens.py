@@ -0,0 +1,60 @@
+""" Token counting and token budgets for the prompt inputs of the LLMs """
+from collections import Counter
+from typing import Any, Optional
+
+CHARS_PER_TOKEN = 4             # Estimate when tiktoken can't load its encoding (e.g. offline)
+
+TRUNCATIONS: Counter = Counter()
+""" How often each call site had an input cut down to its budget """
+
+_encoding: Any = None
+
+def get_encoding():
+    """ The tiktoken cl100k encoding, False when it can't be loaded """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    return _encoding
+
+def count_tokens(text: str) -> int:
+    """ Tokens in the text. cl100k only approximates the Llama and Mistral tokenizers, close enough for budgets """
+    encoding = get_encoding()
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def cap_tokens(text: str, budget: Optional[int], site: str, keep: str="head") -> str:
+    """
+    Cut the text down to a token budget.
+
+    Args:
+        text (str): The prompt input.
+        budget (int | None): The most tokens to keep, None or 0 for no limit.
+        site (str): The call site the input is for, counted in TRUNCATIONS.
+        keep (str, optional): "head" keeps the beginning, "tail" the end. Defaults to "head".
+
+    Returns:
+        str: The text, with a marker where it was cut.
+    """
+    if not budget or count_tokens(text) <= budget:
+        return text
+
+    TRUNCATIONS[site] += 1
+    encoding = get_encoding()
+    if encoding:
+        tokens = encoding.encode(text, disallowed_special=())
+        kept = tokens[:budget] if keep == "head" else tokens[-budget:]
+        cut = len(tokens) - budget
+        kept_text = encoding.decode(kept)
+    else:
+        chars = budget * CHARS_PER_TOKEN
+        kept_text = text[:chars] if keep == "head" else text[-chars:]
+        cut = (len(text) - chars) // CHARS_PER_TOKEN
+
+    if keep == "head":
+        return f"{kept_text}\n...[{cut} tokens truncated]"
+    return f"[{cut} tokens truncated]...\n{kept_text}"